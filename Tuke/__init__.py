@@ -18,6 +18,7 @@
 # ### BOILERPLATE ###
 
 from id import Id,rndId
-from element import Element,ReprableByArgsElement,SingleElement
+from element import Element,ReprableByArgsElement,SingleElement,WorldLayout
 from elementref import ElementRef
 from connects import Connects
+from netlist import Net,Netlist
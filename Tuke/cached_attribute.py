@@ -0,0 +1,202 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# ### BOILERPLATE ###
+# Tuke - Electrical Design Automation toolset
+# Copyright (C) 2008 Peter Todd <pete@petertodd.org>
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# ### BOILERPLATE ###
+
+"""Cached attributes.
+
+Attributes of Elements that are derived from other attributes, possibly of
+other Elements, and are expensive to compute. The value is computed on first
+access, and kept until any of the attributes it depends on change, as
+reported by Source.subscribe()
+
+Dependencies are given as strings, either the name of an attribute of the
+Element itself, or a path to an attribute of another Element, for instance
+'../transform' for the parent's transform, or 'copper/layer' for the layer of
+the copper sub-element. Every step along a path is a dependency as well, so
+if the Element is moved to a new parent, '../transform' is invalidated.
+
+A dependency may also be a callable, called with the Element when the value is
+computed, returning further dependencies. Use this when the dependencies
+themselves depend on attributes, such as the Elements an ElementRef refers
+to, see transform_depends()
+
+When a cached value is invalidated Source.touch() is called with the name of
+the cached attribute, so cached attributes can depend on each other.
+
+While notifications are being batched invalidation is deferred until the
+batch ends, so during a batch a cached value is only used if no notification
+at all has been deferred since it was stored.
+
+Cached values are shared between a Source and it's __shadowless__, so values
+derived from shadowed attributes, id and transform, must use the
+__shadowless__ versions.
+"""
+
+import weakref
+
+import Tuke
+from Tuke.context.source import batching,batch_serial
+from Tuke.context.wrapper import unwrap
+
+def cached_attribute(depends=()):
+    """Decorator for cached attributes.
+
+    depends - Sequence of dependencies.
+
+    Example:
+
+    class Foo(Element):
+        @cached_attribute(depends=('transform','../transform'))
+        def bar(self):
+            return expensive(self.transform)
+    """
+    def f(fn):
+        return CachedAttribute(fn,depends)
+    return f
+
+class CachedAttribute(object):
+    """Cached attribute descriptor.
+
+    See cached_attribute()
+
+    hits   - Number of times a cached value was used.
+    misses - Number of times the value was computed.
+    """
+
+    def __init__(self,fn,depends=()):
+        self.fn = fn
+        self.name = fn.__name__
+        self.__doc__ = fn.__doc__
+        self.depends = tuple(depends)
+
+        # Values are kept in the Element's __dict__ under a key that can't
+        # collide with an attribute name.
+        self.key = '<cached %s>' % self.name
+
+        self.hits = 0
+        self.misses = 0
+
+    def __get__(self,obj,cls=None):
+        if obj is None:
+            return self
+
+        try:
+            (v,handles,serial) = obj.__dict__[self.key]
+        except KeyError:
+            pass
+        else:
+            if not batching() or serial == batch_serial():
+                self.hits += 1
+                return v
+
+        self.misses += 1
+        v = self.fn(obj)
+
+        self.invalidate(obj)
+
+        # The unsubscribe handles are stored in obj, and aren't visible to
+        # the garbage collector, so obj must only be weakly referenced by the
+        # callback.
+        obj_ref = weakref.ref(obj)
+        def invalidate():
+            obj = obj_ref()
+            if obj is not None:
+                self.invalidate(obj)
+        handles = subscribe_depends(obj,self.depends,invalidate)
+
+        obj.__dict__[self.key] = (v,handles,batch_serial())
+        return v
+
+    def __set__(self,obj,value):
+        raise AttributeError("can't set cached attribute '%s'" % self.name)
+
+    def __delete__(self,obj):
+        self.invalidate(obj)
+
+    def invalidate(self,obj):
+        """Invalidate the cached value of obj, if any."""
+        try:
+            (v,handles,serial) = obj.__dict__.pop(self.key)
+        except KeyError:
+            return
+
+        for unsubscribe in handles:
+            unsubscribe()
+        obj.touch(self.name)
+
+def subscribe_depends(obj,depends,callback):
+    """Subscribe callback to changes of dependencies.
+
+    obj     - The Element the dependencies are relative to.
+    depends - Sequence of dependencies, as given to cached_attribute()
+
+    Returns a list of unsubscribe handles.
+    """
+    handles = []
+    for dep in depends:
+        if callable(dep):
+            for d in dep(obj):
+                _subscribe(obj,d,callback,handles)
+        else:
+            _subscribe(obj,dep,callback,handles)
+    return handles
+
+def _subscribe(obj,dep,callback,handles):
+    path = str(dep).split('/')
+    e = obj
+    for p in path[:-1]:
+        if p == '..':
+            handles.append(e.subscribe('parent',callback))
+            e = unwrap(e.parent)
+        else:
+            handles.append(e.subscribe(p,callback))
+            subs = getattr(e,'_subs',None)
+            if subs is None:
+                return
+            e = unwrap(subs.get(p))
+
+        # The rest of the path doesn't exist yet, the subscriptions so far
+        # will catch it being created.
+        if e is None:
+            return
+
+    handles.append(e.subscribe(path[-1],callback))
+
+def transform_depends(ref):
+    """Dependencies of geometry seen through a relative reference.
+
+    ref - Id relative to the Element.
+
+    Returns the transform of every Element between the Element and ref, the
+    Element itself and it's ancestors up to, but not including, the common
+    ancestor, then every Element down from the common ancestor to ref.
+    """
+    ref = [str(p) for p in Tuke.Id(ref)]
+    up = 0
+    while up < len(ref) and ref[up] == '..':
+        up += 1
+
+    r = []
+    for i in range(up):
+        r.append('../' * i + 'transform')
+
+    down = '../' * up
+    for p in ref[up:]:
+        down += p + '/'
+        r.append(down + 'transform')
+    return r
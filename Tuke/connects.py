@@ -38,9 +38,9 @@ import Tuke
 import Tuke.context
 import Tuke.context.wrapped_str_repr
 import Tuke.repr_helper
-import weakref
 
 from Tuke.context.wrapper import unwrap
+from Tuke.id import normalize
 
 def _make_ref(base,ref):
     """Given an Id, or Element, return an Id
@@ -67,104 +67,238 @@ def _make_ref(base,ref):
 # Id.
 #
 # Implicit connectivity is harder. Firstly implicit connectivity can change due
-# to topology changes, either making, or in the future when Element.remove() is
-# supported, breaking implicit connections. Secondly while the implicit
-# connectivity info must be stored in the Elements that are being implicitly
-# connected to for speed, if the Element.connects creating that connection is
-# deleted, that info must automatically be removed. This is also tricky, as we
-# can't use any __dealloc__ hooks.
+# to topology changes, either making, or with Element.remove(), breaking
+# implicit connections. Secondly, with thousands of connections, for instance
+# Trace end points, working out what changed after every topology change has
+# to be cheap.
 #
-# The solution here uses the Element.topology_notify() mechanism heavilly, setting up
-# callbacks along every Element in the explicit connection chain. The
-# _elemref class then acts to maintain and process those callbacks. Connects
-# is then a set of _elemrefs. At any point the whole shebang can be deleted,
-# and the weakref callback mechanism used in notify will clean up everything.
+# The solution here is a connectivity engine, _Connectivity, one per tree of
+# Elements. Every explicit connection made by a Connects in the tree is an
+# _elemref, which is either resolved, or dangling. Resolved _elemrefs are kept
+# in an adjacency structure that maps each Element to the _elemrefs that have
+# it at either end, so both the explicit connections an Element makes, and the
+# implicit connections made to it, are found in the same place. Dangling
+# _elemrefs are kept in a dict keyed by the path, relative to the root, that
+# they are waiting on.
+#
+# Element.add() and Element.remove() tell the engine exactly what changed.
+# Adding a sub-tree resolves only the dangling _elemrefs waiting on the paths
+# that were added, and re-keys the sub-tree's own dangling _elemrefs to the new
+# root. Removing a sub-tree splits off only the _elemrefs that cross the
+# removed edge. Nothing is recomputed from scratch.
+
+def _connectivity(elem):
+    """Return the connectivity engine for the tree elem is in.
+
+    elem - Unwrapped Element
+
+    The engine, and the _Tree, are created if they don't already exist.
+    """
+    tree = elem._get_tree()
+    if tree.connectivity is None:
+        tree.connectivity = _Connectivity(tree)
+    return tree.connectivity
+
+def _climbs(ref):
+    """Number of levels a normalized Id goes up before coming back down"""
+    n = 0
+    for p in tuple.__iter__(ref):
+        if p != '..':
+            break
+        n += 1
+    return n
+
+class _Connectivity(object):
+    """Connectivity engine for a tree of Elements.
+
+    adjacency - Maps unwrapped Elements to the set of resolved _elemrefs that
+                have that Element as their source, or their target.
+    waiting - Maps root relative paths to the set of dangling _elemrefs
+              referring to that path. A path may start with '..' if it refers
+              to somewhere outside of the tree.
+    generation - Incremented on every change, for the benefit of anything
+                 caching information derived from the connectivity, see
+                 Tuke.netlist
+    """
+
+    __slots__ = ('tree','adjacency','waiting','generation')
+
+    def __init__(self,tree):
+        self.tree = tree
+        self.adjacency = {}
+        self.waiting = {}
+        self.generation = 0
+
+    def _resolve(self,path):
+        """Return the unwrapped Element at root relative path, or None"""
+        if not path:
+            return self.tree.root
+        try:
+            return unwrap(self.tree.paths[path])
+        except KeyError:
+            return None
+
+    def connect(self,eref):
+        """Resolve eref, or leave it dangling."""
+        self.generation += 1
+        path = tuple(normalize(eref.source._path +
+                               tuple(tuple.__iter__(eref.ref))))
+        target = self._resolve(path)
+        if target is None:
+            eref.waiting = path
+            try:
+                self.waiting[path].add(eref)
+            except KeyError:
+                self.waiting[path] = set((eref,))
+        else:
+            self._link(eref,target)
+
+    def _link(self,eref,target):
+        eref.target = target
+        eref.waiting = None
+        for e in (eref.source,target):
+            try:
+                self.adjacency[e].add(eref)
+            except KeyError:
+                self.adjacency[e] = set((eref,))
+
+    def _unlink(self,eref):
+        for e in (eref.source,eref.target):
+            erefs = self.adjacency.get(e)
+            if erefs is not None:
+                erefs.discard(eref)
+                if not erefs:
+                    del self.adjacency[e]
+        eref.target = None
+
+    def disconnect(self,eref):
+        """Forget eref entirely, resolved or dangling."""
+        self.generation += 1
+        if eref.target is not None:
+            self._unlink(eref)
+        elif eref.waiting is not None:
+            erefs = self.waiting.get(eref.waiting)
+            if erefs is not None:
+                erefs.discard(eref)
+                if not erefs:
+                    del self.waiting[eref.waiting]
+            eref.waiting = None
+
+    def graft(self,prefix,new_paths,sub_tree):
+        """Graft a sub-tree in.
+
+        prefix - Path of the sub-tree root.
+        new_paths - Every path added to the tree.
+        sub_tree - The _Tree the sub-tree used to have, or None
+
+        Must be called after the path index has been updated.
+        """
+        self.generation += 1
+
+        sub = None
+        if sub_tree is not None:
+            sub = sub_tree.connectivity
+
+        # Resolved connections within the sub-tree stay resolved.
+        if sub is not None:
+            self.adjacency.update(sub.adjacency)
+
+        # Resolve anything that was waiting on the new paths.
+        for path in new_paths:
+            erefs = self.waiting.pop(path,None)
+            if erefs:
+                target = unwrap(self.tree.paths[path])
+                for eref in erefs:
+                    self._link(eref,target)
+
+        # Dangling connections in the sub-tree were relative to the old root,
+        # try again from the new one.
+        if sub is not None:
+            for erefs in sub.waiting.itervalues():
+                for eref in erefs:
+                    self.connect(eref)
+
+    def prune(self,sub_tree,elems):
+        """Split a sub-tree out.
+
+        sub_tree - The new _Tree of the sub-tree.
+        elems - Set of every unwrapped Element in the sub-tree.
+
+        Must be called after the path index has been split.
+        """
+        self.generation += 1
+        sub = sub_tree.connectivity = _Connectivity(sub_tree)
+
+        crossing = []
+        for e in elems:
+            erefs = self.adjacency.pop(e,None)
+            if erefs:
+                internal = set()
+                for eref in erefs:
+                    # A ref that climbs above the sub-tree root and comes
+                    # back down names the root, and resolves differently, or
+                    # not at all, once the root is a root.
+                    if eref.source in elems and eref.target in elems and \
+                       _climbs(eref.ref) < len(eref.source._path):
+                        internal.add(eref)
+                    else:
+                        crossing.append(eref)
+                if internal:
+                    sub.adjacency[e] = internal
+
+            # Dangling connections made from the sub-tree go with it.
+            for eref in dict.itervalues(unwrap(e.connects)):
+                if eref is not None and eref.waiting is not None:
+                    self.disconnect(eref)
+                    crossing.append(eref)
+
+        for eref in crossing:
+            if eref.target is not None:
+                self._unlink(eref)
+            if eref.source in elems:
+                sub.connect(eref)
+            else:
+                self.connect(eref)
+
+    def implicit(self,elem):
+        """Return the resolved _elemrefs connecting to elem from elsewhere."""
+        r = []
+        for eref in self.adjacency.get(elem,()):
+            if eref.target is elem and eref.valid():
+                r.append(eref)
+        return r
 
 class _elemref:
     """Connects explicit connection.
 
-    Holds both the Id reference, and maintains/creates the implicit connection.
+    Holds the Id reference, and the state of the connection in the
+    connectivity engine.
 
+    source - The unwrapped Element making the connection.
+    target - The unwrapped Element connected too, or None if dangling.
+    waiting - If dangling, the root relative path being waited on.
     """
 
     def __init__(self,connects,ref):
         self.ref = ref 
 
         self.connects = connects
-        self._compute_implicit_callbacks()
-
-    def _make_invalidator_callback(self):
-        """Make an invalidator callback callable object.
+        self.source = unwrap(connects._parent)
+        self.target = None
+        self.waiting = None
 
-        Each _elemref has a single invalidator callback associated with it,
-        which, when called, triggers a re-compute of the implicit callbacks.
-        This function simply makes a new one.
-        """
-        def invalidator(ref):
-            self._compute_implicit_callbacks()
-        return invalidator
-
-    def _compute_implicit_callbacks(self):
-        """Recompute the implicit callbacks chain.
-
-        Starts fresh. The design here is to simply start fresh after each
-        topology change. Given that most connects are going to be one or two
-        levels deep, this is simpler, and probably more efficient, than a more
-        complex "find what level changed" algorithm.
-
-        """
-        class Invalidator:
-            def __init__(self,ref):
-                self.ref = weakref.ref(ref)
-                self.valid = True
-            def __call__(self):
-                if self.valid:
-                    # One shot
-                    self.valid = False
-
-                    # Should only work if the original _elemref is alive.
-                    ref = self.ref()
-                    if ref is not None:
-                        ref._compute_implicit_callbacks()
-
-        # Old invalidator is deleted, garbage collection will take care of the
-        # rest.
-        self._invalidator_callable = Invalidator(self)
-
-        # Walk from our parent element, to the destination, setting callbacks
-        # along the way. While we're at it, the reverse path is being
-        # calculated in p, for insertion into the target's implicitly connected
-        # dict.
-        e = unwrap(self.connects._parent)
-        p = Tuke.Id('.')
-        for i in tuple(tuple.__iter__(self.ref)) + (None,):
-            if i is not None:
-                e.topology_notify(Tuke.Id(i),self._invalidator_callable)
-
-                if i == '..':
-                    p = e.__shadowless__.id + p
-                else:
-                    p = Tuke.Id('..') + p
-            try:
-                e = unwrap(e[Tuke.Id(i)])
-            except KeyError:
-                # Didn't reach the last Element referenced in the path;
-                # implicit connection doesn't exist because explicit connection
-                # is dangling.
-                break
-            except TypeError:
-                # Did reach the last Element referenced in the path. The
-                # calculated reverse path is inserted as the key in
-                # _implicitly_connected, the invalidator_callable is used as a
-                # magic cookie. This is a WeakValueDict, so when the cookie
-                # goes away, the entry does too.
-                #
-                # Note that gc-lag could turn this simple construct into a
-                # problem when Element.remove is implemented.
-                e.connects._implicitly_connected[p] = self._invalidator_callable
-                break
+        _connectivity(self.source).connect(self)
 
+    def valid(self):
+        """True if this is still one of it's source's explicit connections."""
+        return unwrap(self.source.connects) is self.connects and \
+               dict.get(self.connects,self.ref) is self
 
+    def disconnect(self):
+        """Remove from the connectivity engine."""
+        tree = self.source._tree
+        if tree is not None and tree.connectivity is not None:
+            tree.connectivity.disconnect(self)
 
 class Connects(dict):
     """Per-Element connectivity info.
@@ -185,10 +319,8 @@ class Connects(dict):
 
         assert isinstance(parent,(Tuke.Element,type(None)))
 
-        self._implicitly_connected = weakref.WeakValueDictionary()
-
         for i in iterable:
-            self[i] = None 
+            dict.__setitem__(self,i,None)
 
         self._parent = parent
         return self
@@ -200,8 +332,11 @@ class Connects(dict):
     def add(self,ref):
         """Add an explicit connection."""
         ref = _make_ref(self._parent,ref)
+        old = dict.get(self,ref)
+        if old is not None:
+            old.disconnect()
         eref = _elemref(self,ref)
-        self[ref] = eref
+        dict.__setitem__(self,ref,eref)
 
     def to(self,ref):
         """True if self is connected to other, explicity or implicitly."""
@@ -215,11 +350,79 @@ class Connects(dict):
             else:
                 return False
 
+    def _get_implicitly_connected(self):
+        """Dict of the implicit connections made to us.
+
+        Keyed by the Id of the connecting Element, relative to us, with the
+        _elemrefs making the connection as values.
+        """
+        r = {}
+        if self._parent is None:
+            return r
+
+        e = unwrap(self._parent)
+        tree = e._tree
+        if tree is None or tree.connectivity is None:
+            return r
+
+        base = tuple.__new__(Tuke.Id,e._path)
+        for eref in tree.connectivity.implicit(e):
+            p = tuple.__new__(Tuke.Id,eref.source._path).relto(base)
+            r[p] = eref
+        return r
+    _implicitly_connected = property(_get_implicitly_connected)
+
     def __contains__(self,ref):
         """True if there is an explicit connection from self to other"""
         ref = _make_ref(self._parent,ref)
         return super(self.__class__,self).__contains__(ref)
 
+    def __setitem__(self,ref,value):
+        """Add an explicit connection, same as add(ref), value is ignored."""
+        self.add(ref)
+
+    def update(self,refs):
+        """Add explicit connections from an iterable of Ids, or Elements."""
+        for ref in refs:
+            self.add(ref)
+
+    def setdefault(self,ref,default = None):
+        """Add an explicit connection, unless it already exists."""
+        if ref not in self:
+            self.add(ref)
+
+    def __delitem__(self,ref):
+        """Remove an explicit connection."""
+        ref = _make_ref(self._parent,ref)
+        eref = dict.pop(self,ref)
+        if eref is not None:
+            eref.disconnect()
+
+    def pop(self,ref,*default):
+        """Remove an explicit connection."""
+        ref = _make_ref(self._parent,ref)
+        eref = dict.pop(self,ref,*default)
+        if isinstance(eref,_elemref):
+            eref.disconnect()
+        return eref
+
+    def popitem(self):
+        (ref,eref) = dict.popitem(self)
+        if eref is not None:
+            eref.disconnect()
+        return (ref,eref)
+
+    def clear(self):
+        """Remove every explicit connection."""
+        self._disconnect_all()
+        dict.clear(self)
+
+    def _disconnect_all(self):
+        """Remove our connections from the connectivity engine."""
+        for eref in dict.itervalues(self):
+            if eref is not None:
+                eref.disconnect()
+
 
     # Private stuff below:
 
@@ -39,7 +39,10 @@
 //
 // The second function is to provide a notify-on-change callback system for any
 // attribute in the Source __dict__ This is used in a variety of contexts when
-// changes need to be monitored.
+// changes need to be monitored. Callbacks come in two forms. notify()
+// callbacks are one-shot, and only weakly referenced. subscribe() callbacks
+// are persistent, strongly referenced, and called on every change until
+// explicitly unsubscribed, which suits long-lived observers such as caches.
 //
 //
 // A "cute party trick" is the special __shadowless__ attribute. It's a second
@@ -79,13 +82,18 @@ Source_new(PyTypeObject *type, PyObject *args, PyObject *kwargs){
     if (!self->dict_shadow) return NULL;
     self->dict_callbacks = PyDict_New();
     if (!self->dict_callbacks) return NULL;
+    self->dict_subscriptions = PyDict_New();
+    if (!self->dict_subscriptions) return NULL;
 
-    // shadowless shares __dict__ and __dict_callbacks__, so increment the
-    // reference counts and set pointers.
+    // shadowless shares __dict__, __dict_callbacks__ and
+    // __dict_subscriptions__, so increment the reference counts and set
+    // pointers.
     Py_INCREF(self->dict);
     self->shadowless->dict = self->dict;
     Py_INCREF(self->dict_callbacks);
     self->shadowless->dict_callbacks = self->dict_callbacks;
+    Py_INCREF(self->dict_subscriptions);
+    self->shadowless->dict_subscriptions = self->dict_subscriptions;
 
     // shadowless still has to have it's own valid shadow dict, so we use a
     // pre-made, empty, read-only dict.
@@ -114,6 +122,7 @@ Source_dealloc(Source* self){
     Py_XDECREF(self->dict);
     Py_XDECREF(self->dict_shadow);
     Py_XDECREF(self->dict_callbacks);
+    Py_XDECREF(self->dict_subscriptions);
     Py_XDECREF(self->shadowless);
     PyObject_GC_Del(self);
 }
@@ -123,6 +132,7 @@ Source_traverse(Source *self, visitproc visit, void *arg){
     Py_VISIT(self->dict);
     Py_VISIT(self->dict_shadow);
     Py_VISIT(self->dict_callbacks);
+    Py_VISIT(self->dict_subscriptions);
     Py_VISIT(self->shadowless);
     return 0;
 }
@@ -132,6 +142,7 @@ Source_clear(Source *self){
     Py_CLEAR(self->dict);
     Py_CLEAR(self->dict_shadow);
     Py_CLEAR(self->dict_callbacks);
+    Py_CLEAR(self->dict_subscriptions);
     Py_CLEAR(self->shadowless);
     return 0;
 }
@@ -143,6 +154,8 @@ static PyMemberDef Source_members[] = {
      NULL},
     {"__dict_callbacks__", T_OBJECT_EX, offsetof(Source, dict_callbacks), 0,
      NULL},
+    {"__dict_subscriptions__", T_OBJECT_EX, offsetof(Source, dict_subscriptions), 0,
+     NULL},
     {"__shadowless__", T_OBJECT_EX, offsetof(Source, shadowless), 0,
      NULL},
     {NULL}  /* Sentinel */
@@ -238,9 +251,106 @@ cleanup:
     return r;
 }
 
+// Persistent subscriptions
+//
+// Subscriptions are stored as a list of callbacks per attribute in
+// __dict_subscriptions__ The list is strongly referenced by the unsubscribe
+// handle returned from subscribe(), the Source itself is not, so handles
+// don't keep Sources alive. However handles are not visible to the garbage
+// collector, so a handle stored in a Source must not be for a callback that
+// strongly references that Source.
+
+static PyObject *
+source_unsubscribe(void *closure,PyObject *args,PyObject *kwargs){
+    // closure is a (subscriptions list, callback) tuple
+    PyObject *subs = PyTuple_GET_ITEM((PyObject *)closure,0),
+             *callback = PyTuple_GET_ITEM((PyObject *)closure,1);
+    Py_ssize_t i;
+
+    if (!PyArg_ParseTuple(args, "")) return NULL;
+
+    // Unsubscribing more than once is harmless.
+    for (i = 0; i < PyList_GET_SIZE(subs); i++){
+        if (PyList_GET_ITEM(subs,i) == callback){
+            if (PySequence_DelItem(subs,i)) return NULL;
+            break;
+        }
+    }
+
+    Py_RETURN_NONE;
+}
+static void
+source_unsubscribe_destroyer(void *closure){
+    Py_DECREF((PyObject *)closure);
+}
+
+static PyObject *
+source_subscribe(Source *self,PyObject *args,PyObject *kwargs){
+    PyObject *attr,
+             *callback,
+             *subs,
+             *closure;
+
+    // Unlike notify() subscribe() is allowed on __shadowless__, which shares
+    // __dict_subscriptions__ with the master, so subscribers can be added from
+    // _(apply|remove)_context functions.
+
+    if (!PyArg_ParseTuple(args, "OO", 
+                          &attr, 
+                          &callback))
+        return NULL;
+
+    if (!PyString_CheckExact(attr)){
+        PyErr_Format(PyExc_TypeError,
+                     "attribute must be string, not %s",
+                     attr->ob_type->tp_name);
+        return NULL;
+    }
+    if (!PyCallable_Check(callback)){
+        PyErr_Format(PyExc_TypeError,
+                     "callback must be callable, not %s",
+                     callback->ob_type->tp_name);
+        return NULL;
+    }
+
+    // Subscriptions are called from any context, so store them unwrapped, as
+    // notify() does.
+    callback = fully_unwrap_wrapped(callback); 
+
+    subs = PyDict_GetItem(self->dict_subscriptions,attr);
+    if (!subs){
+        subs = PyList_New(0);
+        if (!subs) return NULL;
+        if (PyDict_SetItem(self->dict_subscriptions,attr,subs)){
+            Py_DECREF(subs);
+            return NULL;
+        }
+        Py_DECREF(subs);
+    }
+
+    if (PyList_Append(subs,callback)) return NULL;
+
+    closure = PyTuple_Pack(2,subs,callback);
+    if (!closure) return NULL;
+    return CFunction_new(source_unsubscribe,
+                         source_unsubscribe_destroyer,
+                         closure);
+}
+
+static PyObject *source_touch(Source *self,PyObject *args);
+
 static PyMethodDef Source_methods[] = {
     {"notify", (PyCFunction)source_notify, METH_VARARGS,
      ""}, // FIXME
+    {"subscribe", (PyCFunction)source_subscribe, METH_VARARGS,
+     "subscribe(attr,callback) -> unsubscribe\n\n"
+     "Call callback, with no arguments, every time attr is set or deleted.\n"
+     "Unlike notify() the subscription is persistent, and callback is strongly\n"
+     "referenced. Call the returned handle to unsubscribe."},
+    {"touch", (PyCFunction)source_touch, METH_VARARGS,
+     "touch(attr)\n\n"
+     "Notify the callbacks and subscribers of attr as though it had been set.\n"
+     "Used when a value derived from other attributes changes."},
     {NULL,NULL,0,NULL}
 };
 
@@ -259,14 +369,291 @@ source_getattro(Source *self,PyObject *name){
     return PyObject_GenericGetAttr((PyObject *)self,name);
 }
 
+// Remember the exception a callback raised, unless an earlier one already
+// has been, so that the remaining callbacks can still be called.
+//
+// exc is the (type,value,traceback) triple for PyErr_Fetch()
+static void
+source_save_exception(PyObject **exc){
+    if (exc[0]){
+        PyErr_Clear();
+    } else {
+        PyErr_Fetch(&exc[0],&exc[1],&exc[2]);
+    }
+}
+
+// Call, and clear, every callback in attr_callbacks
+//
+// Callbacks whose referents have died are an error, unless skip_dead is set.
+// Coalesced batch sets, see below, can end up containing dead references
+// their destroyers were unable to remove.
+//
+// If exc is NULL the first callback to raise stops the rest from being
+// called, otherwise the exception is saved in exc, see
+// source_save_exception(), and the rest are called anyway.
 static int
-source_setattro(Source *self,PyObject *name,PyObject *value){
-    int r; 
-    PyObject *attr_callbacks = NULL,
-             *cbref = NULL,
+source_fire_callbacks(PyObject *attr_callbacks,int skip_dead,long *called,
+                      PyObject **exc){
+    PyObject *cbref = NULL,
              *cb = NULL,
              *cr;
 
+    while (PySet_GET_SIZE(attr_callbacks)){
+        cbref = PySet_Pop(attr_callbacks);
+        if (!cbref) goto bail;
+
+        cb = PyWeakref_GetObject(cbref);
+        Py_INCREF(cb);
+        Py_DECREF(cbref);
+        cbref = NULL;
+        if (cb == Py_None){
+            if (!skip_dead){
+                PyErr_SetString(PyExc_RuntimeError,
+                                "Callback reference points to dead object.");
+                goto bail;
+            }
+            Py_DECREF(cb);
+            cb = NULL;
+            continue;
+        }
+
+        cr = PyObject_CallObject(cb,NULL);
+        if (!cr){
+            if (!exc) goto bail;
+            source_save_exception(exc);
+        }
+        Py_XDECREF(cr);
+        Py_DECREF(cb);
+        cb = NULL;
+
+        if (called) (*called)++;
+    }
+    return 0;
+bail:
+    Py_XDECREF(cbref);
+    Py_XDECREF(cb);
+    return -1;
+}
+
+// Call every subscription to attr name of self
+//
+// exc is as for source_fire_callbacks()
+static int
+source_fire_subscriptions(Source *self,PyObject *name,long *called,
+                          PyObject **exc){
+    PyObject *subs,*cr;
+    Py_ssize_t i;
+
+    subs = PyDict_GetItem(self->dict_subscriptions,name);
+    if (!subs || !PyList_GET_SIZE(subs)) return 0;
+
+    // Subscribers may unsubscribe, or subscribe others, when called, so work
+    // from a copy.
+    subs = PyList_GetSlice(subs,0,PyList_GET_SIZE(subs));
+    if (!subs) return -1;
+
+    for (i = 0; i < PyList_GET_SIZE(subs); i++){
+        cr = PyObject_CallObject(PyList_GET_ITEM(subs,i),NULL);
+        if (!cr){
+            if (!exc){
+                Py_DECREF(subs);
+                return -1;
+            }
+            source_save_exception(exc);
+        }
+        Py_XDECREF(cr);
+        if (called) (*called)++;
+    }
+
+    Py_DECREF(subs);
+    return 0;
+}
+
+// Batching
+// ########
+//
+// Between batch_begin() and the matching batch_end() callbacks are not called
+// when an attribute is set. Instead the callback set for each (Source,attr)
+// changed is moved to batch_pending, in the order they were first changed,
+// and further changes to the same (Source,attr) are coalesced into the
+// pending set. When the outermost batch ends every pending callback, and
+// every subscription then current for the (Source,attr), is called exactly
+// once.
+//
+// Batches are global, not per-Source, as callbacks on one Source are often
+// triggered by changes to another.
+
+static int batch_depth = 0;
+
+// (Source,attr) -> callback set
+static PyObject *batch_pending = NULL;
+
+// (Source,attr) keys of batch_pending, in the order they were first changed.
+static PyObject *batch_order = NULL;
+
+// Number of notifications deferred, and how many of those were coalesced into
+// an already pending notification.
+static long batch_notifications = 0;
+static long batch_coalesced = 0;
+
+// Total number of notifications ever deferred, never reset. If it hasn't
+// changed nothing anyone is watching has changed during the batch, see
+// Tuke.cached_attribute
+static long batch_serial = 0;
+
+static int
+source_batch_defer(Source *self,PyObject *name){
+    PyObject *key,*attr_callbacks,*subs,*pending,*r;
+
+    attr_callbacks = PyDict_GetItem(self->dict_callbacks,name);
+    subs = PyDict_GetItem(self->dict_subscriptions,name);
+    if (subs && !PyList_GET_SIZE(subs)) subs = NULL;
+
+    key = PyTuple_Pack(2,self,name);
+    if (!key) return -1;
+
+    pending = PyDict_GetItem(batch_pending,key);
+    if (pending){
+        batch_notifications++;
+        batch_serial++;
+        batch_coalesced++;
+        if (attr_callbacks){
+            r = PyObject_CallMethod(pending,"update","(O)",attr_callbacks);
+            if (!r) goto bail;
+            Py_DECREF(r);
+            if (PyDict_DelItem(self->dict_callbacks,name)) goto bail;
+        }
+    } else if (attr_callbacks){
+        batch_notifications++;
+        batch_serial++;
+        if (PyDict_SetItem(batch_pending,key,attr_callbacks)) goto bail;
+        if (PyList_Append(batch_order,key)) goto bail;
+        if (PyDict_DelItem(self->dict_callbacks,name)) goto bail;
+    } else if (subs){
+        // Only subscribers are interested, still need a pending set to
+        // coalesce any callbacks registered later into.
+        batch_notifications++;
+        batch_serial++;
+        pending = PySet_New(NULL);
+        if (!pending) goto bail;
+        if (PyDict_SetItem(batch_pending,key,pending)){
+            Py_DECREF(pending);
+            goto bail;
+        }
+        Py_DECREF(pending);
+        if (PyList_Append(batch_order,key)) goto bail;
+    }
+
+    Py_DECREF(key);
+    return 0;
+bail:
+    Py_DECREF(key);
+    return -1;
+}
+
+static PyObject *
+source_batch_begin(PyObject *junk,PyObject *unused){
+    batch_depth++;
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+source_batching(PyObject *junk,PyObject *unused){
+    return PyBool_FromLong(batch_depth > 0);
+}
+
+static PyObject *
+source_batch_serial(PyObject *junk,PyObject *unused){
+    return PyInt_FromLong(batch_serial);
+}
+
+static PyObject *
+source_batch_end(PyObject *junk,PyObject *unused){
+    PyObject *pending,*order,*r = NULL;
+    PyObject *exc[3] = {NULL,NULL,NULL};
+    long notifications,coalesced,called = 0;
+    Py_ssize_t i;
+
+    if (batch_depth <= 0){
+        PyErr_SetString(PyExc_RuntimeError,
+                        "batch_end() called without matching batch_begin()");
+        return NULL;
+    }
+
+    batch_depth--;
+    if (batch_depth) Py_RETURN_NONE;
+
+    // Callbacks may set attributes themselves, which now must notify
+    // immediately, so start afresh before calling anything.
+    pending = batch_pending;
+    order = batch_order;
+    notifications = batch_notifications;
+    coalesced = batch_coalesced;
+
+    batch_pending = PyDict_New();
+    batch_order = PyList_New(0);
+    batch_notifications = 0;
+    batch_coalesced = 0;
+    if (!batch_pending || !batch_order) goto bail;
+
+    // A callback raising must not stop the rest from being notified, the
+    // first exception raised is re-raised once they all have been.
+    for (i = 0; i < PyList_GET_SIZE(order); i++){
+        PyObject *key,*attr_callbacks;
+        key = PyList_GET_ITEM(order,i);
+        attr_callbacks = PyDict_GetItem(pending,key);
+        if (source_fire_callbacks(attr_callbacks,1,&called,exc)) goto bail;
+        if (source_fire_subscriptions((Source *)PyTuple_GET_ITEM(key,0),
+                                      PyTuple_GET_ITEM(key,1),
+                                      &called,exc)) goto bail;
+    }
+
+    if (exc[0]){
+        PyErr_Restore(exc[0],exc[1],exc[2]);
+        exc[0] = exc[1] = exc[2] = NULL;
+    } else {
+        r = Py_BuildValue("(lll)",notifications,coalesced,called);
+    }
+bail:
+    Py_XDECREF(exc[0]);
+    Py_XDECREF(exc[1]);
+    Py_XDECREF(exc[2]);
+    Py_DECREF(pending);
+    Py_DECREF(order);
+    return r;
+}
+
+// Notify the callbacks and subscribers of attr name of self that it has
+// changed.
+static int
+source_changed(Source *self,PyObject *name){
+    PyObject *attr_callbacks;
+
+    if (batch_depth) return source_batch_defer(self,name);
+
+    attr_callbacks = PyDict_GetItem(self->dict_callbacks,name);
+    if (attr_callbacks){
+        // Calling the callbacks may generate new ones, so clear the list first.
+        Py_INCREF(attr_callbacks);
+        if (PyDict_DelItem(self->dict_callbacks,name)){
+            Py_DECREF(attr_callbacks);
+            return -1;
+        }
+
+        if (source_fire_callbacks(attr_callbacks,0,NULL,NULL)){
+            Py_DECREF(attr_callbacks);
+            return -1;
+        }
+        Py_DECREF(attr_callbacks);
+    }
+
+    return source_fire_subscriptions(self,name,NULL,NULL);
+}
+
+static int
+source_setattro(Source *self,PyObject *name,PyObject *value){
+    int r; 
+
     if (self->dict_shadow == readonly_empty_dict){
         PyErr_SetString(PyExc_TypeError,
                         "Source.__shadowless__ is read only.");
@@ -274,47 +661,29 @@ source_setattro(Source *self,PyObject *name,PyObject *value){
     }
 
     r = PyObject_GenericSetAttr((PyObject *)self,name,value);
-    if (r) goto bail;
+    if (r) return r;
 
     // Note that the callbacks are called *after* the value has been set,
     // allowing the callbacks to see the new value.
+    return source_changed(self,name);
+}
 
-    attr_callbacks = PyDict_GetItem(self->dict_callbacks,name);
-    if (attr_callbacks){
-        // Calling the callbacks may generate new ones, so clear the list first.
-        Py_INCREF(attr_callbacks);
-        if (PyDict_DelItem(self->dict_callbacks,name)) goto bail;
-
-        while (PySet_GET_SIZE(attr_callbacks)){
-            cbref = PySet_Pop(attr_callbacks);
-            if (!cbref) goto bail;
+static PyObject *
+source_touch(Source *self,PyObject *args){
+    PyObject *attr;
 
-            cb = PyWeakref_GetObject(cbref);
-            Py_INCREF(cb);
-            Py_DECREF(cbref);
-            cbref = NULL;
-            if (cb == Py_None){
-                PyErr_SetString(PyExc_RuntimeError,
-                                "Callback reference points to dead object.");
-                goto bail; 
-            }
+    // Allowed on __shadowless__ as well, as subscribe() is.
+    if (!PyArg_ParseTuple(args, "O", &attr)) return NULL;
 
-            cr = PyObject_CallObject(cb,NULL);
-            if (!cr) goto bail;
-            Py_DECREF(cr);
-            Py_DECREF(cb);
-            cb = NULL;
-        }
+    if (!PyString_CheckExact(attr)){
+        PyErr_Format(PyExc_TypeError,
+                     "attribute must be string, not %s",
+                     attr->ob_type->tp_name);
+        return NULL;
     }
 
-    goto cleanup;
-bail:
-    r = -1;
-cleanup:
-    Py_XDECREF(attr_callbacks);
-    Py_XDECREF(cbref);
-    Py_XDECREF(cb);
-    return r;
+    if (source_changed(self,attr)) return NULL;
+    Py_RETURN_NONE;
 }
 
 PyTypeObject SourceType = {
@@ -362,6 +731,17 @@ PyTypeObject SourceType = {
 
 
 static PyMethodDef methods[] = {
+    {"batch_begin", (PyCFunction)source_batch_begin, METH_NOARGS,
+     "Begin batching notifications."},
+    {"batching", (PyCFunction)source_batching, METH_NOARGS,
+     "True if notifications are currently being batched."},
+    {"batch_serial", (PyCFunction)source_batch_serial, METH_NOARGS,
+     "Number of notifications deferred by batches so far.\n\n"
+     "Unchanged if nothing being watched has changed since it was last read."},
+    {"batch_end", (PyCFunction)source_batch_end, METH_NOARGS,
+     "End batching notifications.\n\n"
+     "If this ends the outermost batch the pending callbacks are called, and\n"
+     "(notifications,coalesced,callbacks) is returned, otherwise None."},
     {NULL,NULL,0,NULL}
 };
 
@@ -377,6 +757,11 @@ PyObject *initsource(void){
     Py_DECREF(tmp);
     if (!readonly_empty_dict) return NULL;
 
+    batch_pending = PyDict_New();
+    if (!batch_pending) return NULL;
+    batch_order = PyList_New(0);
+    if (!batch_order) return NULL;
+
     m = Py_InitModule3("Tuke.context._context.source", methods,
                        "Context source");
     if (!m) return NULL;
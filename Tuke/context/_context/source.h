@@ -31,6 +31,7 @@ struct Source {
     PyObject *dict;
     PyObject *dict_shadow;
     PyObject *dict_callbacks;
+    PyObject *dict_subscriptions;
     Source *shadowless;
     PyObject *in_weakreflist;
 };
@@ -151,7 +151,10 @@ apply_remove_context(PyObject *context,PyObject *obj,int apply){
         return NULL;
     }
 
-    if (!PyObject_IsInstance((PyObject *)context,(PyObject *)&SourceType)){
+    // A Wrapped context would forward the __class__ lookup done by
+    // PyObject_IsInstance() through every level of wrapping, in Python, so
+    // check the underlying object directly.
+    if (!PyObject_IsInstance(fully_unwrap_wrapped(context),(PyObject *)&SourceType)){
         PyErr_Format(PyExc_TypeError,
                      "context object must be an Element instance (not \"%.200s\")",
                      context->ob_type->tp_name);
@@ -361,6 +364,29 @@ element_add_method(Wrapped *self,PyObject *elem){
     return wr;
 }
 
+// remove() method.
+//
+// c = a.b.remove(a.b.c)
+//
+// Here the problem is the return value. The removed element is no longer in
+// the context of b, or a, so it must be returned only wrapped in itself, just
+// as Element.__new__ would return it. The argument has each level of context
+// removed from it as normal, so passing an Element, or an Id, in the context
+// of a works as expected.
+//
+// Unlike add() and __enter__() this has to be special-cased at every level of
+// wrapping, not just the innermost, see special_wrapped_element_methods
+// below.
+static PyObject *
+element_remove_method(Wrapped *self,PyObject *elem){
+    PyObject *r;
+    elem = xremove_context(self,elem);
+    if (!elem) return NULL;
+    r = PyObject_CallMethod(self->wrapped_obj,"remove","(O)",elem);
+    Py_DECREF(elem);
+    return r;
+}
+
 // __enter__() method. 
 //
 // with a.b.c as c:
@@ -388,6 +414,12 @@ static PyMethodDef special_element_methods[] = {
     {NULL,NULL,0,NULL}
 };
 
+static PyMethodDef special_wrapped_element_methods[] = {
+    {"remove", (PyCFunction)element_remove_method, METH_O,
+     "Remove sub-element"},
+    {NULL,NULL,0,NULL}
+};
+
 int unwrapped_method(PyMethodDef *ml){
     return (ml->ml_meth == (PyCFunction)element_enter_method);
 }
@@ -395,10 +427,25 @@ int unwrapped_method(PyMethodDef *ml){
 static PyObject *
 Wrapped_getattr(Wrapped *self,PyObject *name){
     PyObject *r = NULL,*wr = NULL;
+    char *cname;
+
+    cname = PyString_AsString(name);
+    if (!cname) return NULL;
+
     // Special-cased Element methods
+    //
+    // Every attribute access comes through here, so check the name, which is
+    // cheap, before finding out if the fully unwrapped object is an Element.
+    if (!strcmp(cname,"remove") &&
+        PyType_IsSubtype(fully_unwrap_wrapped((PyObject *)self)->ob_type,
+                         &SourceType)){
+        r = Py_FindMethod(special_wrapped_element_methods,(PyObject *)self,
+                          cname);
+        if (r) return r;
+        PyErr_Clear();
+    }
     if (PyType_IsSubtype(self->wrapped_obj->ob_type,&SourceType)){
-        r = Py_FindMethod(special_element_methods,(PyObject *)self,
-                          PyString_AsString(name));
+        r = Py_FindMethod(special_element_methods,(PyObject *)self,cname);
         if (r) return r;
         PyErr_Clear();
     }
@@ -18,3 +18,46 @@
 # ### BOILERPLATE ###
 
 from _context.source import Source
+from _context.source import batch_begin,batch_end,batching,batch_serial
+from _context import wrapper
+
+class Batch(wrapper.Translatable):
+    """Batch notifications
+
+    Used as a context manager. Within the with block setting Source attributes
+    doesn't call the notification callbacks immediately, instead they are
+    collected, and each callback is called once, after the outermost batch
+    exits. Multiple changes to the same attribute of the same Source are
+    coalesced into a single notification.
+
+    Once the outermost batch exits the following statistics are available:
+
+    notifications - Number of notifications deferred.
+    coalesced     - Number of those coalesced with an earlier notification.
+    callbacks     - Number of callbacks called.
+
+    They are None for nested batches.
+
+    Batches are not changed by wrapping.
+    """
+
+    def __init__(self):
+        self.notifications = None
+        self.coalesced = None
+        self.callbacks = None
+
+    def __enter__(self):
+        batch_begin()
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        r = batch_end()
+        if r is not None:
+            (self.notifications,self.coalesced,self.callbacks) = r
+        return False
+
+    def _apply_context(self,context):
+        return self
+
+    def _remove_context(self,context):
+        return self
@@ -30,6 +30,7 @@ import Tuke.context.wrapped_str_repr
 
 import Tuke.repr_helper
 from Tuke.context.wrapper import unwrap
+from Tuke.cached_attribute import cached_attribute
 
 def versions_compatible(cur,other):
     """Compare two versions and return compatibility.
@@ -50,6 +51,197 @@ def versions_compatible(cur,other):
     except (TypeError, IndexError):
         raise ValueError, 'Invalid version: %s, %s' % (cur,other)
 
+class _Subs(object):
+    """Insertion ordered sub-element container.
+
+    Maps sub-element Id names to the sub-elements themselves. Adds, removes and
+    lookups are O(1) and iteration is in insertion order.
+    """
+
+    __slots__ = ('_index','_order','_holes')
+
+    def __init__(self):
+        # name -> position in _order
+        self._index = {}
+
+        # (name,element) tuples, or None for removed entries
+        self._order = []
+        self._holes = 0
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self,name):
+        return name in self._index
+
+    def __getitem__(self,name):
+        return self._order[self._index[name]][1]
+
+    def get(self,name,default=None):
+        try:
+            return self._order[self._index[name]][1]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        for entry in self._order:
+            if entry is not None:
+                yield entry[1]
+
+    def add(self,name,elem):
+        assert name not in self._index
+        self._index[name] = len(self._order)
+        self._order.append((name,elem))
+
+    def remove(self,name):
+        """Remove name, returning the element"""
+        i = self._index.pop(name)
+        elem = self._order[i][1]
+        self._order[i] = None
+        self._holes += 1
+
+        # Compact once at least half of _order is holes, so removes stay O(1)
+        # amortized.
+        if self._holes * 2 >= len(self._order):
+            self._order = [entry for entry in self._order if entry is not None]
+            self._index = dict([(entry[0],i) for i,entry in enumerate(self._order)])
+            self._holes = 0
+        return elem
+
+class _Tree(object):
+    """State shared by every element in a tree.
+
+    root - The root element, unwrapped.
+    paths - Path index, maps the tuple of path segments from the root to every
+            sub-element in the tree.
+    connectivity - The connectivity engine of the tree, see Tuke.connects, or
+                   None if nothing in the tree has made a connection yet.
+    listeners - List of weakrefs to objects told about every graft and prune
+                in the tree, see listen().
+    """
+
+    __slots__ = ('root','paths','connectivity','listeners')
+
+    def __init__(self,root):
+        self.root = root
+        self.paths = {}
+        self.connectivity = None
+        self.listeners = []
+
+    def listen(self,listener):
+        """Tell listener about every graft and prune in the tree.
+
+        listener._tree_changed(paths,added) is called with the paths of every
+        sub-element added to, or removed from, the tree, the path of the
+        sub-element itself first. Only a weakref to listener is kept.
+        """
+        self.listeners.append(weakref.ref(listener))
+
+    def changed(self,paths,added):
+        """Call the listeners, see listen()"""
+        live = []
+        for ref in self.listeners:
+            listener = ref()
+            if listener is not None:
+                listener._tree_changed(paths,added)
+                live.append(ref)
+        self.listeners = live
+
+class WorldLayout(tuple,context.wrapper.Translatable):
+    """(geometry,transform) pair returned by Element.iterlayout_world()
+
+    geometry is the bare, unwrapped, geometry Element, and transform the
+    Transformation from it's local coordinates to those of the Element
+    iterated. Wrapping applies to the transform only.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls,geometry,transform):
+        return tuple.__new__(cls,(geometry,transform))
+
+    def _apply_context(self,elem):
+        return WorldLayout(self[0],self[1]._apply_context(elem))
+
+    def _remove_context(self,elem):
+        return WorldLayout(self[0],self[1]._remove_context(elem))
+
+class _Schema(object):
+    """Compiled per-class construction schema.
+
+    Everything Element.__new__ needs to know about a class, as opposed to
+    about the kwargs it was called with, is computed once and stored here.
+
+    required - Tuple of required kwargs.
+    defaults - Tuple of (kwarg,default) pairs.
+    valid - Frozenset of all valid kwargs.
+    version - The classes own __version__
+    version_error - Exception to raise if the classes __version__ is invalid,
+                    or None
+    inits - Tuple of _init functions, in the order they are to be called.
+
+    Note that _init functions are called once for every class in the mro that
+    defines _init, a class that doesn't define it's own _init does not cause
+    the inherited _init to be called a second time.
+    """
+
+    __slots__ = ('required','defaults','valid','version','version_error','inits')
+
+    def __init__(self,cls):
+        req = set()
+        d = {}
+        inits = []
+        for c in reversed(cls.__mro__):
+            req.update(c.__dict__.get('__required__',()))
+            d.update(c.__dict__.get('__defaults__',{}))
+
+            if issubclass(c,Element) and '_init' in c.__dict__:
+                inits.append(c.__dict__['_init'])
+
+        self.required = tuple(req)
+        self.defaults = tuple(d.items())
+        self.valid = frozenset(req) | frozenset(d.keys())
+        self.inits = tuple(inits)
+
+        self.version = cls.__dict__.get('__version__',(0,0))
+        self.version_error = None
+        try:
+            if not versions_compatible(self.version,self.version):
+                self.version_error = TypeError(
+                        "Incompatible versions: got %s but need %s to create a %s" % \
+                        (self.version,self.version,cls))
+        except ValueError, err:
+            self.version_error = err
+
+def _world_bbox_depends(self):
+    """Dependencies of Element._world_bbox"""
+    from Tuke.geometry import Geometry
+    if _own_layout(self):
+        yield '_world_transform'
+        for d in _own_layout_depends(self):
+            yield d
+    if not isinstance(self,Geometry):
+        for s in self._subs:
+            yield str(unwrap(s).__dict__['id']) + '/_world_bbox'
+
+def _union_bboxes(boxes):
+    """Return the bounding box of boxes, skipping None, None if empty"""
+    r = None
+    for b in boxes:
+        if b is None:
+            continue
+        elif r is None:
+            r = b
+        else:
+            r = (min(r[0],b[0]),min(r[1],b[1]),max(r[2],b[2]),max(r[3],b[3]))
+    return r
+
+def _bbox_in_region(bbox,region):
+    """True if bbox intersects region, False if bbox is None"""
+    return bbox is not None and \
+           bbox[0] <= region[2] and bbox[2] >= region[0] and \
+           bbox[1] <= region[3] and bbox[3] >= region[1]
+
 class Element(context.source.Source):
     """Base element class.
     
@@ -75,16 +267,31 @@ class Element(context.source.Source):
     __defaults__ = {'id':None,'transform':None,'connects':None}
     __version__ = (0,0)
 
+    # Elements that override iterlayout() may lay out geometry from more
+    # than their arguments, such as the positions of the Elements a Trace
+    # connects. Those dependencies, as given to cached_attribute(), go here,
+    # so cached bounding boxes and spatial indexes notice layout changes.
+    _layout_depends = ()
+
+    @classmethod
+    def _compile_schema(cls):
+        """Return the compiled construction schema for this class.
+
+        The schema is compiled the first time it's asked for and stored in the
+        class __dict__, subclasses get their own.
+        """
+        try:
+            return cls.__dict__['__schema__']
+        except KeyError:
+            schema = _Schema(cls)
+            cls.__schema__ = schema
+            return schema
+
     def _required_and_default_kwargs(self):
         """Return the required and default kwargs as a tuple."""
 
-        req = set()
-        d = {}
-        for cls in reversed(self.__class__.__mro__):
-            req.update(cls.__dict__.get('__required__',()))
-            d.update(cls.__dict__.get('__defaults__',{}))
-
-        return (req,d)
+        schema = self._compile_schema()
+        return (set(schema.required),dict(schema.defaults))
 
     def _repr_kwargs(self):
         """Return the list of kwargs needed to recreate the Element.
@@ -112,6 +319,9 @@ class Element(context.source.Source):
         self.__dict_shadow__['id'] = Tuke.Id('.')
         self.__dict_shadow__['transform'] = Transformation()
         self.parent = None
+        self._subs = _Subs()
+        self._tree = None
+        self._path = ()
 
         # Initialize from kwargs
         #
@@ -121,40 +331,84 @@ class Element(context.source.Source):
         # If a key is present in required, but not in kwargs, a TypeError will
         # be raised. If a key is present in kwargs, but not in required or
         # defaults, a TypeError will be raised.
+        #
+        # Everything that depends only on the class, rather than kwargs, is
+        # precompiled in the class schema, see _Schema.
+        try:
+            schema = cls.__dict__['__schema__']
+        except KeyError:
+            schema = cls._compile_schema()
 
         # Check that all versions are compatible.
-        cls_version_required = self.__class__.__dict__.get('__version__',(0,0))
-        cls_version_given = kwargs.get('__version__',cls_version_required)
-
-        if not versions_compatible(cls_version_required,cls_version_given):
-            raise TypeError, \
-                    "Incompatible versions: got %s but need %s to create a %s" % \
-                    (cls_version_given,cls_version_required,self.__class__)
-
+        if '__version__' in kwargs:
+            cls_version_given = kwargs['__version__']
+            if not versions_compatible(schema.version,cls_version_given):
+                raise TypeError, \
+                        "Incompatible versions: got %s but need %s to create a %s" % \
+                        (cls_version_given,schema.version,self.__class__)
+        elif schema.version_error is not None:
+            raise schema.version_error
 
         # Setup the dict with args from kwargs
-        req,df = self._required_and_default_kwargs() 
-       
-        valid = req | set(df.keys())
-        extra = set(kwargs.keys()).difference(valid)
-        if extra:
+        if not schema.valid.issuperset(kwargs):
+            extra = set(kwargs.keys()).difference(schema.valid)
             raise TypeError, 'Extra arguments %s' % str(extra)
 
-        for k in req:
+        for k in schema.required:
             try:
                 setattr(self,k,kwargs[k])
             except KeyError:
                 raise TypeError, 'Missing required argument %s' % k 
 
-        for k,d in df.items():
+        for k,d in schema.defaults:
             setattr(self,k,kwargs.get(k,d))
 
         # Call all the _init methods for all the classes.
-        for cls in reversed(self.__class__.__mro__):
-            if issubclass(cls,Element):
-                cls._init(self)
+        for init in schema.inits:
+            init(self)
         return context.wrapper.wrap(self,self)
 
+    @cached_attribute(depends=('transform',))
+    def _transform_inverse(self):
+        """Inverse of our transform"""
+        return self.__shadowless__.transform.I
+
+    @cached_attribute(depends=('transform','../_world_transform'))
+    def _world_transform(self):
+        """Composed transform from our coordinates to those of our root"""
+        t = self.__shadowless__.transform
+        parent = unwrap(self.parent)
+        if parent is not None:
+            t = parent._world_transform * t
+        return t
+
+    @cached_attribute(depends=('_subs',_world_bbox_depends))
+    def _world_bbox(self):
+        """Bounding box of our layout in the coordinates of our root"""
+        from Tuke.geometry import Geometry,Layer
+        from Tuke.spatial import layout_bbox
+        if isinstance(self,Geometry):
+            return layout_bbox(WorldLayout(self,self._world_transform))
+        elif _own_layout(self):
+            t = self._world_transform
+            return _union_bboxes(
+                    [layout_bbox(WorldLayout(unwrap(g),t * g.transform))
+                     for g in self.iterlayout(Layer('*'))])
+        else:
+            return _union_bboxes([unwrap(s)._world_bbox for s in self._subs])
+
+    def bbox(self):
+        """Return the bounding box of our layout.
+
+        The box is (xmin,ymin,xmax,ymax), in world coordinates, those of the
+        root of our tree, or None if we have no layout. It's computed bottom
+        up, from the bounding boxes of our sub-elements, and cached until a
+        transform, the arguments of a geometry, the sub-elements of any
+        element below us, or anything the layout of an element responsible
+        for it's own layout depends on, see _layout_depends, change.
+        """
+        return self._world_bbox
+
     def _init(self):
         import Tuke
         if not self.__dict__['id']:
@@ -173,6 +427,22 @@ class Element(context.source.Source):
             self.connects = Tuke.Connects()
         self.connects.parent = self
 
+        # Replacing connects has to take the old connections out of the
+        # connectivity engine.
+        self._bound_connects = self.connects
+        self.subscribe('connects',self._connects_replaced)
+
+    def _connects_replaced(self):
+        old = self._bound_connects
+        new = self.connects
+        if new is old:
+            return
+        if old is not None:
+            old._disconnect_all()
+        self._bound_connects = new
+        if new is not None:
+            new.parent = self
+
     # Some notes on the sub-elements implementation:
     #
     # It can be assumed that there will be a *lot* of sub-element lookups, both
@@ -181,15 +451,34 @@ class Element(context.source.Source):
     # their own ready made dict, __dict__ There is no reason why we can't put
     # anything we want in there, including sub-elements, so long as we're
     # careful to handle name collisions consistantly.
+    #
+    # That takes care of foo.bar, however __dict__ is also full of everything
+    # else, so iterating through it to find the sub-elements, or checking
+    # attributes for collisions, gets slow for Elements with thousands of
+    # sub-elements. So the sub-elements are also kept in their own container,
+    # _subs, which maps Id names to sub-elements in insertion order. Iteration
+    # and foo[] lookups use _subs exclusively.
+    #
+    # Deep lookups, foo['a/b/c'], would still have to go through every level
+    # of the tree, so every tree also has a path index, which maps the tuple of
+    # path segments from the root to every element in the tree. The index is
+    # kept in a _Tree object shared by every element in the tree, _tree, and
+    # each element knows it's own path from the root, _path, so a deep lookup
+    # is a single dict lookup. A lone element that has never had sub-elements
+    # added, or made a connection, doesn't have a _Tree, _tree is None.
+    #
+    # The index is maintained by add() and remove(), when a tree is added to
+    # another tree it's index is merged into the new root's index, and when a
+    # sub-tree is removed it's entries are split out into an index of it's
+    # own. Both are O(size of the sub-tree), independent of the size of the
+    # rest of the tree.
 
     def __iter__(self):
-        """Iterate through sub-elements."""
+        """Iterate through sub-elements.
 
-        for k,v in self.__dict__.iteritems():
-            if k == 'parent':
-                continue
-            if isinstance(v,Element):
-                yield v 
+        Sub-elements are returned in the order they were added.
+        """
+        return iter(self._subs)
 
     def _element_id_to_dict_key(self,id):
         """Returns the dict key that Element id should be stored under.
@@ -215,24 +504,53 @@ class Element(context.source.Source):
 
         if not id:
             return self
-        else:
-            r = None
-            if id[0] == Tuke.Id('..'):
-                if self.parent is not None:
-                    r = self.parent
-                else:
-                    raise KeyError("Element '%s' has no parent" % 
-                                    self.__shadowless__.id)
-            else:
-                try:
-                    r = getattr(self,self._element_id_to_dict_key(id[0]))
-                except AttributeError:
-                    raise KeyError("'%s' is not a sub-Element of '%s'" %
-                                    (id,self.__shadowless__.id))
-            if len(id) > 1:
-                return r[str(id[1:])]
+        elif tuple.__getitem__(id,0) == '..':
+            if self.parent is None:
+                raise KeyError("Element '%s' has no parent" % 
+                                self.__shadowless__.id)
+            elif len(id) > 1:
+                return self.parent[str(id[1:])]
             else:
-                return r
+                return self.parent
+        elif len(id) == 1:
+            try:
+                return self._subs[tuple.__getitem__(id,0)]
+            except KeyError:
+                raise KeyError("'%s' is not a sub-Element of '%s'" %
+                                (id,self.__shadowless__.id))
+        else:
+            return self._lookup_path(id)
+
+    def _lookup_path(self,id):
+        """Lookup a multi-segment, downwards, Id using the path index.
+
+        The result is wrapped in every element between self and it, exactly as
+        if each path segment had been looked up in turn.
+        """
+        from Tuke.context.wrapper import wrap
+
+        base = self._path
+        key = base + tuple(tuple.__iter__(id))
+        paths = None
+        if self._tree is not None:
+            paths = self._tree.paths
+        if paths is not None and key in paths:
+            r = paths[key]
+        else:
+            # Find the first missing path segment for the error message.
+            e = self
+            for i in xrange(len(id)):
+                sub = e._subs.get(tuple.__getitem__(id,i))
+                if sub is None:
+                    break
+                e = unwrap(sub)
+            raise KeyError("'%s' is not a sub-Element of '%s'" %
+                           (id[i:],e.__shadowless__.id))
+
+        # Apply the context of every intermediate element, innermost first.
+        for l in xrange(len(key) - 1,len(base),-1):
+            r = wrap(r,unwrap(paths[key[:l]]))
+        return r
 
     class IdCollisionError(IndexError):
         pass
@@ -257,29 +575,182 @@ class Element(context.source.Source):
         if obj.parent:
             raise ValueError, "'%s' already has parent '%s'" % (obj,obj.parent)
 
+        name = str(obj.id)
+        if name in self._subs:
+            raise self.IdCollisionError,"'%s' already exists" % name
+
         n = self._element_id_to_dict_key(obj.id)
 
-        if hasattr(self,n):
-            raise self.IdCollisionError,"'%s' already exists" % str(obj.id)
+        self._graft(name,obj)
 
         obj.parent = self
+        self._subs.add(name,obj)
         setattr(self,n,obj)
+        self.touch('_subs')
 
         return obj
 
-    def topology_notify(self,filter,callback):
-        """Notify on topology changes.
+    def _get_tree(self):
+        """Return our _Tree, creating it if we don't have one yet."""
+        tree = self._tree
+        if tree is None:
+            # Only possible if we're a root, sub-elements share their root's
+            # _Tree.
+            tree = self._tree = _Tree(self)
+        return tree
 
-        filter - Path to filter by, must be a single path segment, either
-                 referring to a sub-element, or referring to the parent, Id('..')
+    def _graft(self,name,obj):
+        """Merge the _Tree of obj into ours.
 
-        callback - The callback. A weakref if callable is made, a reference to
-                   callable must be kept elsewhere.
+        obj is about to be added as sub-element name.
+        """
+        tree = self._get_tree()
+        paths = tree.paths
 
-        The callbacks are one-shot, after they are called they are removed. The
-        callback may create another notify again however.
+        prefix = self._path + (name,)
+
+        raw = unwrap(obj)
+        sub_tree = raw._tree
+        raw._tree = tree
+        raw._path = prefix
+        paths[prefix] = obj
+
+        new_paths = [prefix]
+        if sub_tree is not None:
+            for path,e in sub_tree.paths.iteritems():
+                e_raw = unwrap(e)
+                e_raw._tree = tree
+                e_raw._path = prefix + path
+                paths[prefix + path] = e
+                new_paths.append(prefix + path)
 
+        if tree.listeners:
+            tree.changed(new_paths,True)
+
+        if tree.connectivity is not None or \
+           (sub_tree is not None and sub_tree.connectivity is not None):
+            from Tuke.connects import _connectivity
+            _connectivity(self).graft(prefix,new_paths,sub_tree)
+
+    def remove(self,obj):
+        """Remove sub-element.
+
+        obj - The sub-element, or it's Id.
+
+        Returns the removed element, wrapped only in itself, ready to be added
+        to another Element. Topology notifications are fired for both the
+        sub-element and it's former parent, '..'.
+
+        Raises KeyError if obj is not a sub-element.
+        """
+
+        # NOTE: Element.remove is special cased by the wrapper code. The
+        # returned element does not have the wrapping context applied to it
+        # like normal. See wrapper.c for details.
+        if isinstance(obj,Element):
+            raw = unwrap(obj)
+            name = str(raw.__dict__['id'])
+            if unwrap(self._subs.get(name)) is not raw:
+                raise KeyError("'%s' is not a sub-Element of '%s'" %
+                                (name,self.__shadowless__.id))
+        else:
+            name = Tuke.Id(obj)
+            if len(name) != 1 or name == Tuke.Id('..'):
+                raise KeyError("'%s' is not a sub-Element of '%s'" %
+                                (name,self.__shadowless__.id))
+            name = str(name)
+            if name not in self._subs:
+                raise KeyError("'%s' is not a sub-Element of '%s'" %
+                                (name,self.__shadowless__.id))
+
+        obj = self._subs.remove(name)
+        raw = unwrap(obj)
+
+        self._prune(raw)
+
+        # The sub-element is stored under the collided key if an attribute
+        # already had it's name when it was added.
+        n = name
+        if unwrap(self.__dict__.get(n)) is not raw:
+            n = '_attr_collided_' + name
+        delattr(self,n)
+        self.touch('_subs')
+
+        raw.parent = None
+
+        return obj
+
+    def move(self,obj,new_parent):
+        """Move sub-element to a new parent.
+
+        obj - The sub-element, or it's Id.
+        new_parent - The Element obj is to be added to.
+
+        Equivalent to new_parent.add(self.remove(obj)), returns obj correctly
+        wrapped in new_parent.
+        """
+        return new_parent.add(self.remove(obj))
+
+    def _prune(self,raw):
+        """Split the sub-tree rooted at raw out of our _Tree.
+
+        raw - The unwrapped sub-element being removed.
+        """
+        tree = self._tree
+        paths = tree.paths
+        prefix = raw._path
+        l = len(prefix)
+
+        sub_tree = _Tree(raw)
+        sub_paths = sub_tree.paths
+        elems = set((raw,))
+        old_paths = [prefix]
+        stack = list(raw._subs)
+        while stack:
+            e = stack.pop()
+            e_raw = unwrap(e)
+            path = e_raw._path
+            old_paths.append(path)
+            del paths[path]
+            e_raw._tree = sub_tree
+            e_raw._path = path[l:]
+            sub_paths[path[l:]] = e
+            elems.add(e_raw)
+            stack.extend(e_raw._subs)
+
+        del paths[prefix]
+        raw._tree = sub_tree
+        raw._path = ()
+
+        if tree.listeners:
+            tree.changed(old_paths,False)
+
+        if tree.connectivity is not None:
+            tree.connectivity.prune(sub_tree,elems)
+
+    def netlist(self):
+        """Return the Netlist of this Element and it's sub-elements.
+
+        See Tuke.netlist for details. The Netlist is cached until a topology,
+        or connects, change invalidates it.
+        """
+        import Tuke.netlist
+        return Tuke.netlist.netlist(self)
+
+    def batch(self):
+        """Batch notifications for bulk changes.
+
+        Returns a Batch context manager, within it notification callbacks,
+        including topology_notify() callbacks, are deferred until the
+        outermost batch exits, and repeated changes are coalesced so each
+        callback is called at most once. Note that batching applies to all
+        Elements, not just this one and it's sub-elements.
+
+        See Tuke.context.source.Batch for details.
         """
+        return context.source.Batch()
+
+    def _topology_filter(self,filter):
         if not isinstance(filter,Tuke.Id):
             raise TypeError(
                     "Filter must be an an Id, not '%s'" % type(filter))
@@ -294,32 +765,241 @@ class Element(context.source.Source):
         filter = str(filter)
         if filter == '..':
             filter = 'parent'
+        return filter
+
+    def topology_notify(self,filter,callback):
+        """Notify on topology changes.
+
+        filter - Path to filter by, must be a single path segment, either
+                 referring to a sub-element, or referring to the parent, Id('..')
+
+        callback - The callback. A weakref if callable is made, a reference to
+                   callable must be kept elsewhere.
+
+        The callbacks are one-shot, after they are called they are removed. The
+        callback may create another notify again however.
+
+        """
+        self.notify(self._topology_filter(filter),callback)
+
+    def topology_subscribe(self,filter,callback):
+        """Subscribe to topology changes.
+
+        filter - As in topology_notify()
 
-        self.notify(filter,callback)
+        callback - The callback, a strong reference is kept.
 
-    def iterlayout(self,layer_mask = None):
+        Unlike topology_notify() the subscription is persistent, callback is
+        called on every change until the returned handle is called to
+        unsubscribe.
+        """
+        return self.subscribe(self._topology_filter(filter),callback)
+
+    def walk(self,order='pre',prune=None,types=None):
+        """Iterate through all sub-elements, at any depth.
+
+        order - 'pre' for depth-first with every element before it's
+                sub-elements, 'post' for depth-first with every element after
+                it's sub-elements, or 'bfs' for breadth-first. Sub-elements are
+                always visited in the order they were added.
+        prune - Optional callable, called with every element, if it returns
+                true the element's sub-elements are skipped. The element itself
+                is still returned.
+        types - Optional class, or tuple of classes, only elements that are
+                instances are returned. Other elements are still descended
+                into.
+
+        Elements are wrapped exactly as if they had been looked up through
+        every intermediate element. The traversal uses an explicit stack, so
+        the cost per element doesn't depend on the depth of the tree, and deep
+        trees don't run into the recursion limit.
+        """
+        from Tuke.context.wrapper import wrap
+
+        if order not in ('pre','post','bfs'):
+            raise ValueError("Unknown walk order '%s'" % order)
+
+        # Every element is wrapped in the context of it's parent, already
+        # wrapped in our context, which is a single wrap no matter the depth.
+        # Our own sub-elements are already in our context.
+        def subs(e,raw):
+            if e is None:
+                return [(s,unwrap(s)) for s in raw._subs]
+            else:
+                return [(wrap(s,e),unwrap(s)) for s in raw._subs]
+
+        if order == 'bfs':
+            queue = deque(subs(None,self))
+            while queue:
+                e,raw = queue.popleft()
+                if types is None or isinstance(raw,types):
+                    yield e
+                if raw._subs and (prune is None or not prune(e)):
+                    queue.extend(subs(e,raw))
+
+        elif order == 'pre':
+            stack = subs(None,self)
+            stack.reverse()
+            while stack:
+                e,raw = stack.pop()
+                if types is None or isinstance(raw,types):
+                    yield e
+                if raw._subs and (prune is None or not prune(e)):
+                    s = subs(e,raw)
+                    s.reverse()
+                    stack.extend(s)
+
+        else:
+            # Elements are pushed twice, the second time, with expanded set,
+            # after their sub-elements have been returned.
+            stack = [(e,raw,False) for e,raw in subs(None,self)]
+            stack.reverse()
+            while stack:
+                e,raw,expanded = stack.pop()
+                if not expanded and raw._subs \
+                   and (prune is None or not prune(e)):
+                    stack.append((e,raw,True))
+                    s = [(e2,raw2,False) for e2,raw2 in subs(e,raw)]
+                    s.reverse()
+                    stack.extend(s)
+                elif types is None or isinstance(raw,types):
+                    yield e
+
+    def iterlayout(self,layer_mask = None,region = None):
         """Iterate through layout.
 
         Layout iteration is done depth first filtering the results with the
         layer_mask. All geometry transforms are handled transparently.
+
+        region - Optional (xmin,ymin,xmax,ymax) box, in world coordinates, see
+                 bbox(). Sub-elements whose bounding box doesn't intersect it
+                 are skipped, along with everything below them.
+
+        Sub-elements that override iterlayout() are responsible for their own
+        layout.
         """
      
         # We can't import Tuke.geometry earlier, due to circular imports, hence
         # the weird layer_mask = None type junk.
-        from Tuke.geometry import Layer
+        from Tuke.geometry import Layer,Geometry
         if not layer_mask:
             layer_mask = '*'
         layer_mask = Layer(layer_mask)
 
-        for s in self:
-            from Tuke.geometry import Geometry
-            if isinstance(s,Geometry):
-                if s.layer in layer_mask:
-                    yield s
-            else:
-                for l in s.iterlayout(layer_mask):
+        def own_layout(e):
+            return _own_layout(unwrap(e))
+
+        def culled(e):
+            return not _bbox_in_region(unwrap(e)._world_bbox,region)
+
+        prune = own_layout
+        if region is not None:
+            def prune(e):
+                return culled(e) or own_layout(e)
+
+        for e in self.walk(prune=prune):
+            if region is not None and culled(e):
+                continue
+            if isinstance(unwrap(e),Geometry):
+                if e.layer in layer_mask:
+                    yield e
+            elif own_layout(e):
+                for l in e.iterlayout(layer_mask):
                     yield l
 
+    def iterlayout_world(self,layer_mask = None,region = None):
+        """Iterate through layout, with world transforms.
+
+        Like iterlayout(), but yields WorldLayout (geometry,transform) pairs,
+        where geometry is unwrapped, and transform maps it's local coordinates
+        to ours. The transforms are composed once per level on the way down,
+        so exporters can transform every vertex of a geometry with a single
+        Transformation, rather than through every level of wrapping for every
+        vertex.
+
+        region culls sub-elements as in iterlayout(), it's in world
+        coordinates, not ours, if they differ.
+        """
+        from Tuke.geometry import Layer,Geometry
+        if not layer_mask:
+            layer_mask = '*'
+        layer_mask = Layer(layer_mask)
+
+        # (raw element,transform of it's parent) pairs, None standing in for
+        # our own, identity, transform.
+        stack = [(unwrap(s),None) for s in self._subs]
+        stack.reverse()
+        while stack:
+            raw,parent_transform = stack.pop()
+            if region is not None and \
+                    not _bbox_in_region(raw._world_bbox,region):
+                continue
+            transform = raw.__shadowless__.transform
+            if parent_transform is not None:
+                transform = parent_transform * transform
+
+            if isinstance(raw,Geometry):
+                if raw.layer in layer_mask:
+                    yield WorldLayout(raw,transform)
+            elif _own_layout(raw):
+                # Whatever iterlayout() yields is in raw's context.
+                for g in raw.iterlayout(layer_mask):
+                    yield WorldLayout(unwrap(g),transform * g.transform)
+            elif raw._subs:
+                s = [(unwrap(sub),transform) for sub in raw._subs]
+                s.reverse()
+                stack.extend(s)
+
+    def iterlayout_demux(self,masks):
+        """Iterate through layout, routing it to outputs by layer.
+
+        masks - Mapping of output names to layer masks, or a LayerDemux.
+
+        Traverses the layout once, as iterlayout_world() does, yielding
+        (outputs,WorldLayout) pairs, where outputs is a tuple of the names of
+        every output whose mask matches the layer of the geometry. Geometry
+        that matches no output is skipped. Use this, rather than calling
+        iterlayout() once for each mask, when exporting several outputs at
+        once.
+        """
+        from Tuke.geometry import LayerDemux
+        if not isinstance(masks,LayerDemux):
+            masks = LayerDemux(masks)
+
+        for l in self.iterlayout_world():
+            outputs = masks(l[0].layer)
+            if outputs:
+                yield outputs,l
+
+    def pick(self,point,layer_mask = None,tolerance = 0):
+        """Return the geometry at a point.
+
+        point - V, like any other geometry passed to an Element it's in the
+                coordinates we're seen in.
+        layer_mask - Only geometry on matching layers is returned.
+        tolerance - Geometry this close to point is returned as well.
+
+        Returns a list of the geometry elements whose rendered geometry
+        contains point, in the order iterlayout() returns them. The cached
+        bounding boxes of the element tree are used as a bounding volume
+        hierarchy, only geometry whose bounding box is within tolerance of
+        point is rendered and tested exactly.
+        """
+        from Tuke.spatial import layout_contains
+
+        # Everything is tested in world coordinates, as bounding boxes are.
+        world = self._world_transform
+        p = world(point)
+        (x,y) = (float(p[0,0]),float(p[0,1]))
+        region = (x - tolerance,y - tolerance,x + tolerance,y + tolerance)
+
+        r = []
+        for g in self.iterlayout(layer_mask,region=region):
+            l = WorldLayout(unwrap(g),world * g.transform)
+            if layout_contains(l,(x,y),tolerance):
+                r.append(g)
+        return r
+
     def _common_parent(self,b):
         a = unwrap(self)
         b = unwrap(b)
@@ -372,66 +1052,81 @@ class Element(context.source.Source):
         return ((),kwargs)
     __repr__ = Tuke.context.wrapped_str_repr.unwrapped_repr
 
-    def serialize(self,
-                  f,
-                  full=False,
-                  indent=None,
-                  level=0):
+    def serialize(self,f,full=False):
         """Serialize the Element and it's sub-Elements."""
 
-        if indent is None:
-            f.write("""\
+        f.write("""\
 from __future__ import with_statement
 import Tuke
 
 """)
-            indent = []
-            self.serialize(f,full,indent=[],level=0)
-        else:
-            def out(s):
-                for i in indent:
-                    f.write(i)
-                f.write(s)
-
-            from Tuke.repr_helper import shortest_class_name
-            cname = shortest_class_name(self.__class__)
-            s = '%s = %s(' % (self.__shadowless__.id,cname)
-            out(s)
-            indent.append(' ' * len(s))
-
-            kw = self._repr_kwargs()
-            kw['id'] = self.__shadowless__.id
-            kw['transform'] = self.__shadowless__.transform
-
-            first = True
-            for n,v in sorted(kw.iteritems()):
-                if not first:
-                    f.write(',\n')
-                    out('%s=%s' % (n,repr(v)))
-                else:
-                    first = False
-                    f.write('%s=%s' % (n,repr(v)))
-
-            f.write('); ')
-            if level > 0:
-                f.write('__%d.add(%s)\n' % (level,self.__shadowless__.id))
+
+        def pruned(e):
+            return not full and isinstance(unwrap(e),ReprableByArgsElement)
+
+        self._serialize_element(f,0,not pruned(self))
+
+        # Sub-elements are serialized in the order they were added.
+        base = len(self._path)
+        for e in self.walk(prune=pruned):
+            raw = unwrap(e)
+            raw._serialize_element(f,len(raw._path) - base,not pruned(e))
+
+    def _serialize_element(self,f,level,with_subs):
+        """Serialize the Element itself.
+
+        level - Depth below the Element being serialized.
+        with_subs - Start a with block for the sub-elements, if any.
+        """
+        indent = '    ' * level
+        id = self.__shadowless__.id
+
+        from Tuke.repr_helper import shortest_class_name
+        cname = shortest_class_name(self.__class__)
+        s = '%s = %s(' % (id,cname)
+        f.write(indent + s)
+        continuation = indent + ' ' * len(s)
+
+        kw = self._repr_kwargs()
+        kw['id'] = id
+        kw['transform'] = self.__shadowless__.transform
+
+        first = True
+        for n,v in sorted(kw.iteritems()):
+            if not first:
+                f.write(',\n')
+                f.write(continuation)
             else:
-                f.write('__%d = %s\n' % (level,self.__shadowless__.id))
-            indent.pop()
-
-            if not isinstance(self,ReprableByArgsElement) or full:
-                subs = []
-                for e in self: 
-                    if isinstance(e,Element):
-                        subs.append(e)
-                subs.sort(key=lambda e: e.id)
-
-                if subs:
-                    out('with %s as __%d:\n' % (self.__shadowless__.id,level + 1))
-                    for e in subs:
-                        unwrap(e).serialize(f,full,
-                                            indent=indent + ['    ',],
-                                            level=level + 1)
+                first = False
+            f.write('%s=%s' % (n,repr(v)))
+
+        f.write('); ')
+        if level > 0:
+            f.write('__%d.add(%s)\n' % (level,id))
+        else:
+            f.write('__%d = %s\n' % (level,id))
+
+        if with_subs and self._subs:
+            f.write('%swith %s as __%d:\n' % (indent,id,level + 1))
+
+def _own_layout(raw):
+    """True if raw is responsible for it's own layout in iterlayout()"""
+    from Tuke.geometry import Geometry
+    return isinstance(raw,Geometry) \
+           or type(raw).iterlayout.im_func is not Element.iterlayout.im_func
+
+def _own_layout_depends(raw):
+    """Dependencies of the layout of raw, which is responsible for it's own
+    layout, in it's own coordinates."""
+    for k in raw._compile_schema().valid:
+        if k not in ('id','transform','connects'):
+            yield k
+    for d in raw._layout_depends:
+        if callable(d):
+            for x in d(raw):
+                yield x
+        else:
+            yield d
 
 class ReprableByArgsElement(Element):
     """Base class for Elements fully representable by their arguments."""
@@ -440,3 +1135,4 @@ class ReprableByArgsElement(Element):
 class SingleElement(Element):
     """Base class for elements without subelements."""
     add = None
+    remove = None
@@ -17,23 +17,49 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # ### BOILERPLATE ###
 
-from Tuke.geometry import Hole,centerof
+import Tuke
+from Tuke.geometry import Circle,Hole,LayerDemux,V,VArray
+from Tuke.geometry.circle import render_circles
 from Tuke.units import IN,MIL
+from Tuke.context.wrapper import unwrap
 
 import shapely.geometry
 
-def to_gerber(elem):
+def to_gerber(elem,masks=None):
     """Exports an element to gerber RS274X
     
     Returns a dict of the different layers encountered.
+
+    masks - Optional mapping of output names to layer masks. If given the
+            returned dict has an entry for each output with geometry whose
+            layer matches, rather than one for each layer encountered.
+            Geometry goes to every output it matches, and the design is still
+            only traversed once. Holes always go to 'drill'.
     """
 
     layers = {}
 
+    if masks is not None:
+        route = LayerDemux(masks)
+    else:
+        def route(layer):
+            return (str(layer),)
+
     # key is size, value is list of vertexes
     drill_hits = {}
 
-    for g in elem.iterlayout():
+    base = unwrap(elem)._path
+    def idof(g):
+        """Id of bare geometry g, as it would be seen from outside elem"""
+        return elem.id + Tuke.Id('/'.join(g._path[len(base):]))
+
+    layout = list(elem.iterlayout_world())
+
+    # Circles are rendered all at once, subclasses may render differently.
+    circles = [g for g,world in layout if type(g) is Circle]
+    rendered = dict(zip([id(c) for c in circles],render_circles(circles)))
+
+    for g,world in layout:
         def s(n):
             """Convert float n meters to gerber 3.5 format, (inches) leading zeros removed"""
            
@@ -43,33 +69,40 @@ def to_gerber(elem):
             return str(int(n))
 
         if hasattr(g,'render'):
-            (coords,ext_coords) = g.render()
+            outputs = route(g.layer)
+            if not outputs:
+                continue
 
-            l = str(g.layer)
-
-            # convert coords to mm
-            def t(v):
-                return (s(v[0,0]),s(v[0,1]))
-            coords = [t(v) for v in coords]
+            try:
+                (coords,ext_coords) = rendered[id(g)]
+            except KeyError:
+                (coords,ext_coords) = g.render()
 
-            # Create gerber layers for each element layer.
-            if not layers.has_key(l):
-                layers[l] = ''
+            # convert coords to mm, transforming them all at once
+            coords = [(s(x),s(y)) for x,y in world(VArray(coords)).tolist()]
 
             # Comment for debugging
-            layers[l] += 'G04 id: %s *\n' % str(g.id)
+            t = ['G04 id: %s *\n' % str(idof(g))]
 
             # start Polygon Area Fill code
-            layers[l] += 'G36*\n'
+            t.append('G36*\n')
 
             # first vertex gets repeated to close the polygon
-            layers[l] += 'X%sY%sD02\n' % (str(coords[0][1]),str(coords[0][1]))
+            t.append('X%sY%sD02\n' % (str(coords[0][1]),str(coords[0][1])))
 
             # rest of the vertexes are handled normally
             for (x,y) in coords:
-                layers[l] += 'X%sY%sD01*\n' % (str(x),str(y))
+                t.append('X%sY%sD01*\n' % (str(x),str(y)))
+
+            t.append('G37*\n')
+            t = ''.join(t)
 
-            layers[l] += 'G37*\n'
+            # Create gerber layers for each output.
+            for l in outputs:
+                try:
+                    layers[l] += t
+                except KeyError:
+                    layers[l] = t
         elif isinstance(g,Hole):
             l = None
             # dia is expressed as 0.000 in inches
@@ -79,7 +112,7 @@ def to_gerber(elem):
             except KeyError:
                 l = []
                 drill_hits[dia] = l
-            l.append(centerof(g))
+            l.append(world(V(0,0)))
 
     # add program end markers to all layers
     for l in layers.keys():
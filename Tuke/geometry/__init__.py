@@ -19,8 +19,8 @@
 
 
 # Ordering is important for these three
-from v import V
-from layer import Layer
+from v import V,VArray
+from layer import Layer,LayerDemux
 from transform import Transformation,Translation,translate,Rotation,rotate,RotationAroundCenter,rotate_around_center,Scale,scale
 from geometry import Geometry
 
@@ -17,25 +17,112 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # ### BOILERPLATE ###
 
-from Tuke.geometry import Geometry,V
+from Tuke.geometry import Geometry,VArray
+from Tuke.geometry.render_cache import cached_render,render_cache
 
-from math import sin,cos,pi
+from Tuke.units import MM
+
+from math import sin,cos,acos,pi,ceil
+
+from numpy import array,asarray
+
+# Default maximum chord error, in meters, when approximating arcs by segments.
+# See arc_segments()
+arc_tolerance = 0.005 * MM
+
+def arc_segments(r,angle,tolerance=None):
+    """Number of segments needed to approximate an arc.
+
+    r - Radius of the arc
+    angle - Angle the arc spans
+    tolerance - Maximum distance between the true arc and any of the segments
+                approximating it, arc_tolerance if not specified.
+
+    No segment will span more than a quarter circle, regardless of tolerance.
+    """
+    if tolerance is None:
+        tolerance = arc_tolerance
+    if not tolerance > 0:
+        raise ValueError, 'Tolerance must be greater than zero: %r' % tolerance
+    angle = abs(angle)
+
+    n = int(ceil(angle / (pi / 2) - 1e-9))
+    if tolerance < r:
+        # A chord spanning angle t is r * (1 - cos(t / 2)) from the arc at
+        # it's furthest.
+        n = max(n,int(ceil(angle / (2 * acos(1 - tolerance / r)) - 1e-9)))
+    return max(n,1)
+
+# Cache of unit_arc() tables, keyed by (a,b,segments). Line end caps are at
+# arbitrary angles, so the cache is simply emptied if it grows too large.
+_unit_arcs = {}
+_unit_arcs_max = 1024
+
+def unit_arc(a,b,segments):
+    """Return the vertexes of an arc from a to b on the unit circle.
+
+    The result is a read-only (segments + 1)x2 array, cached, so scale and
+    offset it rather than modifying it.
+    """
+    key = (a,b,segments)
+    try:
+        return _unit_arcs[key]
+    except KeyError:
+        assert(segments > 0)
+        assert(a != b)
+
+        t = []
+
+        i = a
+        for j in range(segments + 1):
+            t.append((cos(i),sin(i)))
+
+            i += abs(b - a) / segments
+
+        t = array(t)
+        t.flags.writeable = False
+
+        if len(_unit_arcs) >= _unit_arcs_max:
+            _unit_arcs.clear()
+        _unit_arcs[key] = t
+        return t
 
 def arc_points(a,b,r,segments):
-    """Approximates an arc from a to b with a given radius and a specified number of segments. Returns a tuple of vertexes."""
-    assert(segments > 0)
-    assert(a != b)
+    """Approximates an arc from a to b with a given radius and a specified number of segments. Returns a VArray of vertexes."""
     assert(r)
 
-    t = []
+    return (unit_arc(a,b,segments) * r).view(VArray)
 
-    i = a
-    for j in range(segments + 1):
-        t += [V(cos(i) * r,sin(i) * r)]
+def render_circles(circles,tolerance=None):
+    """Render bare Circles all at once.
 
-        i += abs(b - a) / segments
+    Equivalent to [c.render(tolerance) for c in circles], including sharing
+    results through render_cache, but the vertexes of every circle not already
+    cached with the same number of segments are generated in a single
+    vectorized pass.
+    """
+    keys = [(c.__class__,) + c._render_key(tolerance) for c in circles]
 
-    return t
+    # Look up each distinct key once, grouping the misses by number of
+    # segments. Keys are (class,radius,segments), see Circle._render_key()
+    found = {}
+    groups = {}
+    for key in keys:
+        if key in found:
+            continue
+        try:
+            found[key] = render_cache.get(key)
+        except KeyError:
+            found[key] = None
+            groups.setdefault(key[2],[]).append(key)
+
+    for segments,group in groups.iteritems():
+        r = asarray([key[1] for key in group])
+        vs = unit_arc(0,2*pi,segments)[None,:,:] * r[:,None,None]
+        for key,v in zip(group,vs):
+            found[key] = render_cache.put(key,(v.view(VArray),()))
+
+    return [found[key] for key in keys]
 
 class Circle(Geometry):
     """A circle with a specified diameter."""
@@ -47,7 +134,17 @@ class Circle(Geometry):
         if not self.dia > 0:
             raise ValueError, 'Diameter must be greater than zero: %d' % dia
 
-    def render(self):
-        v = arc_points(0,2*pi,self.dia / 2,32)
+    def _render_key(self,tolerance=None):
+        r = self.dia / 2
+        return (r,arc_segments(r,2*pi,tolerance))
+
+    @cached_render
+    def render(self,tolerance=None):
+        """Render the circle
+
+        tolerance - Maximum chord error, see arc_segments()
+        """
+        r,segments = self._render_key(tolerance)
+        v = arc_points(0,2*pi,r,segments)
 
         return (v,()) 
@@ -19,6 +19,35 @@
 
 import Tuke.repr_helper
 
+# Registry of every Layer created, interned by name, and by id.
+_layers = {}
+_layers_by_id = []
+
+def _match(a,b):
+    """Glob match the segments of two layer names"""
+
+    # Special case first, if a and b are of a different length, last entry of
+    # the shorter must be * for them to match. The zip() won't catch that due
+    # to it's truncated behavior.
+    if len(a) != len(b):
+        if len(a) < len(b):
+            shorter = a
+        else:
+            shorter = b
+        if '*' not in shorter[-1]:
+            return False
+
+    for (x,y) in zip(a,b):
+        if x == y:
+            continue
+
+        if '*' in (x,y):
+            continue
+
+        return False
+
+    return True
+
 class Layer(str):
     """Layer identifiers.
 
@@ -36,15 +65,24 @@ class Layer(str):
     pcb.*.drill <- note glob usage
 
     sch.net <- for schematic drawings
+
+    Layers are interned, creating a Layer with the same name as an existing one
+    returns the existing one, and each is given a compact integer id. When a
+    Layer is used as a mask, with the in operator, it compiles a bitmask of the
+    ids of every layer it matches, so membership is a single integer test.
     """
 
-    def __init__(self,n):
+    def __new__(cls,n):
         """Create a new Layer identifier"""
-  
+        try:
+            return _layers[n]
+        except (KeyError,TypeError):
+            pass
+
         if not isinstance(n,str):
             raise TypeError, 'Layer got %s, expected string' % type(n)
 
-        bits = self.split('.')
+        bits = n.split('.')
 
         def T(x):
             if not x:
@@ -54,37 +92,125 @@ class Layer(str):
             T(b)
             T('*' not in b or b == '*')
 
-        self = n
+        self = str.__new__(cls,n)
+        self._id = len(_layers_by_id)
+        self._parts = tuple(bits)
+
+        # Bitmask of the ids of the layers this one matches, out of the first
+        # _known layers.
+        self._mask = 0
+        self._known = 0
+
+        _layers[str(n)] = self
+        _layers_by_id.append(self)
+        return self
+
+    def _compile(self):
+        """Add layers created since the last compile to our bitmask"""
+        mask = self._mask
+        parts = self._parts
+        for other in _layers_by_id[self._known:]:
+            if _match(parts,other._parts):
+                mask |= 1 << other._id
+        self._mask = mask
+        self._known = len(_layers_by_id)
 
     def __contains__(self,other):
-        if self == other:
+        if self is other:
             return True
+        elif other.__class__ is not Layer:
+            other = Layer(other)
 
-        self = self.split('.')
-        other = other.split('.')
+        i = other._id
+        if i >= self._known:
+            self._compile()
+        return (self._mask >> i) & 1 == 1
 
-        # Special case first, if self and other are of a different length, last
-        # entry of the shorter must be * for contains to be true. The zip()
-        # won't catch that due to it's truncated behavior.
-        if len(self) != len(other):
-            if len(self) < len(other):
-                shorter = self
-            else:
-                shorter = other
-            if '*' not in shorter[-1]:
-                return False
+    @Tuke.repr_helper.repr_helper
+    def __repr__(self):
+        return ((str(self),),None)
 
-        for (a,b) in zip(self,other):
-            if a == b:
-                continue
+class _DemuxNode(object):
+    """Node of the LayerDemux trie"""
 
-            if '*' in (a,b):
-                continue
+    __slots__ = ('children','star','outputs','below')
 
-            return False
+    def __init__(self):
+        self.children = {}  # exact segment -> node
+        self.star = None    # node for a '*' segment
+        self.outputs = []   # outputs whose mask ends here
+        self.below = []     # outputs of every mask ending here or further down
 
-        return True
+class LayerDemux(object):
+    """Routes layers to every output whose layer mask matches.
 
-    @Tuke.repr_helper.repr_helper
-    def __repr__(self):
-        return ((str(self),),None)
+    masks - Mapping of output names to layer masks.
+
+    The masks are compiled into a trie over their segments, so a layer is
+    matched against every mask in a single walk, and the result for each layer
+    is remembered. Calling the LayerDemux with a layer returns a tuple of the
+    names of the outputs it should go to, in sorted order.
+    """
+
+    def __init__(self,masks):
+        self.masks = dict([(name,Layer(m)) for name,m in masks.iteritems()])
+        self._routes = {}
+
+        self._root = _DemuxNode()
+        for name,m in sorted(self.masks.iteritems()):
+            node = self._root
+            node.below.append(name)
+            for seg in m._parts:
+                if seg == '*':
+                    if node.star is None:
+                        node.star = _DemuxNode()
+                    node = node.star
+                else:
+                    try:
+                        node = node.children[seg]
+                    except KeyError:
+                        child = _DemuxNode()
+                        node.children[seg] = child
+                        node = child
+                node.below.append(name)
+            node.outputs.append(name)
+
+    def __call__(self,layer):
+        try:
+            return self._routes[layer]
+        except KeyError:
+            pass
+
+        layer = Layer(layer)
+        parts = layer._parts
+        last = len(parts) - 1
+
+        r = set()
+        nodes = [self._root]
+        for i,seg in enumerate(parts):
+            next = []
+            for node in nodes:
+                if seg == '*':
+                    next.extend(node.children.values())
+                else:
+                    try:
+                        next.append(node.children[seg])
+                    except KeyError:
+                        pass
+                if node.star is not None:
+                    next.append(node.star)
+                    # A mask ending in '*' matches longer layers.
+                    if i < last:
+                        r.update(node.star.outputs)
+            nodes = next
+
+        for node in nodes:
+            if parts[-1] == '*':
+                # A layer ending in '*' matches longer masks.
+                r.update(node.below)
+            else:
+                r.update(node.outputs)
+
+        r = tuple(sorted(r))
+        self._routes[layer] = r
+        return r
@@ -17,11 +17,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # ### BOILERPLATE ###
 
-from Tuke.geometry import Geometry
+from Tuke.geometry import Geometry,VArray
 
-from Tuke.geometry.circle import arc_points 
+from Tuke.geometry.circle import arc_points,arc_segments
+from Tuke.geometry.render_cache import cached_render
 from math import atan2,pi,degrees
 
+from numpy import concatenate
+
 def make_line_vertexes(a,b,thickness,segments):
     # first find the angle of the given line
     d = b - a
@@ -35,11 +38,11 @@ def make_line_vertexes(a,b,thickness,segments):
     # half circles aren't complete yet, need to shift them relative to the end
     # positions
     def t(vs,a):
-        return [v + a for v in vs]
+        return vs + (a[0,0],a[0,1])
     arc_a = t(arc_a,a)
     arc_b = t(arc_b,b)
 
-    return arc_a + arc_b
+    return VArray(concatenate((arc_a,arc_b)))
 
 class Line(Geometry):
     """A line with a specified thickness."""
@@ -50,8 +53,20 @@ class Line(Geometry):
         if not self.thickness > 0:
             raise ValueError, 'Thickness must be greater than zero: %d' % thickness
 
-    def render(self):
-        v = make_line_vertexes(self.a,self.b,self.thickness,16)
+    def _render_key(self,tolerance=None):
+        a = self.a
+        b = self.b
+        return (a[0,0],a[0,1],b[0,0],b[0,1],self.thickness,
+                arc_segments(float(self.thickness) / 2,pi,tolerance))
+
+    @cached_render
+    def render(self,tolerance=None):
+        """Render the line
+
+        tolerance - Maximum chord error of the end caps, see arc_segments()
+        """
+        segments = self._render_key(tolerance)[-1]
+        v = make_line_vertexes(self.a,self.b,self.thickness,segments)
 
         return (v,())
 
@@ -17,7 +17,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # ### BOILERPLATE ###
 
-from Tuke.geometry import Geometry,Transformation 
+from Tuke.geometry import Geometry,Transformation,VArray
 
 class Polygon(Geometry):
     """A polygon
@@ -25,10 +25,17 @@ class Polygon(Geometry):
     ext - ((x,y),(x,y),...)
     int - (((x,y),(x,y),...),
            ((x,y),(x,y),...))
+
+    The exterior and interior rings are stored as VArrays.
     """
 
     __required__ = ('ext',)
     __defaults__ = {'int':()}
 
+    def _init(self):
+        self.ext = VArray(self.ext)
+        if self.int:
+            self.int = tuple([VArray(i) for i in self.int])
+
     def render(self):
         return (self.ext,self.int)
@@ -0,0 +1,154 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# ### BOILERPLATE ###
+# Tuke - Electrical Design Automation toolset
+# Copyright (C) 2008 Peter Todd <pete@petertodd.org>
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# ### BOILERPLATE ###
+
+"""Shared cache of Geometry render() results.
+
+Geometry like Circle and Line is fully determined by it's arguments, so the
+local-frame vertexes rendered for one Circle can be reused by every other
+Circle with the same diameter. Transforms are applied to the rendered
+vertexes afterwards, by wrapping or by the exporters, so they don't need to be
+part of the key.
+
+Cached results are shared, so the arrays in them are made read-only.
+"""
+
+from numpy import ndarray
+
+class RenderCache(object):
+    """Least recently used cache of render() results.
+
+    max_bytes - Memory cap, the total size of the arrays in the cached
+                results. Least recently used results are evicted to stay under
+                it.
+
+    hits      - Number of lookups that found a result.
+    misses    - Number of lookups that did not.
+    evictions - Number of results evicted to stay under max_bytes.
+    nbytes    - Current size of the cached results.
+    """
+
+    # Rough size of each entry, not counting the arrays in it.
+    entry_overhead = 256
+
+    def __init__(self,max_bytes):
+        self.max_bytes = max_bytes
+        self.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        """Remove all cached results"""
+
+        # Entries are [prev,next,key,value,size] lists in a circular doubly
+        # linked list, most recently used last.
+        self._root = root = []
+        root[:] = [root,root,None,None,0]
+        self._entries = {}
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self,key):
+        return key in self._entries
+
+    def get(self,key):
+        """Return the result cached under key, raising KeyError if none"""
+        try:
+            entry = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+
+        # Move to the most recently used end.
+        prev,next = entry[0],entry[1]
+        prev[1] = next
+        next[0] = prev
+        root = self._root
+        last = root[0]
+        last[1] = entry
+        entry[0] = last
+        entry[1] = root
+        root[0] = entry
+        return entry[3]
+
+    def put(self,key,value):
+        """Cache value under key, returning it
+
+        Arrays in value are made read-only. Values larger than max_bytes are
+        not cached at all.
+        """
+        size = self.entry_overhead + _freeze(value)
+        if size > self.max_bytes:
+            return value
+        if key in self._entries:
+            self._remove(self._entries[key])
+
+        root = self._root
+        last = root[0]
+        entry = [last,root,key,value,size]
+        last[1] = entry
+        root[0] = entry
+        self._entries[key] = entry
+        self.nbytes += size
+
+        while self.nbytes > self.max_bytes:
+            self._remove(root[1])
+            self.evictions += 1
+        return value
+
+    def _remove(self,entry):
+        prev,next = entry[0],entry[1]
+        prev[1] = next
+        next[0] = prev
+        del self._entries[entry[2]]
+        self.nbytes -= entry[4]
+
+def _freeze(value):
+    """Make the arrays in value read-only, returning their total size"""
+    if isinstance(value,ndarray):
+        value.flags.writeable = False
+        return value.nbytes
+    elif isinstance(value,(tuple,list)):
+        n = 0
+        for v in value:
+            n += _freeze(v)
+        return n
+    return 0
+
+render_cache = RenderCache(max_bytes=32 * 2**20)
+
+def cached_render(fn):
+    """Decorator for Geometry render() methods using render_cache.
+
+    The class must define _render_key(), taking the same arguments as
+    render(), and returning a tuple of everything the result depends on. The
+    class itself is added to the key.
+    """
+    def render(self,*args,**kwargs):
+        key = (type(self),) + self._render_key(*args,**kwargs)
+        try:
+            return render_cache.get(key)
+        except KeyError:
+            return render_cache.put(key,fn(self,*args,**kwargs))
+    render.__name__ = fn.__name__
+    render.__doc__ = fn.__doc__
+    return render
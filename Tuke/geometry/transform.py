@@ -33,84 +33,256 @@ from Tuke import Element,Id
 
 import Tuke.context as context
 
-from Tuke.geometry import V
+from Tuke.geometry import V,VArray
+from Tuke.geometry.v import context_inverse
 
-from Tuke.geometry.matrix_subclassing import OddShapeError,odd_shape_handler
-
-from numpy import matrix,identity
-from numpy.matlib import ones
+from numpy import asarray,ndarray,array,empty,concatenate
 
 from math import sin,cos
 
-class Transformation(matrix,context.wrapper.Translatable):
+# Kinds of Transformation, from most to least specialized. Composing two
+# Transformations gives the least specialized kind of the two.
+_IDENTITY = 0
+_TRANSLATION = 1
+_RIGID = 2          # rotation and translation
+_GENERAL = 3
+
+def _kind(a,b,c,d,e,f):
+    """Return the most specialized kind of Transformation for a..f"""
+    if b == 0.0 and d == 0.0 and a == 1.0 and e == 1.0:
+        if c == 0.0 and f == 0.0:
+            return _IDENTITY
+        return _TRANSLATION
+    elif a == e and b == -d and abs(a * a + b * b - 1.0) < 1e-12:
+        return _RIGID
+    return _GENERAL
+
+_translatable_new = context.wrapper.Translatable.__new__
+
+def _new(a,b,c,d,e,f,kind):
+    """Create a Transformation directly from it's coefficients"""
+    self = _translatable_new(Transformation)
+    self.a = a
+    self.b = b
+    self.c = c
+    self.d = d
+    self.e = e
+    self.f = f
+    self.kind = kind
+    return self
+
+def _gather(v,leaves):
+    """Append every V and Nx2 array in nested sequence v to leaves"""
+    if isinstance(v,ndarray):
+        if v.ndim != 2 or v.shape[1] != 2:
+            raise TypeError, 'Invalid geometry: %s' % repr(v)
+        leaves.append(v)
+    elif isinstance(v,str):
+        raise TypeError, 'Invalid geometry: %s' % repr(v)
+    else:
+        try:
+            for n in v:
+                _gather(n,leaves)
+        except TypeError:
+            # Re-raised at every level, so the message ends up with the
+            # outermost sequence.
+            raise TypeError, 'Invalid geometry: %s' % repr(v)
+
+def _rebuild(v,r,i):
+    """Rebuild nested sequence v from rows i onwards of array r
+
+    Returns the rebuilt sequence, and the first row not used.
+    """
+    if isinstance(v,V):
+        return r[i:i + 1].view(V),i + 1
+    elif isinstance(v,ndarray):
+        j = i + len(v)
+        return r[i:j].view(type(v)),j
+
+    t = []
+    for n in v:
+        n,i = _rebuild(n,r,i)
+        t.append(n)
+    return type(v)(t),i
+
+class Transformation(context.wrapper.Translatable):
     """Holder for geometry transformations.
     
     After applying a geometry transformation to a class instance a
     Transformation instance with the name 'transform' will be inserted into
     the objects dict.
 
-    The actual transformation information is stored as a single homogeneous
-    coordinate system matrix.
-    """
+    The transformation is a 2d affine transform, equivalent to the homogeneous
+    coordinate system matrix:
+
+        ((a,b,c),
+         (d,e,f),
+         (0,0,1))
 
-    def __new__(cls,*args):
-        """Create new geometry transformation"""
+    Only the six coefficients are stored. Transformations are immutable, and
+    know if they are an identity, a translation, or a rotation and
+    translation, in which case composition, inversion and application take
+    shortcuts.
 
-        if not args:
-            args = (identity(3),)
+    Transformations convert to numpy arrays with numpy.asarray(), and can be
+    created from any 3x3 nested sequence, array, or matrix.
+    """
 
-        return super(Transformation,cls).__new__(cls,*args)
-        
+    __slots__ = ('a','b','c','d','e','f','kind')
 
-    def __call__(self,v):
-        """Apply the Transformation to v
+    def __new__(cls,m = None):
+        """Create new geometry transformation
 
-        v may be a bare V, or tuple/list of Vs, or any other combo.
+        m - 3x3 homogeneous matrix, as a nested sequence or numpy array, the
+            identity if not specified.
         """
 
-        try:
-            if isinstance(v,(V,str)):
-                raise TypeError
+        if m is None:
+            return _new(1.0,0.0,0.0,0.0,1.0,0.0,_IDENTITY)
+        elif isinstance(m,Transformation):
+            return m
 
-            r = []
-            for n in v:
-               r.append(self(n))
-            return type(v)(r)
-        except TypeError:
-            try:
-                assert isinstance(v,V)
-                assert v.shape == (1,2)
-
-                # Convert v to homogenous coordinates.
-                v2 = ones(3)
-                v2[0,0:2] = v
-
-                v2 = self * v2.T
-
-                return V(v2[0],v2[1])
-            except:
-                raise
-                # This bit is really clever... You'd think that the resulting
-                # error message would be for the inner most tuple right? But it
-                # doesn't work that way, as the TypeError propegates to the
-                # next outer call, and the next, and the next, each time
-                # running into the following raise, until finally it gets
-                # re-raised no more, this time with the full error message!
-                #
-                # That said, this occured completely by accident, and I only
-                # noticed it had the correct behavior during testing.
-                raise TypeError, 'Invalid geometry: %s' % repr(v)
+        if isinstance(m,ndarray):
+            m = asarray(m)
+        try:
+            ((a,b,c),(d,e,f),bottom) = m
+            a,b,c,d,e,f = float(a),float(b),float(c),float(d),float(e),float(f)
+            bottom = tuple([float(x) for x in bottom])
+        except (TypeError,ValueError):
+            raise ValueError, 'Transformation needs a 3x3 matrix, not %r' % (m,)
+        if bottom != (0.0,0.0,1.0):
+            raise ValueError, 'Transformation is not affine: %r' % (m,)
 
-    def __add__(self,other):
-        """Apply the effects of other to self and return a transformation
-        encompassing both."""
+        return _new(a,b,c,d,e,f,_kind(a,b,c,d,e,f))
 
-        r = Transformation()
+    def __call__(self,v):
+        """Apply the Transformation to v
 
-        r.v = (self.v[0] + other.v[0],self.v[1] + other.v[1])
+        v may be a bare V, an Nx2 array such as a VArray, or an arbitrarily
+        nested tuple/list of them. The result has the same structure, and
+        types, as v. Everything but a bare V is transformed in a single
+        vectorized pass.
+        """
 
+        if isinstance(v,V):
+            kind = self.kind
+            if kind == _IDENTITY:
+                return v
+
+            x = v[0,0]
+            y = v[0,1]
+            if kind == _TRANSLATION:
+                return V(x + self.c,y + self.f)
+            return V(self.a * x + self.b * y + self.c,
+                     self.d * x + self.e * y + self.f)
+        elif isinstance(v,ndarray):
+            if v.ndim != 2 or v.shape[1] != 2:
+                raise TypeError, 'Invalid geometry: %s' % repr(v)
+            if self.kind == _IDENTITY:
+                return v
+            return self._apply_array(v.view(ndarray)).view(type(v))
+
+        # Gather every vertex into one array, transform that, and rebuild the
+        # structure of v from the result.
+        leaves = []
+        _gather(v,leaves)
+        if self.kind == _IDENTITY:
+            return v
+        elif not leaves:
+            return _rebuild(v,None,0)[0]
+
+        r = self._apply_array(concatenate(leaves).view(ndarray))
+        return _rebuild(v,r,0)[0]
+
+    def _apply_array(self,a):
+        """Apply the Transformation to Nx2 ndarray a"""
+        if self.kind == _TRANSLATION:
+            return a + (self.c,self.f)
+
+        x = a[:,0]
+        y = a[:,1]
+        r = empty(a.shape)
+        r[:,0] = self.a * x + self.b * y + self.c
+        r[:,1] = self.d * x + self.e * y + self.f
         return r
 
+    def __mul__(self,other):
+        """Compose Transformations, other is applied first"""
+        if not isinstance(other,Transformation):
+            return NotImplemented
+
+        sk = self.kind
+        ok = other.kind
+        if ok == _IDENTITY:
+            return self
+        elif sk == _IDENTITY:
+            return other
+        elif sk == _TRANSLATION and ok == _TRANSLATION:
+            c = self.c + other.c
+            f = self.f + other.f
+            if c == 0.0 and f == 0.0:
+                return _new(1.0,0.0,0.0,0.0,1.0,0.0,_IDENTITY)
+            return _new(1.0,0.0,c,0.0,1.0,f,_TRANSLATION)
+        elif sk == _TRANSLATION:
+            return _new(other.a,other.b,other.c + self.c,
+                        other.d,other.e,other.f + self.f,ok)
+
+        a,b,c,d,e,f = self.a,self.b,self.c,self.d,self.e,self.f
+        if ok == _TRANSLATION:
+            return _new(a,b,a * other.c + b * other.f + c,
+                        d,e,d * other.c + e * other.f + f,sk)
+
+        oa,ob,oc,od,oe,of = other.a,other.b,other.c,other.d,other.e,other.f
+        return _new(a * oa + b * od,a * ob + b * oe,a * oc + b * of + c,
+                    d * oa + e * od,d * ob + e * oe,d * oc + e * of + f,
+                    max(sk,ok))
+
+    def _inverse(self):
+        kind = self.kind
+        if kind == _IDENTITY:
+            return self
+        elif kind == _TRANSLATION:
+            return _new(1.0,0.0,-self.c,0.0,1.0,-self.f,_TRANSLATION)
+
+        a,b,c,d,e,f = self.a,self.b,self.c,self.d,self.e,self.f
+        if kind == _RIGID:
+            # The inverse of a rotation is it's transpose.
+            return _new(a,d,-(a * c + d * f),
+                        b,e,-(b * c + e * f),_RIGID)
+
+        det = a * e - b * d
+        if det == 0.0:
+            raise ValueError, 'Transformation is singular: %r' % (self,)
+        return _new(e / det,-b / det,(b * f - e * c) / det,
+                    -d / det,a / det,(d * c - a * f) / det,_GENERAL)
+    I = property(_inverse,doc='Inverse Transformation')
+
+    def _rows(self):
+        return ((self.a,self.b,self.c),
+                (self.d,self.e,self.f),
+                (0.0,0.0,1.0))
+
+    def __array__(self,dtype = None):
+        return array(self._rows(),dtype)
+
+    def __getitem__(self,(y,x)):
+        return self._rows()[y][x]
+
+    def __eq__(self,other):
+        if not isinstance(other,Transformation):
+            return NotImplemented
+        return (self.a == other.a and self.b == other.b and self.c == other.c and
+                self.d == other.d and self.e == other.e and self.f == other.f)
+
+    def __ne__(self,other):
+        r = self.__eq__(other)
+        if r is NotImplemented:
+            return r
+        return not r
+
+    def __hash__(self):
+        return hash((self.a,self.b,self.c,self.d,self.e,self.f))
+
     def _build_context(self,base,reverse):
         if reverse:
             return base * self.I
@@ -121,22 +293,11 @@ class Transformation(matrix,context.wrapper.Translatable):
         return elem.transform * self
 
     def _remove_context(self,elem):
-        return self * elem.transform.I
+        return self * context_inverse(elem)
 
-    @odd_shape_handler
     @Tuke.repr_helper.repr_helper
     def __repr__(self):
-        if self.shape != (3,3):
-            raise OddShapeError
-
-        rows = []
-        for y in xrange(3):
-            cols = []
-            for x in xrange(3):
-                cols.append(self[y,x])
-            rows.append(tuple(cols))
-
-        return ((tuple(rows),),{})
+        return ((self._rows(),),{})
 
 def element_transform_helper(fn):
     """Decorator for Element.transform modifying functions.
@@ -159,10 +320,9 @@ def element_transform_helper(fn):
 def Translation(v):
     """Return a Transformation that translates by vertex v"""
 
-    return \
-        Transformation(((1.0,0.0,v[0,0]),
-                        (0.0,1.0,v[0,1]),
-                        (0.0,0.0,1.0)))
+    c = float(v[0,0])
+    f = float(v[0,1])
+    return _new(1.0,0.0,c,0.0,1.0,f,_kind(1.0,0.0,c,0.0,1.0,f))
 
 @element_transform_helper
 def translate(e,v):
@@ -171,10 +331,9 @@ def translate(e,v):
 
 def Rotation(a):
     """Return a Transformation that rotates by angle a"""
-    return \
-        Transformation((( cos(a),sin(a),0.0),
-                        (-sin(a),cos(a),0.0),
-                        (    0.0,   0.0,1.0)))
+    c = cos(a)
+    s = sin(a)
+    return _new(c,s,0.0,-s,c,0.0,_kind(c,s,0.0,-s,c,0.0))
 
 @element_transform_helper
 def rotate(e,a):
@@ -192,10 +351,9 @@ def rotate_around_center(e,a,v):
 
 def Scale(s):
     """Return a Transformation that scales by vector s"""
-    return \
-        Transformation(((s[0,0],   0.0,0.0),
-                        (   0.0,s[0,1],0.0),
-                        (   0.0,   0.0,1.0)))
+    a = float(s[0,0])
+    e = float(s[0,1])
+    return _new(a,0.0,0.0,0.0,e,0.0,_kind(a,0.0,0.0,0.0,e,0.0))
 
 @element_transform_helper
 def scale(e,s):
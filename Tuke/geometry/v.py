@@ -17,7 +17,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # ### BOILERPLATE ###
 
-from numpy import matrix
+from numpy import matrix,ndarray,array
 
 import Tuke.repr_helper
 
@@ -25,6 +25,19 @@ import Tuke.context as context
 
 from Tuke.geometry.matrix_subclassing import OddShapeError,odd_shape_handler
 
+def context_inverse(elem):
+    """Return the inverse of the transform of context elem.
+
+    Unwrapped Elements cache the inverse of their transform, for wrapped ones
+    the transform itself depends on the wrapping.
+    """
+    if type(elem) is not context.wrapper.Wrapped:
+        try:
+            return elem._transform_inverse
+        except AttributeError:
+            pass
+    return elem.transform.I
+
 class V(matrix,context.wrapper.Translatable):
     """2d vector
     
@@ -39,7 +52,7 @@ class V(matrix,context.wrapper.Translatable):
         return elem.transform(self)
 
     def _remove_context(self,elem):
-        return elem.transform.I(self)
+        return context_inverse(elem)(self)
 
     @odd_shape_handler
     @Tuke.repr_helper.repr_helper
@@ -51,3 +64,42 @@ class V(matrix,context.wrapper.Translatable):
         y = self[0,1]
         return (((x,y)),{})
 
+class VArray(ndarray,context.wrapper.Translatable):
+    """Packed array of 2d vectors
+
+    An Nx2 float array, for polygon rings and other runs of vertexes. Iterating
+    over a VArray, or indexing it by integer, gives V's. Context is applied to
+    the whole array at once.
+    """
+
+    def __new__(cls,vs = ()):
+        """Create a new vector array
+
+        vs - Sequence of V's, (x,y) pairs, or an Nx2 array.
+        """
+        return array(vs,float).reshape(-1,2).view(cls)
+
+    def __iter__(self):
+        if self.ndim != 2 or self.shape[1] != 2:
+            return ndarray.__iter__(self)
+        return (V(x,y) for x,y in self.tolist())
+
+    def __getitem__(self,i):
+        r = ndarray.__getitem__(self,i)
+        if isinstance(i,(int,long)) and self.ndim == 2 and self.shape[1] == 2:
+            return V(r[0],r[1])
+        return r
+
+    def _apply_context(self,elem):
+        return elem.transform(self)
+
+    def _remove_context(self,elem):
+        return context_inverse(elem)(self)
+
+    @odd_shape_handler
+    @Tuke.repr_helper.repr_helper
+    def __repr__(self):
+        if self.ndim != 2 or self.shape[1] != 2:
+            raise OddShapeError
+
+        return ((tuple([tuple(v) for v in self.tolist()]),),{})
@@ -0,0 +1,174 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# ### BOILERPLATE ###
+# Tuke - Electrical Design Automation toolset
+# Copyright (C) 2008 Peter Todd <pete@petertodd.org>
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# ### BOILERPLATE ###
+
+"""Net extraction.
+
+A net is a set of Elements that are connected together, directly or through
+other Elements, by their Connects. Nets are extracted from the connectivity
+engine of the tree, see Tuke.connects, with a union-find over every resolved
+connection, explicit and implicit alike.
+
+"""
+
+import Tuke
+import Tuke.context as context
+import Tuke.repr_helper
+
+from Tuke.context.wrapper import unwrap
+
+class Net(frozenset):
+    """A net.
+
+    The set of Ids of the connected Elements, relative to the Element the
+    netlist was extracted from.
+    """
+
+    @Tuke.repr_helper.repr_helper
+    def __repr__(self):
+        return ((sorted(self),),None)
+
+class Netlist(context.wrapper.Translatable):
+    """The nets of an Element and it's sub-elements.
+
+    Only Elements with at least one connection to another Element, within the
+    Element the netlist was extracted from, are in a net. Connections to
+    Elements outside of it are ignored.
+
+    Ids are relative to the Element the netlist was extracted from, and are
+    not changed by wrapping.
+    """
+
+    def __init__(self,base):
+        """Extract the netlist of base.
+
+        base - Unwrapped Element
+        """
+        self._by_elem = {}
+        self._by_id = {}
+
+        tree = base._tree
+        if tree is None or tree.connectivity is None:
+            self.nets = ()
+            return
+
+        b = base._path
+        l = len(b)
+        def within(e):
+            return e._path[:l] == b
+
+        # Union-find, with path compression and union by size.
+        parent = {}
+        size = {}
+        def find(e):
+            root = e
+            while parent[root] is not root:
+                root = parent[root]
+            while parent[e] is not root:
+                parent[e],e = root,parent[e]
+            return root
+
+        for e,erefs in tree.connectivity.adjacency.iteritems():
+            if l and not within(e):
+                continue
+            for eref in erefs:
+                # Every resolved _elemref is in the adjacency of both it's
+                # source and it's target, only count it once.
+                if eref.source is not e or not eref.valid():
+                    continue
+
+                t = eref.target
+                if l and not within(t):
+                    continue
+
+                for n in (e,t):
+                    if n not in parent:
+                        parent[n] = n
+                        size[n] = 1
+
+                x = find(e)
+                y = find(t)
+                if x is not y:
+                    if size[x] < size[y]:
+                        x,y = y,x
+                    parent[y] = x
+                    size[x] += size[y]
+
+        members = {}
+        for e in parent:
+            try:
+                members[find(e)].append(e)
+            except KeyError:
+                members[find(e)] = [e]
+
+        nets = []
+        for elems in members.itervalues():
+            ids = [tuple.__new__(Tuke.Id,e._path[l:]) for e in elems]
+            net = Net(ids)
+            nets.append(net)
+            for e,id in zip(elems,ids):
+                self._by_elem[e] = net
+                self._by_id[id] = net
+        self.nets = tuple(nets)
+
+    def net_of(self,elem):
+        """Return the net elem is on.
+
+        elem - Element, or Id relative to the Element the netlist was extracted
+               from.
+
+        Raises KeyError if elem isn't on a net.
+        """
+        if isinstance(elem,Tuke.Element):
+            return self._by_elem[unwrap(elem)]
+        else:
+            return self._by_id[Tuke.Id(elem)]
+
+    def __iter__(self):
+        return iter(self.nets)
+
+    def __len__(self):
+        return len(self.nets)
+
+    def _apply_context(self,elem):
+        return self
+
+    def _remove_context(self,elem):
+        return self
+
+def netlist(elem):
+    """Return the Netlist of elem, cached.
+
+    elem - Unwrapped Element
+
+    The netlist is cached until the connectivity engine of the tree elem is in
+    changes.
+    """
+    tree = elem._tree
+    if tree is None or tree.connectivity is None:
+        return Netlist(elem)
+
+    conn = tree.connectivity
+    cache = elem.__dict__.get('_netlist_cache')
+    if cache is not None and \
+       cache[0] is conn and cache[1] == conn.generation:
+        return cache[2]
+
+    r = Netlist(elem)
+    elem._netlist_cache = (conn,conn.generation,r)
+    return r
@@ -18,7 +18,7 @@
 # ### BOILERPLATE ###
 
 from Tuke import ReprableByArgsElement,Id
-from Tuke.geometry import Polygon,V
+from Tuke.geometry import Polygon,VArray
 
 class Pad(ReprableByArgsElement):
     """Defines a pad
@@ -47,7 +47,7 @@ class Pad(ReprableByArgsElement):
         For makng pads, clearances etc.
         """
 
-        return Polygon(ext=(V(self.a[0] - thickness/2,self.a[1] - thickness/2),
-            V(self.b[0] + thickness/2,self.b[1] - thickness/2),
-            V(self.b[0] + thickness/2,self.b[1] + thickness/2),
-            V(self.a[0] - thickness/2,self.a[1] + thickness/2)),id=id,layer=layer)
+        return Polygon(ext=VArray(((self.a[0] - thickness/2,self.a[1] - thickness/2),
+            (self.b[0] + thickness/2,self.b[1] - thickness/2),
+            (self.b[0] + thickness/2,self.b[1] + thickness/2),
+            (self.a[0] - thickness/2,self.a[1] + thickness/2))),id=id,layer=layer)
@@ -18,7 +18,7 @@
 # ### BOILERPLATE ###
 
 from Tuke import ReprableByArgsElement,Id
-from Tuke.geometry import Circle,Hole,Polygon,V
+from Tuke.geometry import Circle,Hole,Polygon,VArray
 
 class Pin(ReprableByArgsElement):
     """Defines a pin
@@ -40,7 +40,7 @@ class Pin(ReprableByArgsElement):
         def gen_pad_shape(dia,id,layer=None):
             if self.square:
                 r = dia / 2
-                return Polygon(ext=(V(-r,-r),V(r,-r),V(r,r),V(-r,r)),id=id,layer=layer)
+                return Polygon(ext=VArray(((-r,-r),(r,-r),(r,r),(-r,r))),id=id,layer=layer)
             else:
                 return Circle(dia=dia,id=id,layer=layer)
 
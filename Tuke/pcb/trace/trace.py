@@ -17,15 +17,28 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # ### BOILERPLATE ###
 
-from Tuke import Id
+import weakref
+
+from Tuke import ReprableByArgsElement,Id
 from Tuke.pcb.trace import BaseTrace
 from Tuke.geometry import Line,centerof
+from Tuke.cached_attribute import subscribe_depends,transform_depends
+from Tuke.context.wrapper import unwrap
+
+def _endpoint_depends(self):
+    """The transforms that move the endpoints relative to the trace."""
+    for ref in (self.a,self.b):
+        if ref is not None:
+            for d in transform_depends(ref):
+                yield d
 
-class Trace(BaseTrace):
+class Trace(BaseTrace,ReprableByArgsElement):
     """Basic trace.
 
     Basic trace type. Creates straight lines between points of a given width.
 
+    The copper Line is created, and kept up to date, from the endpoints, so
+    like a Pad the trace is fully represented by its arguments.
     """
 
     valid_endpoint_types=()
@@ -33,20 +46,67 @@ class Trace(BaseTrace):
     __defaults__ = dict(layer='pcb.top.copper')
     __required__ = ('thickness',)
 
+    # The copper is kept up to date as the endpoints move, so the trace is laid
+    # out exactly as the copper is.
+    _layout_depends = ('copper/a','copper/b','copper/thickness','copper/layer')
+
+    _copper_depends = ('a','b','thickness','layer',_endpoint_depends)
+
     def _init(self):
         self.connects.add(Id('copper'))
+        self._copper_handles = ()
+        self._update_copper()
+
+    def _update_copper(self):
+        """Move the copper sub-element to the endpoints, creating it if needed.
+
+        Called whenever the endpoints, or anything moving them, change. The
+        endpoints may not resolve yet, in which case the copper is left as is.
+        """
+        for unsubscribe in self._copper_handles:
+            unsubscribe()
+
+        # Subscriptions are strong references, and the Elements subscribed to
+        # may well outlive the trace.
+        self_ref = weakref.ref(unwrap(self))
+        def changed():
+            self = self_ref()
+            if self is not None:
+                self._update_copper()
+        self._copper_handles = \
+                subscribe_depends(self,self._copper_depends,changed)
+
+        if self.a is None or self.b is None:
+            return
+        try:
+            a = centerof(self.a())
+            b = centerof(self.b())
+        except KeyError:
+            return
+
+        try:
+            copper = unwrap(self.copper)
+        except AttributeError:
+            self.add(Line(a=a,
+                          b=b,
+                          thickness=self.thickness,
+                          layer=self.layer,
+                          id=Id('copper')))
+            return
+
+        # Only what actually changed, so nothing is notified needlessly.
+        if (copper.a != a).any():
+            copper.a = a
+        if (copper.b != b).any():
+            copper.b = b
+        if copper.thickness != self.thickness:
+            copper.thickness = self.thickness
+        if copper.layer != self.layer:
+            copper.layer = self.layer
 
     def iterlayout(self,layer_mask):
         if self.layer in layer_mask:
             if not self.a or not self.b:
                 raise NotImplementedError # FIXME:
 
-            try:
-                yield self.copper
-            except AttributeError:
-                self.add(Line(a=centerof(self.a()),
-                              b=centerof(self.b()),
-                              thickness=self.thickness,
-                              layer=self.layer,
-                              id=Id('copper')))
-                yield self.copper
+            yield self.copper
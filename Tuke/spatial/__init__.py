@@ -0,0 +1,30 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# ### BOILERPLATE ###
+# Tuke - Electrical Design Automation toolset
+# Copyright (C) 2008 Peter Todd <pete@petertodd.org>
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# ### BOILERPLATE ###
+
+"""Spatial indexes of layout.
+
+See Tuke.spatial.rtree, Tuke.spatial.index, Tuke.spatial.centers,
+Tuke.spatial.hit and Tuke.spatial.clearance
+"""
+
+from rtree import RTree
+from index import SpatialIndex,layout_bbox
+from hit import layout_contains
+from centers import CenterIndex
+from clearance import Violation,check_clearance
@@ -0,0 +1,109 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# ### BOILERPLATE ###
+# Tuke - Electrical Design Automation toolset
+# Copyright (C) 2008 Peter Todd <pete@petertodd.org>
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# ### BOILERPLATE ###
+
+"""Index of the centers of pins, pads and points.
+
+Snapping, and proximity questions like which pins are within 1mm of the end
+of a trace, only need the centers of elements, see centerof(). A CenterIndex
+keeps the centers of every Pin, Pad and Point, and answers nearest neighbour
+and radius queries over all of them at once, rather than calling centerof()
+on every element through the wrapper.
+"""
+
+from numpy import array,hypot,lexsort
+
+from Tuke.geometry import V
+from Tuke.pcb import Pad,Pin,Point
+from Tuke.spatial.index import _TrackedIndex
+
+class CenterIndex(_TrackedIndex):
+    """Index of the centers of elements.
+
+    elem  - The Element to index.
+    types - Class, or tuple of classes, of the elements to index.
+
+    Every element of types below elem is indexed by it's center, where it's
+    transform puts V(0,0), in the coordinates of the sub-elements of elem.
+    The elements below an indexed element aren't examined. Centers are kept
+    as zero sized boxes in one RTree per class, and are updated when the
+    transform of the element, or of any element above it, changes. See
+    _TrackedIndex for what else is tracked.
+
+    Results are (distance,element,center) tuples, where element is
+    unwrapped, and center is a V.
+    """
+
+    def __init__(self,elem,types=(Pin,Pad,Point)):
+        self.types = types
+        _TrackedIndex.__init__(self,elem)
+
+    def _is_unit(self,raw):
+        return isinstance(raw,self.types)
+
+    def _unit_entries(self,raw,transform):
+        c = transform(V(0,0))
+        (x,y) = (float(c[0,0]),float(c[0,1]))
+        return (((raw,c),(x,y,x,y),type(raw)),)
+
+    def _match(self,types):
+        if types is None:
+            return lambda cls: True
+        return lambda cls: issubclass(cls,types)
+
+    def nearest(self,point,k=1,types=None):
+        """Return the elements with centers nearest a point
+
+        point - V, or (x,y)
+        k     - Number of elements to return.
+        types - Only elements of these classes are returned.
+
+        Returns a list of up to k results, nearest first.
+        """
+        r = []
+        if k > 0:
+            for d,((e,c),bbox,cls) in self._iternearest(point,
+                                                        self._match(types)):
+                r.append((d,e,c))
+                if len(r) >= k:
+                    break
+        return r
+
+    def within(self,point,radius,types=None):
+        """Return the elements with centers within a radius of a point
+
+        point  - V, or (x,y)
+        radius - Maximum distance, inclusive.
+        types  - Only elements of these classes are returned.
+
+        Returns a list of results, nearest first, ties in the order the
+        elements were indexed.
+        """
+        (x,y) = array(point,float).reshape(2).tolist()
+        entries = self._query((x - radius,y - radius,x + radius,y + radius),
+                              self._match(types))
+        if not entries:
+            return []
+
+        centers = array([bbox[:2] for item,bbox,cls in entries])
+        d = hypot(centers[:,0] - x,centers[:,1] - y)
+        hits = (d <= radius).nonzero()[0]
+        hits = hits[lexsort((hits,d[hits]))]
+
+        return [(float(d[i]),entries[i][0][0],entries[i][0][1])
+                for i in hits.tolist()]
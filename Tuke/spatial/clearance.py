@@ -0,0 +1,233 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# ### BOILERPLATE ###
+# Tuke - Electrical Design Automation toolset
+# Copyright (C) 2008 Peter Todd <pete@petertodd.org>
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# ### BOILERPLATE ###
+
+"""Clearance design rule checking.
+
+Pins and pads have geometry on a clearance layer, around their copper, that
+copper of other nets must stay out of. check_clearance() finds the copper
+intruding on those clearances, and optionally any copper of different nets
+closer together than a minimum distance, such as crossing traces.
+
+Candidates are found by the bounding boxes of a SpatialIndex, then tested
+exactly with shapely, so run time grows with the amount of geometry, and the
+number of candidates near each, not with the number of pairs.
+"""
+
+from numpy import asarray
+
+import shapely.geometry
+import shapely.ops
+
+import Tuke
+from Tuke.context.wrapper import unwrap
+from Tuke.geometry import V
+from Tuke.spatial.index import SpatialIndex
+
+def layout_shape(layout):
+    """Return the shapely geometry of a WorldLayout
+
+    In the coordinates the transform of the layout maps to. None is returned
+    for geometry of no known shape, such as holes, which are on every layer,
+    but are surrounded by pads that are checked.
+    """
+    (geometry,transform) = layout
+    try:
+        render = geometry.render
+    except AttributeError:
+        return None
+    (ext,ints) = render()
+    if len(ext) < 3:
+        return None
+    s = shapely.geometry.Polygon(asarray(transform(ext)).tolist(),
+                                 [asarray(transform(i)).tolist() for i in ints])
+
+    # Rendered circles can overlap themselves by rounding error where they
+    # close, which shapely refuses to intersect.
+    if not s.is_valid:
+        s = s.buffer(0)
+    return s
+
+class Violation(object):
+    """A clearance violation.
+
+    rule     - 'clearance' if b is copper inside clearance a, 'copper' if
+               copper a and b are too close together.
+    a,b      - Ids of the two geometries, relative to the checked Element.
+    layers   - The layers of a and b.
+    nets     - The Nets a and b are on, None for geometry not on a net.
+    distance - Distance between a and b, zero if they overlap, as clearance
+               violations always do.
+    location - V, a point where they overlap, or halfway between their
+               nearest points if they don't.
+
+    Locations are in the coordinates of the sub-elements of the checked
+    Element, as with SpatialIndex.
+    """
+
+    __slots__ = ('rule','a','b','layers','nets','distance','location')
+
+    def __init__(self,rule,a,b,layers,nets,distance,location):
+        self.rule = rule
+        self.a = a
+        self.b = b
+        self.layers = layers
+        self.nets = nets
+        self.distance = distance
+        self.location = location
+
+    def __repr__(self):
+        return '<Violation %s %s %s distance=%r>' % \
+                (self.rule,self.a,self.b,self.distance)
+
+class _Checker(object):
+    """Nets and shapes of geometry, looked up once each."""
+
+    def __init__(self,elem):
+        self.base = unwrap(elem)._path
+        self.netlist = elem.netlist()
+        self.nets = {}
+        self.shapes = {}
+
+    def id(self,raw):
+        return tuple.__new__(Tuke.Id,raw._path[len(self.base):])
+
+    def net(self,path):
+        """Return the (key,net) of the geometry at path
+
+        The net is that of the geometry, or of the nearest element above it
+        on one. Geometry not on a net is only part of the element it's in, so
+        it's pad and clearance aren't mistaken for different nets.
+        """
+        try:
+            return self.nets[path]
+        except KeyError:
+            pass
+
+        l = len(self.base)
+        net = None
+        for i in xrange(len(path),l,-1):
+            try:
+                net = self.netlist.net_of(tuple.__new__(Tuke.Id,path[l:i]))
+                break
+            except KeyError:
+                continue
+
+        if net is not None:
+            r = (net,net)
+        elif len(path) - l > 1:
+            r = (path[:-1],None)
+        else:
+            r = (path,None)
+        self.nets[path] = r
+        return r
+
+    def shape(self,layout):
+        path = layout[0]._path
+        try:
+            return self.shapes[path]
+        except KeyError:
+            s = self.shapes[path] = layout_shape(layout)
+            return s
+
+    def violation(self,rule,a,b,sa,sb,distance):
+        if distance == 0:
+            p = sa.intersection(sb).representative_point()
+            location = V(p.x,p.y)
+        else:
+            (pa,pb) = shapely.ops.nearest_points(sa,sb)
+            location = V((pa.x + pb.x) / 2,(pa.y + pb.y) / 2)
+        (ga,ta) = a
+        (gb,tb) = b
+        return Violation(rule,self.id(ga),self.id(gb),(ga.layer,gb.layer),
+                         (self.net(ga._path)[1],self.net(gb._path)[1]),
+                         distance,location)
+
+def check_clearance(elem,
+                    clearance_mask='top.clearance',
+                    copper_mask=('top.pad','pcb.top.copper'),
+                    min_clearance=None,
+                    index=None):
+    """Check the clearances of the layout of elem
+
+    clearance_mask - Layer mask of clearance geometry.
+    copper_mask    - Layer mask, or sequence of masks, of copper geometry.
+    min_clearance  - If given, copper of different nets closer together than
+                     this is a violation as well. Zero finds overlapping
+                     copper only.
+    index          - SpatialIndex of elem to use, one is created if not
+                     given. The index tracks changes, including moved
+                     Trace endpoints, so re-using it makes checking again
+                     after a few changes cheap.
+
+    Geometry is on the net of the nearest element, it or above it, in the
+    netlist of elem, see Element.netlist(), and only geometry on different
+    nets is checked against each other.
+
+    Returns a list of Violations, in the order the geometry was indexed.
+    """
+    if index is None:
+        index = SpatialIndex(elem)
+
+    # Elements may add sub-elements, and connections, as they're laid out,
+    # changing the netlist, so index first.
+    index._refresh()
+    c = _Checker(elem)
+
+    inf = float('inf')
+    everywhere = (-inf,-inf,inf,inf)
+    clearance = index._match(clearance_mask)
+    copper = index._match(copper_mask)
+
+    r = []
+    for (a,bbox,layer) in index._query(everywhere,clearance):
+        key = c.net(a[0]._path)[0]
+        sa = None
+        for (b,bbox_b,layer_b) in index._query(bbox,copper):
+            if c.net(b[0]._path)[0] == key:
+                continue
+            if sa is None:
+                sa = c.shape(a)
+                if sa is None:
+                    break
+            sb = c.shape(b)
+            if sb is not None and sa.intersects(sb):
+                r.append(c.violation('clearance',a,b,sa,sb,0.0))
+
+    if min_clearance is not None:
+        for (a,(xmin,ymin,xmax,ymax),layer) in index._query(everywhere,copper):
+            path = a[0]._path
+            key = c.net(path)[0]
+            region = (xmin - min_clearance,ymin - min_clearance,
+                      xmax + min_clearance,ymax + min_clearance)
+            for (b,bbox_b,layer_b) in index._query(region,copper):
+                # Each pair only once.
+                if b[0]._path <= path or c.net(b[0]._path)[0] == key:
+                    continue
+                sa = c.shape(a)
+                sb = c.shape(b)
+                if sa is None or sb is None:
+                    continue
+                if sa.intersects(sb):
+                    d = 0.0
+                else:
+                    d = sa.distance(sb)
+                    if d >= min_clearance:
+                        continue
+                r.append(c.violation('copper',a,b,sa,sb,float(d)))
+    return r
@@ -0,0 +1,101 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# ### BOILERPLATE ###
+# Tuke - Electrical Design Automation toolset
+# Copyright (C) 2008 Peter Todd <pete@petertodd.org>
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# ### BOILERPLATE ###
+
+"""Exact hit testing of layout.
+
+Bounding boxes, see SpatialIndex and Element.bbox(), narrow down what could
+be at a point, these functions decide what actually is, by testing the point
+against the rendered geometry.
+"""
+
+from __future__ import with_statement
+
+from numpy import asarray,roll,hypot,clip,where,errstate
+
+from Tuke.geometry import Hole,V
+
+def ring_contains(ring,point):
+    """True if point is inside the closed ring of vertexes
+
+    Uses the even-odd rule, points exactly on the boundary may go either way.
+    """
+    (x,y) = point
+    xs = ring[:,0]
+    ys = ring[:,1]
+    xj = roll(xs,1)
+    yj = roll(ys,1)
+
+    # Edges that are horizontal never cross, and divide by zero.
+    with errstate(divide='ignore',invalid='ignore'):
+        crosses = ((ys > y) != (yj > y)) & \
+                  (x < (xj - xs) * (y - ys) / (yj - ys) + xs)
+    return bool(crosses.sum() % 2)
+
+def ring_distance(ring,point):
+    """Distance from point to the nearest edge of the closed ring"""
+    (x,y) = point
+    ax = ring[:,0]
+    ay = ring[:,1]
+    dx = roll(ax,-1) - ax
+    dy = roll(ay,-1) - ay
+    l2 = dx * dx + dy * dy
+
+    t = clip(((x - ax) * dx + (y - ay) * dy) / where(l2 > 0,l2,1),0,1)
+    return float(hypot(ax + t * dx - x,ay + t * dy - y).min())
+
+def layout_contains(layout,point,tolerance=0):
+    """True if the geometry of a WorldLayout is at point
+
+    point     - (x,y) in the coordinates the transform of the layout maps to.
+    tolerance - Points this close to the geometry count as well.
+
+    Hole tolerances are measured before the transform, the same thing for
+    anything but a scaling transform. False is returned for geometry of no
+    known shape.
+    """
+    (geometry,transform) = layout
+    (x,y) = point
+
+    if isinstance(geometry,Hole):
+        p = transform.I(V(x,y))
+        return hypot(p[0,0],p[0,1]) <= float(geometry.dia) / 2 + tolerance
+
+    try:
+        render = geometry.render
+    except AttributeError:
+        return False
+    (ext,ints) = render()
+    if not len(ext):
+        return False
+
+    rings = [asarray(transform(ext))]
+    rings.extend([asarray(transform(i)) for i in ints])
+
+    if ring_contains(rings[0],point):
+        for i in rings[1:]:
+            if ring_contains(i,point):
+                break
+        else:
+            return True
+
+    if tolerance > 0:
+        for r in rings:
+            if ring_distance(r,point) <= tolerance:
+                return True
+    return False
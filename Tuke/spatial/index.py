@@ -0,0 +1,462 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# ### BOILERPLATE ###
+# Tuke - Electrical Design Automation toolset
+# Copyright (C) 2008 Peter Todd <pete@petertodd.org>
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# ### BOILERPLATE ###
+
+"""Spatial index of layout.
+
+A SpatialIndex holds the bounding box of every geometry in the layout of an
+Element, in one RTree per layer, and answers region and nearest neighbour
+queries without traversing the layout. It keeps itself up to date: sub-elements
+being added or removed, transforms changing, and the arguments of geometry
+changing, are tracked by notifications, and only the geometry affected is
+re-indexed, the next time the index is queried.
+"""
+
+import heapq
+import weakref
+
+from numpy import array
+
+from Tuke.context.source import batching
+from Tuke.context.wrapper import unwrap
+from Tuke.cached_attribute import subscribe_depends
+from Tuke.element import WorldLayout,_own_layout,_own_layout_depends
+from Tuke.geometry import Geometry,Hole,Layer,V,VArray
+from Tuke.geometry.transform import _RIGID
+from Tuke.spatial.rtree import RTree,box_distance
+
+def layout_bbox(layout):
+    """Return the bounding box of a WorldLayout
+
+    The box is (xmin,ymin,xmax,ymax), in the coordinates the transform of the
+    layout maps to. None is returned for geometry of no known shape.
+    """
+    (geometry,transform) = layout
+    if isinstance(geometry,Hole):
+        r = float(geometry.dia) / 2
+        if transform.kind <= _RIGID:
+            c = transform(V(0,0))
+            return (c[0,0] - r,c[0,1] - r,c[0,0] + r,c[0,1] + r)
+        vs = VArray(((-r,-r),(r,-r),(r,r),(-r,r)))
+    else:
+        try:
+            render = geometry.render
+        except AttributeError:
+            return None
+        vs = render()[0]
+        if not len(vs):
+            return None
+    vs = transform(vs)
+    (xmin,ymin) = vs.min(0)
+    (xmax,ymax) = vs.max(0)
+    return (float(xmin),float(ymin),float(xmax),float(ymax))
+
+def _intersects(a,b):
+    return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+class _Unit(object):
+    """Element that is re-indexed as a whole.
+
+    ids     - Ids of the entries of the unit.
+    handles - Unsubscribe handles.
+    """
+
+    __slots__ = ('ids','handles')
+
+    def __init__(self):
+        self.ids = []
+        self.handles = []
+
+class _Bucket(object):
+    """The entries of one key, such as a layer.
+
+    tree     - RTree of the entries when it was last built.
+    ids      - Array of the entry id of each box in tree.
+    dead     - Number of entries in tree since removed.
+    overflow - Set of ids of entries added since tree was built.
+    """
+
+    __slots__ = ('tree','ids','dead','overflow')
+
+class _TrackedIndex(object):
+    """Base class of indexes of the sub-elements of an Element.
+
+    elem - The Element to index.
+
+    Sub-elements are indexed in units, each unit an element and everything
+    below it, with _unit_entries() giving the (item,bbox,key) entries of
+    each. Entries are kept in one RTree per key. Boxes are in the coordinates
+    of the sub-elements of elem, the same as the transforms
+    iterlayout_world() returns.
+
+    Changes are tracked, and applied the next time the index is queried:
+    sub-elements being added or removed, the transforms of units and the
+    elements above them changing, and the dependencies _unit_depends() gives
+    changing. Entries added or changed since the RTree of their key was built
+    are kept in an overflow list, which is searched linearly, until the
+    overflow and removed entries add up to rebuild_fraction of the tree, at
+    which point the tree is rebuilt.
+
+    Other changes are not tracked, use invalidate() after making them. While
+    notifications are being batched nothing is tracked, and every query
+    builds the whole index.
+
+    builds   - Number of times the whole index was built.
+    rebuilds - Number of times the RTree of a key was rebuilt.
+    """
+
+    leaf_size = 16
+    rebuild_fraction = 0.25
+    rebuild_min = 32
+
+    def __init__(self,elem):
+        self._raw = unwrap(elem)
+        self._tree = None
+        self._adding = None
+        self._units = {}
+        self._buckets = {}
+        self.builds = 0
+        self.rebuilds = 0
+        self.invalidate()
+
+    def invalidate(self):
+        """Build the whole index again the next time it's queried"""
+        self._stale = True
+
+    def _tree_changed(self,paths,added):
+        prefix = paths[0]
+        n = len(self._path)
+        if len(prefix) > n and prefix[:n] == self._path:
+            # Changes a unit makes to itself while we're getting it's
+            # entries are already part of them.
+            adding = self._adding
+            if adding is not None and prefix[:len(adding)] == adding:
+                return
+            self._topology.append((paths,added))
+
+    def _build(self):
+        for unit in self._units.itervalues():
+            for unsubscribe in unit.handles:
+                unsubscribe()
+
+        raw = self._raw
+        tree = raw._get_tree()
+        if tree is not self._tree:
+            tree.listen(self)
+            self._tree = tree
+        self._path = raw._path
+
+        self._units = {}
+        self._entries = {}
+        self._buckets = {}
+        self._next_id = 0
+        self._topology = []
+        self._dirty = set()
+        self._stale = False
+
+        self._root_inverse = raw._world_transform.I
+        for sub in raw._subs:
+            self._add_units(unwrap(sub))
+
+        for bucket in self._buckets.itervalues():
+            self._rebuild(bucket)
+        self.builds += 1
+
+    def _refresh(self):
+        """Apply the changes since the last query"""
+        raw = self._raw
+        if self._stale or raw._tree is not self._tree \
+                or raw._path != self._path or batching():
+            self._build()
+        elif self._topology or self._dirty:
+            self._root_inverse = raw._world_transform.I
+
+            topology = self._topology
+            self._topology = []
+            for paths,added in topology:
+                owner = self._owner(paths[0])
+                if owner is not None:
+                    self._dirty.add(owner)
+                    continue
+
+                for path in paths:
+                    if path in self._units:
+                        self._remove_unit(path)
+                if added:
+                    e = self._tree.paths.get(paths[0])
+                    if e is not None:
+                        self._add_units(unwrap(e))
+
+            dirty = self._dirty
+            self._dirty = set()
+            for path in dirty:
+                if path in self._units:
+                    e = unwrap(self._tree.paths[path])
+                    self._remove_unit(path)
+                    self._add_unit(e)
+
+        # While batching notifications are deferred, so changes go unnoticed
+        # until the batch ends. The index is built from scratch every time
+        # instead.
+        if batching():
+            self._stale = True
+
+    def _is_unit(self,raw):
+        """True if raw is a unit, the elements below it aren't examined"""
+        raise NotImplementedError
+
+    def _unit_entries(self,raw,transform):
+        """Return the (item,bbox,key) entries of unit raw
+
+        transform - The transform from the coordinates of raw to ours.
+        """
+        raise NotImplementedError
+
+    def _unit_depends(self,raw):
+        """Return the dependencies of the entries of unit raw
+
+        As given to cached_attribute(), relative to raw.
+        """
+        return ()
+
+    def _owner(self,path):
+        """Path of the unit path is below, if any"""
+        for i in xrange(len(self._path) + 1,len(path)):
+            if path[:i] in self._units:
+                return path[:i]
+        return None
+
+    def _add_units(self,raw):
+        """Add the units of the sub-tree rooted at raw"""
+        stack = [raw]
+        while stack:
+            raw = stack.pop()
+            if self._is_unit(raw):
+                self._add_unit(raw)
+            elif raw._subs:
+                s = [unwrap(sub) for sub in raw._subs]
+                s.reverse()
+                stack.extend(s)
+
+    def _add_unit(self,raw):
+        path = raw._path
+        if path in self._units:
+            self._remove_unit(path)
+        unit = self._units[path] = _Unit()
+
+        # Elements may add sub-elements to themselves in iterlayout(), those
+        # changes are already part of the entries.
+        self._adding = path
+        try:
+            entries = self._unit_entries(raw,
+                                         self._root_inverse * raw._world_transform)
+        finally:
+            self._adding = None
+
+        for (item,bbox,key) in entries:
+            i = self._next_id
+            self._next_id += 1
+            self._entries[i] = (item,bbox,key)
+            unit.ids.append(i)
+
+            try:
+                bucket = self._buckets[key]
+            except KeyError:
+                bucket = self._buckets[key] = _Bucket()
+                bucket.tree = None
+                bucket.ids = array((),int)
+                bucket.dead = 0
+                bucket.overflow = set()
+            bucket.overflow.add(i)
+
+        # The callbacks are kept by raw, and must not keep us alive.
+        self_ref = weakref.ref(self)
+        def dirty():
+            self = self_ref()
+            if self is not None:
+                self._dirty.add(path)
+
+        unit.handles.append(raw.subscribe('_world_transform',dirty))
+        unit.handles.extend(subscribe_depends(raw,self._unit_depends(raw),
+                                              dirty))
+
+    def _remove_unit(self,path):
+        unit = self._units.pop(path)
+        for unsubscribe in unit.handles:
+            unsubscribe()
+        for i in unit.ids:
+            (item,bbox,key) = self._entries.pop(i)
+            bucket = self._buckets[key]
+            if i in bucket.overflow:
+                bucket.overflow.remove(i)
+            else:
+                bucket.dead += 1
+
+    def _rebuild(self,bucket):
+        """Rebuild the RTree of bucket with all it's entries"""
+        entries = self._entries
+        ids = [i for i in bucket.ids.tolist() if i in entries]
+        ids.extend(bucket.overflow)
+        ids.sort()
+
+        bucket.tree = RTree([entries[i][1] for i in ids],self.leaf_size)
+        bucket.ids = array(ids,int)
+        bucket.dead = 0
+        bucket.overflow = set()
+
+    def _iterbuckets(self,match):
+        """Iterate through the buckets whose keys match is true for,
+        rebuilding them as needed."""
+        for key,bucket in self._buckets.items():
+            if match(key):
+                if len(bucket.overflow) + bucket.dead > \
+                        max(self.rebuild_min,
+                            self.rebuild_fraction * len(bucket.ids)):
+                    self._rebuild(bucket)
+                    self.rebuilds += 1
+                yield bucket
+
+    def __len__(self):
+        self._refresh()
+        return len(self._entries)
+
+    def _query(self,bbox,match):
+        """Return the entries in buckets matching match that intersect bbox,
+        in the order they were indexed."""
+        bbox = tuple([float(c) for c in bbox])
+        self._refresh()
+        entries = self._entries
+
+        r = []
+        for bucket in self._iterbuckets(match):
+            if len(bucket.ids):
+                r.extend([i for i in bucket.ids[bucket.tree.query(bbox)].tolist()
+                          if i in entries])
+            r.extend([i for i in bucket.overflow
+                      if _intersects(entries[i][1],bbox)])
+        r.sort()
+        return [entries[i] for i in r]
+
+    def _iternearest(self,point,match):
+        """Iterate through (distance,entry) pairs of buckets matching match,
+        nearest point first."""
+        point = tuple(array(point,float).reshape(2).tolist())
+        self._refresh()
+        entries = self._entries
+
+        def from_tree(bucket):
+            ids = bucket.ids
+            for d,i in bucket.tree.iternearest(point):
+                i = int(ids[i])
+                if i in entries:
+                    yield d,i
+
+        streams = []
+        for bucket in self._iterbuckets(match):
+            if len(bucket.ids):
+                streams.append(from_tree(bucket))
+            if bucket.overflow:
+                ids = sorted(bucket.overflow)
+                boxes = array([entries[i][1] for i in ids])
+                streams.append(sorted(zip(box_distance(boxes,point).tolist(),
+                                          ids)))
+
+        for d,i in heapq.merge(*streams):
+            yield d,entries[i]
+
+class SpatialIndex(_TrackedIndex):
+    """Spatial index of the layout of an Element.
+
+    elem - The Element to index.
+
+    Indexes the bounding box of every geometry, see layout_bbox(), in one
+    RTree per layer. Results are the WorldLayouts iterlayout_world() would
+    return.
+
+    Geometry, and elements responsible for their own layout, are re-indexed
+    when their arguments, or anything else their layout depends on, such as
+    the endpoints of a Trace, change. See Element._layout_depends, and
+    _TrackedIndex for what else is tracked.
+    """
+
+    def _is_unit(self,raw):
+        return _own_layout(raw)
+
+    def _unit_entries(self,raw,transform):
+        if isinstance(raw,Geometry):
+            layouts = (WorldLayout(raw,transform),)
+        else:
+            layouts = [WorldLayout(unwrap(g),transform * g.transform)
+                       for g in raw.iterlayout(Layer('*'))]
+
+        r = []
+        for l in layouts:
+            bbox = layout_bbox(l)
+            if bbox is not None:
+                r.append((l,bbox,l[0].layer))
+        return r
+
+    def _unit_depends(self,raw):
+        return list(_own_layout_depends(raw))
+
+    def _match(self,layer_mask):
+        if not layer_mask:
+            layer_mask = '*'
+        if isinstance(layer_mask,str):
+            return Layer(layer_mask).__contains__
+
+        masks = [Layer(m) for m in layer_mask]
+        def match(layer):
+            for m in masks:
+                if layer in m:
+                    return True
+            return False
+        return match
+
+    def query_region(self,bbox,layer_mask=None):
+        """Return the layout intersecting a region
+
+        bbox       - (xmin,ymin,xmax,ymax) of the region.
+        layer_mask - Only geometry on matching layers is returned. May also
+                     be a sequence of masks, matching any of them.
+
+        Returns a list of WorldLayouts, of every geometry whose bounding box
+        intersects, or touches, bbox, in the order they were indexed.
+        """
+        return [l for (l,bbox,layer) in self._query(bbox,self._match(layer_mask))]
+
+    def nearest(self,point,layer_mask=None,k=1):
+        """Return the layout nearest a point
+
+        point      - V, or (x,y)
+        layer_mask - Only geometry on matching layers is returned, as in
+                     query_region().
+        k          - Number of geometries to return.
+
+        Returns a list of up to k (distance,WorldLayout) pairs, nearest
+        first. Distance is to the bounding box of the geometry, zero if the
+        point is inside it.
+        """
+        r = []
+        if k > 0:
+            for d,(l,bbox,layer) in self._iternearest(point,
+                                                      self._match(layer_mask)):
+                r.append((d,l))
+                if len(r) >= k:
+                    break
+        return r
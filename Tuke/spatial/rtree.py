@@ -0,0 +1,188 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# ### BOILERPLATE ###
+# Tuke - Electrical Design Automation toolset
+# Copyright (C) 2008 Peter Todd <pete@petertodd.org>
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# ### BOILERPLATE ###
+
+"""Static R-tree of axis aligned boxes.
+
+Boxes are (xmin,ymin,xmax,ymax) tuples throughout Tuke.spatial. The tree is
+bulk loaded with the Sort-Tile-Recursive algorithm: the boxes are sorted into
+vertical slabs by the x coordinate of their centers, each slab is sorted by
+y, and runs of leaf_size boxes become leaves. The leaves are then packed the
+same way, and so on up to the root. Nodes are stored one level at a time in
+numpy arrays, so a query tests every candidate node of a level at once.
+
+The tree can't be changed once built, see SpatialIndex for incremental
+updates.
+"""
+
+import heapq
+from math import ceil,sqrt
+
+from numpy import asarray,arange,argsort,lexsort,empty,repeat,cumsum, \
+                  column_stack,minimum,maximum,hypot,zeros
+
+def _str_order(boxes,leaf_size):
+    """Return the Sort-Tile-Recursive order of boxes"""
+    n = len(boxes)
+    cx = boxes[:,0] + boxes[:,2]
+    cy = boxes[:,1] + boxes[:,3]
+
+    slab = int(ceil(sqrt(ceil(float(n) / leaf_size)))) * leaf_size
+
+    rank = empty(n,int)
+    rank[argsort(cx,kind='mergesort')] = arange(n)
+    return lexsort((cy,rank // slab))
+
+def _expand(starts,ends):
+    """Concatenate the ranges starts[i]:ends[i]"""
+    lengths = ends - starts
+    offsets = cumsum(lengths) - lengths
+    return arange(lengths.sum()) - repeat(offsets,lengths) \
+            + repeat(starts,lengths)
+
+def _intersecting(boxes,bbox):
+    """Boolean array of the boxes intersecting bbox, touching counts"""
+    (xmin,ymin,xmax,ymax) = bbox
+    return (boxes[:,0] <= xmax) & (boxes[:,2] >= xmin) & \
+           (boxes[:,1] <= ymax) & (boxes[:,3] >= ymin)
+
+def box_distance(boxes,point):
+    """Distances from point to each of boxes, zero for points inside"""
+    (x,y) = point
+    dx = maximum(maximum(boxes[:,0] - x,x - boxes[:,2]),0)
+    dy = maximum(maximum(boxes[:,1] - y,y - boxes[:,3]),0)
+    return hypot(dx,dy)
+
+class RTree(object):
+    """Static R-tree.
+
+    boxes     - Sequence of (xmin,ymin,xmax,ymax) boxes, or an Nx4 array.
+    leaf_size - Maximum number of children of every node.
+
+    Queries return indexes into boxes.
+    """
+
+    def __init__(self,boxes,leaf_size=16):
+        if leaf_size < 2:
+            raise ValueError('leaf_size must be at least 2, not %d' % leaf_size)
+        self.leaf_size = leaf_size
+        self.boxes = boxes = asarray(boxes,float).reshape(-1,4)
+
+        # The boxes in leaf order, and the index of each in boxes.
+        if len(boxes):
+            self._order = order = _str_order(boxes,leaf_size)
+        else:
+            self._order = order = zeros(0,int)
+        self._boxes = child_boxes = boxes[order]
+
+        # Levels of (boxes,starts,ends) nodes, leaves first, every node
+        # covering children starts[i]:ends[i] of the level below. The
+        # children of the top level are scanned directly.
+        self._levels = []
+        while len(child_boxes) > leaf_size:
+            n = len(child_boxes)
+            starts = arange(0,n,leaf_size)
+            ends = minimum(starts + leaf_size,n)
+            node_boxes = column_stack(
+                    (minimum.reduceat(child_boxes[:,0],starts),
+                     minimum.reduceat(child_boxes[:,1],starts),
+                     maximum.reduceat(child_boxes[:,2],starts),
+                     maximum.reduceat(child_boxes[:,3],starts)))
+
+            # Nodes are packed in the next level up the same way.
+            if len(node_boxes) > leaf_size:
+                o = _str_order(node_boxes,leaf_size)
+                node_boxes,starts,ends = node_boxes[o],starts[o],ends[o]
+
+            self._levels.append((node_boxes,starts,ends))
+            child_boxes = node_boxes
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def query(self,bbox):
+        """Return the indexes of the boxes intersecting bbox
+
+        Boxes that only touch bbox count as intersecting. The indexes are in
+        no particular order.
+        """
+        if self._levels:
+            top = self._levels[-1][0]
+        else:
+            top = self._boxes
+        idx = arange(len(top))
+
+        for (node_boxes,starts,ends) in reversed(self._levels):
+            idx = idx[_intersecting(node_boxes[idx],bbox)]
+            idx = _expand(starts[idx],ends[idx])
+
+        idx = idx[_intersecting(self._boxes[idx],bbox)]
+        return self._order[idx]
+
+    def iternearest(self,point):
+        """Iterate through (distance,index) pairs, nearest to point first
+
+        Distances are from point to the boxes, zero if point is inside. The
+        tree is searched best first, so taking the first few is cheap.
+        """
+        point = asarray(point,float).reshape(2)
+        levels = self._levels
+
+        # Heap of (distance,level,position), level -1 being the boxes
+        # themselves, so boxes are returned before nodes as far away.
+        heap = []
+        def push(level,boxes,positions):
+            for d,p in zip(box_distance(boxes[positions],point).tolist(),
+                           positions.tolist()):
+                heap.append((d,level,p))
+
+        if levels:
+            top = len(levels) - 1
+            push(top,levels[top][0],arange(len(levels[top][0])))
+        else:
+            push(-1,self._boxes,arange(len(self._boxes)))
+        heapq.heapify(heap)
+
+        while heap:
+            (d,level,p) = heapq.heappop(heap)
+            if level < 0:
+                yield d,int(self._order[p])
+                continue
+
+            (node_boxes,starts,ends) = levels[level]
+            children = arange(starts[p],ends[p])
+            if level:
+                child_boxes = levels[level - 1][0]
+            else:
+                child_boxes = self._boxes
+            for d,c in zip(box_distance(child_boxes[children],point).tolist(),
+                           children.tolist()):
+                heapq.heappush(heap,(d,level - 1,c))
+
+    def nearest(self,point,k=1):
+        """Return the k (distance,index) pairs nearest to point
+
+        See iternearest()
+        """
+        r = []
+        if k > 0:
+            for n in self.iternearest(point):
+                r.append(n)
+                if len(r) >= k:
+                    break
+        return r
@@ -20,10 +20,12 @@ DEBUG = False
 from Tuke.tests.main import *
 from Tuke.tests.meta import *
 
+from Tuke.tests.cached_attribute import *
 from Tuke.tests.element import *
 from Tuke.tests.elementref import *
 from Tuke.tests.id import *
 from Tuke.tests.connects import *
+from Tuke.tests.netlist import *
 from Tuke.tests.repr_helper import *
 
 from Tuke.tests.context._context._cfunction import *
@@ -39,6 +41,7 @@ from Tuke.tests.geometry.hole import *
 from Tuke.tests.geometry.layer import *
 from Tuke.tests.geometry.line import *
 from Tuke.tests.geometry.polygon import *
+from Tuke.tests.geometry.render_cache import *
 from Tuke.tests.geometry.transform import *
 from Tuke.tests.geometry.util import *
 from Tuke.tests.geometry.v import *
@@ -46,10 +49,17 @@ from Tuke.tests.geometry.v import *
 from Tuke.tests.pcb.pad import *
 from Tuke.tests.pcb.pin import *
 from Tuke.tests.pcb.trace.basetrace import *
+from Tuke.tests.pcb.trace.trace import *
 
 from Tuke.tests.sch.component import *
 from Tuke.tests.sch.symbol import *
 
+from Tuke.tests.spatial.centers import *
+from Tuke.tests.spatial.clearance import *
+from Tuke.tests.spatial.hit import *
+from Tuke.tests.spatial.index import *
+from Tuke.tests.spatial.rtree import *
+
 class TukeTest(TestProgram):
     """A command-line program that runs a set of tests; this is primarily
        for making test modules conveniently executable.
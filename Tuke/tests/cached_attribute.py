@@ -0,0 +1,151 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# (c) 2008 Peter Todd <pete@petertodd.org>
+#
+# This program is made available under the GNU GPL version 3.0 or
+# greater. See the accompanying file COPYING for details.
+#
+# This program is distributed WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+
+
+import common
+
+from unittest import TestCase
+import gc
+import weakref
+
+import Tuke
+from Tuke import Element,Id
+from Tuke.cached_attribute import cached_attribute,transform_depends
+from Tuke.context.wrapper import unwrap
+
+class CachedAttributeTest(TestCase):
+    """Perform tests of the cached_attribute module"""
+
+    def testCachedAttribute(self):
+        """cached_attribute()"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        class foo(Element):
+            __defaults__ = dict(spam=1)
+
+            @cached_attribute(depends=('spam','../ham'))
+            def eggs(self):
+                return (self.spam,getattr(self.parent,'ham',None))
+
+            @cached_attribute(depends=('eggs',))
+            def chained(self):
+                return self.eggs
+
+        eggs = foo.__dict__['eggs']
+        chained = foo.__dict__['chained']
+
+        f = foo(id=Id('f'))
+        T(f.eggs,(1,None))
+        T(f.eggs,(1,None))
+        T((eggs.hits,eggs.misses),(1,1))
+
+        self.assertRaises(AttributeError,setattr,f,'eggs',10)
+
+        # Own attributes
+        f.spam = 2
+        T(f.eggs,(2,None))
+        T((eggs.hits,eggs.misses),(1,2))
+
+        # Parent changes and parent attributes
+        p = Element(id=Id('p'))
+        p.ham = 'ham'
+        p.add(f)
+        T(p.f.eggs,(2,'ham'))
+        p.ham = 'can'
+        T(p.f.eggs,(2,'can'))
+        T((eggs.hits,eggs.misses),(1,4))
+
+        # Changes to the old parent don't matter after removal.
+        f = p.remove(p.f)
+        T(f.eggs,(2,None))
+        p.ham = 'spam'
+        T(f.eggs,(2,None))
+        T((eggs.hits,eggs.misses),(2,5))
+
+        # Invalidation cascades to dependent cached attributes.
+        T(f.chained,(2,None))
+        f.spam = 3
+        T(f.chained,(3,None))
+        T((chained.hits,chained.misses),(0,2))
+
+        # Explicit invalidation
+        del f.eggs
+        T(f.eggs,(3,None))
+        T((eggs.hits,eggs.misses),(3,7))
+
+        # During a batch cached values are used until anything changes, as
+        # invalidation is deferred.
+        with f.batch():
+            T(f.eggs,(3,None))
+            f.spam = 4
+            T(f.eggs,(4,None))
+            T(f.eggs,(4,None))
+            f.spam = 5
+            T(f.eggs,(5,None))
+            T((eggs.hits,eggs.misses),(5,9))
+
+        # The deferred notification invalidates values cached in the batch.
+        T(f.eggs,(5,None))
+        T(f.eggs,(5,None))
+        T((eggs.hits,eggs.misses),(6,10))
+        with f.batch():
+            T(f.eggs,(5,None))
+            f.spam = 6
+        T(f.eggs,(6,None))
+        T((eggs.hits,eggs.misses),(7,11))
+
+        # Cached values don't keep the Element alive.
+        g = foo(id=Id('g'))
+        T(g.chained,(1,None))
+        gref = weakref.ref(unwrap(g))
+        del g
+        gc.collect()
+        T(gref(),None)
+
+    def testCachedAttribute_paths(self):
+        """cached_attribute() dependencies on sub-element paths"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        calls = []
+        class foo(Element):
+            @cached_attribute(depends=(lambda self:('a/b/x',),))
+            def x(self):
+                calls.append(1)
+                try:
+                    return self['a/b'].x
+                except KeyError:
+                    return None
+
+        f = foo(id=Id('f'))
+        T(f.x,None)
+        f.add(Element(id=Id('a')))
+        T(f.x,None)
+        b = f.a.add(Element(id=Id('b')))
+        b.x = 1
+        T(f.x,1)
+        T(f.x,1)
+        T(len(calls),3)
+        f.a.b.x = 2
+        T(f.x,2)
+        f.a.remove(f.a.b)
+        T(f.x,None)
+        T(len(calls),5)
+
+    def test_transform_depends(self):
+        """transform_depends()"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        T(transform_depends(Id('a/b')),['a/transform','a/b/transform'])
+        T(transform_depends(Id('..')),['transform'])
+        T(transform_depends(Id('../../a')),
+          ['transform','../transform','../../a/transform'])
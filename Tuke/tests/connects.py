@@ -9,12 +9,14 @@
 # PURPOSE.
 
 import gc
+import random
 
 import common
 
 from unittest import TestCase
 import Tuke
 from Tuke import Element,Id,rndId,Connects
+from Tuke.context.wrapper import unwrap
 
 class ConnectsTest(TestCase):
     """Perform tests of the Connects module"""
@@ -53,10 +55,7 @@ class ConnectsTest(TestCase):
 
         # Implicit connections use a lot of weakref magic. That said, they
         # should function fine with, and without, the garbage collector
-        # enabled.
-        #
-        # That said, until Element.remove is implemented, this can't be a
-        # problem anyway.
+        # enabled. See also testConnectsRemove
         for i,gc_enabled in enumerate((False,False,False,True,True)):
             if gc_enabled:
                 gc.enable()
@@ -117,10 +116,198 @@ class ConnectsTest(TestCase):
         a2.connects.base = a2
         T(repr(a2.connects),repr(a.connects))
 
-    def testElementRemoveNotImplemented(self):
-        """Element.remove() not yet implemented"""
+    def testConnectsRemove(self):
+        """Implicit connections are torn down by Element.remove()"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        # Teardown must not depend on the garbage collector.
+        gc.disable()
+        try:
+            a = Element(id=Id('a'))
+            a.add(Element(id=Id('b')))
+            a.b.add(Element(id=Id('c')))
+            a.add(Element(id=Id('d')))
+
+            a.connects.add(a.b.c)
+            a.d.connects.add(Id('a/b'))
+            T(a.b.c.connects.to(a))
+            T(a.b.connects.to(a.d))
+
+            b = a.remove(a.b)
+            T(len(unwrap(b).c.connects._implicitly_connected),0)
+            T(len(unwrap(b).connects._implicitly_connected),0)
+
+            # Adding it back restores the implicit connections.
+            a.add(b)
+            T(a.b.c.connects.to(a))
+            T(a.b.connects.to(a.d))
+
+            # Moving the connected from Element, rather than the connected to.
+            d = a.remove(a.d)
+            T(len(unwrap(a.b).connects._implicitly_connected),0)
+            a.b.add(d)
+            T(not a.b.connects.to(a.b.d))
+
+            # The explicit connection is now relative to a.b, and dangling.
+            T(a.b.d.connects.to(Id('a/b/b')))
+            T(len(unwrap(a.b).connects._implicitly_connected),0)
+
+            # Move the connected to Element.
+            c = a.b.move(a.b.c,a.b.d)
+            T(c.id,Id('a/b/d/c'))
+            T(len(unwrap(c).connects._implicitly_connected),0)
+            T(not c.connects.to(a))
+        finally:
+            gc.enable()
+
+    def testConnectivityEngine(self):
+        """Connectivity engine incremental updates"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        def engine(e):
+            return unwrap(e)._tree.connectivity
+
+        # Dangling connection, referring to outside of the tree.
+        z = Element(id=Id('z'))
+        z.add(Element(id=Id('t')))
+        z.t.connects.add(Id('b/c'))
+        T(engine(z).waiting.keys(),[('..','b','c')])
+        T(engine(z).adjacency,{})
 
-        # This is a real test, if this fails, we need to make sure that
-        # Connects handles the case where a Element parent is removed.
+        # Re-keyed relative to the new root.
         a = Element(id=Id('a'))
-        self.assert_(not hasattr(a,'remove'))
+        a.add(z)
+        T(engine(a).waiting.keys(),[('b','c')])
+
+        # Resolved by adding b/c, and only by adding b/c
+        a.add(Element(id=Id('b')))
+        T(engine(a).waiting.keys(),[('b','c')])
+        a.b.add(Element(id=Id('c')))
+        T(engine(a).waiting,{})
+        T(set(engine(a).adjacency.keys()),
+          set((unwrap(a.z.t),unwrap(a.b.c))))
+        T(a.b.c.connects.to(a.z.t))
+        T(a.b.c.connects._implicitly_connected.keys(),[Id('a/z/t')])
+
+        # Connecting again to the same Id replaces the old connection.
+        a.z.t.connects.add(Id('a/b/c'))
+        T(len(engine(a).adjacency[unwrap(a.b.c)]),1)
+
+        # Connections within a removed sub-tree stay resolved, connections
+        # crossing the removed edge are left dangling on both sides.
+        a.b.connects.add(a.b.c)
+        b = a.remove(a.b)
+        T(engine(a).waiting.keys(),[('b','c')])
+        T(engine(b).waiting,{})
+        T(b.c.connects.to(b))
+        T(not b.c.connects.to(Id('../z/t')))
+
+        # A replaced Connects no longer connects.
+        a.add(b)
+        T(a.b.c.connects.to(a.z.t))
+        unwrap(a.z.t).connects = Connects()
+        T(not a.b.c.connects.to(a.z.t))
+
+        # A ref that climbs above the removed sub-tree root, and comes back
+        # down, is left dangling rather than resolved against the new root.
+        r = Element(id=Id('r'))
+        r.add(Element(id=Id('e')))
+        r.e.add(Element(id=Id('c')))
+        unwrap(r.e).connects.add(Id('../e/c'))
+        T(r.e.c.connects.to(r.e))
+        e = r.remove('e')
+        T(len(unwrap(e).c.connects._implicitly_connected),0)
+        T(len(unwrap(e).connects._implicitly_connected),0)
+        T(engine(e).waiting.keys(),[('..','e','c')])
+        r.add(e)
+        T(r.e.c.connects.to(r.e))
+
+    def testConnectsRemoveMoveRandom(self):
+        """remove() and move() match rebuilding the tree from scratch"""
+
+        def walk(e):
+            r = [e]
+            for s in e._subs:
+                r.extend(walk(unwrap(s)))
+            return r
+
+        def name(e):
+            return str(e.__dict__['id'])
+
+        def state(root):
+            """Connectivity of every Element under root, by path"""
+            r = {}
+            for e in walk(root):
+                explicit = []
+                for ref,eref in dict.iteritems(e.connects):
+                    target = None
+                    if eref.target is not None:
+                        target = eref.target._path
+                    explicit.append((tuple(ref),target))
+                implicit = [tuple(i) for i in e.connects._implicitly_connected]
+                r[e._path] = (sorted(explicit),sorted(implicit))
+
+            waiting = {}
+            if root._tree is not None and root._tree.connectivity is not None:
+                for path,erefs in root._tree.connectivity.waiting.iteritems():
+                    waiting[path] = len(erefs)
+            return (r,waiting)
+
+        def rebuild(root):
+            """Build a copy of root from scratch, subs first, then connects"""
+            def copy(e):
+                n = Element(id=name(e))
+                for s in e._subs:
+                    n.add(copy(unwrap(s)))
+                return n
+            new = unwrap(copy(root))
+            for e,n in zip(walk(root),walk(new)):
+                for ref in dict.iterkeys(e.connects):
+                    n.connects.add(ref)
+            return new
+
+        for seed in range(200):
+            rnd = random.Random(seed)
+            # Wrapped, as add() needs, the Elements themselves are unwrapped.
+            roots = [Element(id='n0')]
+            n = 1
+            for step in range(20):
+                elems = []
+                for root in roots:
+                    elems.extend(walk(unwrap(root)))
+                non_roots = [e for e in elems if e.parent is not None]
+
+                op = rnd.choice(('add','add','connect','connect',
+                                 'remove','move','readd'))
+                if op == 'add':
+                    rnd.choice(elems).add(Element(id='n%d' % n))
+                    n += 1
+                elif op == 'connect':
+                    # Refs climbing anywhere from not at all to above the
+                    # root, to any Element in any tree.
+                    src = rnd.choice(elems)
+                    target = rnd.choice(elems)
+                    ref = ['..'] * rnd.randint(0,len(src._path) + 1)
+                    ref.extend(target._path)
+                    src.connects.add(Id('/'.join(ref) or '.'))
+                elif op == 'remove' and non_roots:
+                    e = rnd.choice(non_roots)
+                    roots.append(unwrap(e.parent).remove(name(e)))
+                elif op == 'move' and non_roots:
+                    e = rnd.choice(non_roots)
+                    inside = set(walk(e))
+                    to = rnd.choice([t for t in elems if t not in inside])
+                    unwrap(e.parent).move(name(e),to)
+                elif op == 'readd' and len(roots) > 1:
+                    e = rnd.choice(roots[1:])
+                    roots.remove(e)
+                    inside = set(walk(unwrap(e)))
+                    to = rnd.choice([t for t in elems if t not in inside])
+                    to.add(e)
+
+                for root in roots:
+                    a,b = state(unwrap(root)),state(rebuild(unwrap(root)))
+                    self.assertEqual(a,b,
+                                     'seed %d step %d %s' % (seed,step,op))
@@ -141,3 +141,221 @@ class SourceTest(TestCase):
         a.notify('foo',f)
         a.foo = 10
         T(f.called)
+
+    def test_Source_batch(self):
+        """Source notification batching"""
+        from Tuke.context.source import batch_begin,batch_end,batching,batch_serial,Batch
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        class cb:
+            def __init__(self,source,attr):
+                self.source = source
+                self.attr = attr
+                self.v = []
+            def __call__(self):
+                self.v.append(getattr(self.source,self.attr))
+
+        self.assertRaises(RuntimeError,batch_end)
+
+        a = Source()
+        b = Source()
+        ca = cb(a,'spam')
+        cb1 = cb(b,'ham')
+        cb2 = cb(b,'ham')
+        a.notify('spam',ca)
+        b.notify('ham',cb1)
+
+        batch_begin()
+        for i in range(10):
+            a.spam = i
+        b.ham = 'can'
+
+        # Callbacks added during the batch are coalesced as well.
+        b.notify('ham',cb2)
+        b.ham = 'eggs'
+
+        # Nothing is called until the batch ends, and values are visible
+        # immediately.
+        T(ca.v,[])
+        T(cb1.v,[])
+        T(a.spam,9)
+
+        # Nested
+        batch_begin()
+        a.spam = 10
+        T(batch_end(),None)
+        T(ca.v,[])
+
+        T(batch_end(),(13,11,3))
+        T(ca.v,[10])
+        T(cb1.v,['eggs'])
+        T(cb2.v,['eggs'])
+
+        # Callbacks are still one-shot, and notification is immediate again.
+        a.spam = 11
+        T(ca.v,[10])
+        a.notify('spam',ca)
+        a.spam = 12
+        T(ca.v,[10,12])
+
+        # The serial changes only when a notification is deferred.
+        a.notify('spam',ca)
+        serial = batch_serial()
+        with Batch():
+            b.eggs = 'unwatched'
+            T(batch_serial(),serial)
+            a.spam = 12
+            T(batch_serial(),serial + 1)
+        T(ca.v,[10,12,12])
+
+        # Only deferred notifications count.
+        a.notify('spam',ca)
+        a.spam = 12
+        T(batch_serial(),serial + 1)
+
+        # Callbacks that died while pending are skipped.
+        ca = cb(a,'spam')
+        a.notify('spam',ca)
+        batch_begin()
+        a.spam = 13
+        del ca
+        T(batch_end(),(1,0,0))
+
+        # Batch context manager
+        c = cb(a,'spam')
+        a.notify('spam',c)
+        with Batch() as t:
+            a.spam = 14
+            a.spam = 15
+            T(c.v,[])
+        T(c.v,[15])
+        T((t.notifications,t.coalesced,t.callbacks),(2,1,1))
+
+        # Notifications are delivered even if the with block raises.
+        c = cb(a,'spam')
+        a.notify('spam',c)
+        def f():
+            with Batch():
+                a.spam = 16
+                raise ValueError
+        self.assertRaises(ValueError,f)
+        T(c.v,[16])
+
+        # A callback raising doesn't stop the rest from being called, the
+        # first exception is re-raised once they all have been.
+        class raises(cb):
+            def __init__(self,source,attr,ex):
+                cb.__init__(self,source,attr)
+                self.ex = ex
+            def __call__(self):
+                cb.__call__(self)
+                raise self.ex
+        c1 = raises(a,'spam',KeyError)
+        c2 = cb(a,'spam')
+        c3 = raises(b,'ham',IndexError)
+        c4 = cb(b,'ham')
+        a.notify('spam',c1)
+        a.notify('spam',c2)
+        b.notify('ham',c3)
+        u4 = b.subscribe('ham',c4)
+        batch_begin()
+        a.spam = 17
+        b.ham = 'spam'
+        self.assertRaises(KeyError,batch_end)
+        T((c1.v,c2.v,c3.v,c4.v),([17],[17],['spam'],['spam']))
+        u4()
+        T(batching(),False)
+
+        # Notification is immediate again afterwards.
+        a.notify('spam',c2)
+        a.spam = 18
+        T(c2.v,[17,18])
+
+    def test_Source_subscribe(self):
+        """Source.subscribe"""
+        from Tuke.context.source import Batch
+        import weakref
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        class cb:
+            def __init__(self,source,attr):
+                self.source = source
+                self.attr = attr
+                self.v = []
+            def __call__(self):
+                self.v.append(getattr(self.source,self.attr,None))
+
+        a = Source()
+        self.assertRaises(TypeError,lambda:a.subscribe(1,lambda:None))
+        self.assertRaises(TypeError,lambda:a.subscribe('spam',None))
+
+        # Subscriptions are persistent, and strongly referenced.
+        c1 = cb(a,'spam')
+        c2 = cb(a,'spam')
+        u1 = a.subscribe('spam',c1)
+        u2 = a.subscribe('spam',c2)
+        crefs = sys.getrefcount(c1)
+        for i in range(3):
+            a.spam = i
+        del a.spam
+        T(c1.v,[0,1,2,None])
+        T(c2.v,[0,1,2,None])
+        T(sys.getrefcount(c1),crefs)
+
+        # Unsubscribing is idempotent and only effects the one subscription.
+        u1()
+        u1()
+        a.spam = 3
+        T(c1.v,[0,1,2,None])
+        T(c2.v,[0,1,2,None,3])
+
+        # Coexists with one-shot notify() callbacks, and is batched.
+        c3 = cb(a,'spam')
+        a.notify('spam',c3)
+        with Batch() as t:
+            a.spam = 4
+            a.spam = 5
+            T(c2.v,[0,1,2,None,3])
+        T(c2.v,[0,1,2,None,3,5])
+        T(c3.v,[5])
+        T((t.notifications,t.coalesced,t.callbacks),(2,1,2))
+
+        # Subscribers may unsubscribe themselves when called.
+        class once(cb):
+            def __call__(self):
+                cb.__call__(self)
+                self.unsubscribe()
+        c4 = once(a,'spam')
+        c4.unsubscribe = a.subscribe('spam',c4)
+        a.spam = 6
+        a.spam = 7
+        T(c4.v,[6])
+
+        # Subscribing through __shadowless__ is the same as subscribing
+        # directly.
+        c6 = cb(a,'spam')
+        u6 = a.__shadowless__.subscribe('spam',c6)
+        a.spam = 8
+        T(c6.v,[8])
+        a.__shadowless__.touch('spam')
+        T(c6.v,[8,8])
+        u6()
+
+        # The handle doesn't keep the Source alive.
+        b = Source()
+        u5 = b.subscribe('ham',lambda:None)
+        bref = weakref.ref(b)
+        del b
+        T(bref(),None)
+        u5()
+
+        # Nor does a subscriber referencing the Source, the cycle is
+        # collectable.
+        b = Source()
+        b.subscribe('ham',cb(b,'ham'))
+        bref = weakref.ref(b)
+        del b
+        gc.collect()
+        T(bref(),None)
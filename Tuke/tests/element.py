@@ -87,10 +87,90 @@ class ElementTest(TestCase):
         T(not unwrap(a).__dict_callbacks__.has_key('b'))
         T(not unwrap(b).__dict_callbacks__.has_key('parent'))
 
-        # Test for removing an object, just a check that there is no .remove
-        # for now.
-        T(not hasattr(a,'remove'))
+        # Called for removing an object
+        cb1 = cb()
+        a.topology_notify(Id('a/b'),cb1)
+        cbp = cb()
+        b.topology_notify(Id('.'),cbp)
+
+        a.remove(b)
+
+        T(cb1.count,1)
+        T(cbp.count,1)
+        T(not unwrap(a).__dict_callbacks__.has_key('b'))
+        T(not unwrap(b).__dict_callbacks__.has_key('parent'))
+
+
+    def testElementTopologySubscribe(self):
+        """Element.topology_subscribe()"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        class cb:
+            def __init__(self):
+                self.count = 0
+            def __call__(self):
+                self.count += 1
+
+        a = Element(id=Id('a'))
+        b = Element(id=Id('b'))
+
+        self.assertRaises(ValueError,
+                          lambda:a.topology_subscribe(Id('a/b/c'),lambda:None))
+        self.assertRaises(TypeError,
+                          lambda:a.topology_subscribe('a/b',lambda:None))
+
+        cbs = cb()
+        cbp = cb()
+        us = a.topology_subscribe(Id('a/b'),cbs)
+        up = b.topology_subscribe(Id('.'),cbp)
+
+        for i in range(3):
+            a.add(b)
+            a.remove(b)
+        T(cbs.count,6)
+        T(cbp.count,6)
+
+        us()
+        up()
+        a.add(b)
+        T(cbs.count,6)
+        T(cbp.count,6)
+
+    def testElementBatch(self):
+        """Element.batch()"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        class cb:
+            def __init__(self):
+                self.count = 0
+            def __call__(self):
+                self.count += 1
+
+        a = Element(id=Id('a'))
+        b = Element(id=Id('b'))
+        cbs = cb()
+        cbp = cb()
+        a.topology_notify(Id('a/b'),cbs)
+        b.topology_notify(Id('.'),cbp)
+
+        with a.batch() as t:
+            a.add(b)
+            a.remove(b)
+            a.add(b)
+            T(cbs.count,0)
+            T(cbp.count,0)
+
+        T(cbs.count,1)
+        T(cbp.count,1)
+        T((t.notifications,t.coalesced,t.callbacks),(6,4,2))
 
+        # Topology is fully up to date within the batch.
+        c = Element(id=Id('c'))
+        with a.batch():
+            a.b.add(c)
+            T(a['b/c'].id,Id('a/b/c'))
     def testElementCommonParent(self):
         """Element._common_parent and related functions"""
         def T(got,expected = True):
@@ -162,6 +242,99 @@ class ElementTest(TestCase):
         # parent.
         T(ValueError,Element().add(Element()))
 
+    def testElementRemove(self):
+        """Element.remove()"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+        def R(ex,fn):
+            self.assertRaises(ex,fn)
+
+        a = Element(id='a')
+        for n in ('b','c','d','e'):
+            a.add(Element(id=n))
+        a.b.add(Element(id='x'))
+        a.b.x.add(Element(id='y'))
+
+        # By Element, returned wrapped only in itself.
+        b = a.remove(a.b)
+        T(b.id,Id('b'))
+        T(b.parent,None)
+        T(not hasattr(a,'b'))
+        T(b.x.y.id,Id('b/x/y'))
+        R(KeyError,lambda: a['b'])
+        R(KeyError,lambda: a['b/x/y'])
+
+        # The removed sub-tree has it's own index.
+        T(b['x/y'].id,Id('b/x/y'))
+        T(unwrap(b)._tree is not unwrap(a)._tree)
+        T(sorted(unwrap(a)._tree.paths.keys()),[('c',),('d',),('e',)])
+
+        # By Id, and by name
+        c = a.remove(Id('a/c'))
+        T(c.id,Id('c'))
+        d = a.remove('d')
+        T(d.id,Id('d'))
+        T([e.id for e in a],[Id('a/e')])
+
+        # Not sub-elements
+        R(KeyError,lambda: a.remove('b'))
+        R(KeyError,lambda: a.remove(b))
+        R(KeyError,lambda: a.remove(Element(id='e')))
+        R(KeyError,lambda: a.remove(Id('a/e/f')))
+        R(KeyError,lambda: a.e.remove(Id('..')))
+
+        # Sub-sub-elements
+        a.add(b)
+        y = a.b.x.remove(a.b.x.y)
+        T(y.id,Id('y'))
+        T(not hasattr(a.b.x,'y'))
+        T(sorted(unwrap(a)._tree.paths.keys()),[('b',),('b','x'),('e',)])
+
+        # Re-adding, iteration is in the new insertion order.
+        a.add(d)
+        a.add(c)
+        T([e.id for e in a],[Id('a/e'),Id('a/b'),Id('a/d'),Id('a/c')])
+        T(a['b/x'].id,Id('a/b/x'))
+
+        # Collided attributes are left alone.
+        a.f = 10
+        a.add(Element(id='f'))
+        T(a['f'].id,Id('a/f'))
+        a.remove('f')
+        T(a.f,10)
+        R(KeyError,lambda: a['f'])
+
+        # Lots of adds and removes
+        for i in xrange(100):
+            a.add(Element(id='_%d' % i))
+        for i in xrange(0,100,2):
+            a.remove('_%d' % i)
+        T([str(e.id) for e in a][4:],['a/_%d' % i for i in xrange(1,100,2)])
+
+    def testElementMove(self):
+        """Element.move()"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        a = Element(id='a')
+        a.add(Element(id='b'))
+        a.add(Element(id='c',transform=Translation(V(1,2))))
+        a.b.add(Element(id='x'))
+        a.b.x.add(Element(id='y'))
+
+        y = a.b.x.move(Id('a/b/x/y'),a.c)
+        T(y.id,Id('a/c/y'))
+        T(a.c.y is y)
+        T(not hasattr(a.b.x,'y'))
+        T(repr(a['c/y'].transform),repr(Translation(V(1.0,2.0))))
+
+        x = a.b.move(a.b.x,a)
+        T(x.id,Id('a/x'))
+        T(a['x'] is x)
+        T(sorted(unwrap(a)._tree.paths.keys()),[('b',),('c',),('c','y'),('x',)])
+
     def testElementInteration(self):
         """Element interation"""
 
@@ -181,6 +354,29 @@ class ElementTest(TestCase):
 
         T(a,set(('a/_1','a/_2','a/_3')))
 
+    def testElementInterationOrder(self):
+        """Element interation is in insertion order"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        a = Element(id='a')
+        names = ('z','_3','b','_10','a')
+        for n in names:
+            a.add(Element(id=n))
+
+        # Non-Element attributes are never iterated over, even if they collide
+        # with a sub-element.
+        a.foo = 'foo'
+        a.b2 = 10
+        a.add(Element(id='b2'))
+
+        T([e.id for e in a],[Id('a/' + n) for n in names + ('b2',)])
+        T(a.z.id,Id('a/z'))
+        T(a.b2,10)
+        T(a['b2'].id,Id('a/b2'))
+        T([e.id for e in a.z],[])
+
     def testElement__getitem__(self):
         """Element[] lookups"""
         def T(elem,key,expected_id):
@@ -225,6 +421,56 @@ class ElementTest(TestCase):
         self.assert_(a.e.foo is e.foo)
         self.assert_(a['e'].foo is e.foo)
 
+    def testElement__getitem__path_index(self):
+        """Element[] deep lookups through the path index"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        # Build one tree top down, and another bottom up, then graft the
+        # latter onto the former.
+        a = Element(id='a')
+        a.add(Element(id='b'))
+        a.b.add(Element(id='c'))
+
+        x = Element(id='x',transform=Translation(V(1,0)))
+        x.add(Element(id='y',transform=Translation(V(0,2))))
+        x.y.add(Element(id='z'))
+        T(x['y/z'].id,Id('x/y/z'))
+
+        a.b.c.add(x)
+
+        # Deep lookups are wrapped exactly the same as attribute access is.
+        for base,path in ((a,'b/c/x/y/z'),
+                          (a.b,'c/x/y/z'),
+                          (a.b.c,'x/y'),
+                          (a.b.c.x,'y/z')):
+            got = base[path]
+            expected = eval('base.' + path.replace('/','.'))
+            T(got.id,expected.id)
+            T(repr(got.transform),repr(expected.transform))
+            T(unwrap(got) is unwrap(expected))
+        T(a['b/c/x/y/z'].id,Id('a/b/c/x/y/z'))
+        T(repr(a['b/c/x/y/z'].transform),repr(Translation(V(1.0,2.0))))
+
+        # The index is shared by the whole tree.
+        T(unwrap(x)._tree is unwrap(a)._tree)
+        T(unwrap(x.y.z)._path,('b','c','x','y','z'))
+
+        # Upwards, and mixed, lookups still work.
+        T(a.b.c.x['../../c/x/y'].id,Id('a/b/c/x/y'))
+
+        def R(elem,key,msg):
+            try:
+                elem[key]
+            except KeyError, err:
+                T(str(err),repr(msg))
+            else:
+                self.fail('KeyError not raised')
+        R(a,'b/q',"'q' is not a sub-Element of 'b'")
+        R(a,'b/c/q/r',"'q/r' is not a sub-Element of 'c'")
+        R(Element(id='n'),'q/r',"'q/r' is not a sub-Element of 'n'")
+
     def testElementIterlayout(self):
         """Element.iterlayout()"""
 
@@ -262,6 +508,356 @@ class ElementTest(TestCase):
         T(set([elem.id for elem in e.iterlayout(layer_mask='sch.*')]),
           set((Id('base/chip/sym'),)))
 
+    def testElementIterlayoutWorld(self):
+        """Element.iterlayout_world()"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'expected: %s  got: %s' % (expected,got))
+
+        from Tuke import WorldLayout
+        from Tuke.geometry import Circle,rotate
+        from numpy import allclose
+
+        e = Element(id='base')
+        e.add(Element(id='chip'))
+        e.chip.add(Element(id='pad'))
+        e.chip.add(Circle(dia=1,layer='sch.lines',id='sym'))
+        e.chip.pad.add(Circle(dia=2,layer='top.copper',id='pad'))
+        translate(e.chip,V(1,1))
+        rotate(e.chip.pad,1)
+        translate(e.chip.pad,V(2,3))
+        translate(e.chip.pad.pad,V(-1,0))
+
+        def check(elem,layer_mask=None):
+            wrapped = list(elem.iterlayout(layer_mask))
+            world = list(elem.iterlayout_world(layer_mask))
+            T(len(wrapped),len(world))
+            for w,(g,t) in zip(wrapped,world):
+                T(g is unwrap(w))
+                # Composition order differs, so allow for rounding.
+                T(allclose(t,w.transform))
+                for v1,v2 in zip([t(v) for v in g.render()[0]],w.render()[0]):
+                    T(allclose(v1,v2))
+            return world
+
+        r = check(e)
+        T(len(r),2)
+        T(isinstance(r[0],WorldLayout))
+        check(e.chip)
+        check(e.chip.pad)
+        (r,) = check(e,layer_mask='top.*')
+        T(r[0].dia,2)
+
+    def testElementIterlayoutDemux(self):
+        """Element.iterlayout_demux()"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'expected: %s  got: %s' % (expected,got))
+
+        from Tuke.geometry import Circle
+
+        e = Element(id='base')
+        e.add(Element(id='chip'))
+        e.chip.add(Circle(dia=1,layer='top.copper',id='a'))
+        e.chip.add(Circle(dia=1,layer='bottom.copper',id='b'))
+        e.chip.add(Circle(dia=1,layer='top.silk',id='c'))
+        e.add(Circle(dia=1,layer='sch.lines',id='d'))
+        translate(e.chip,V(1,1))
+
+        masks = {'copper':'*.copper','top':'top.*','none':'foo'}
+        got = [(outputs,str(g.__shadowless__.id)) for outputs,(g,t) in e.iterlayout_demux(masks)]
+        T(got,[(('copper','top'),'a'),(('copper',),'b'),(('top',),'c')])
+
+        # Each output gets what iterlayout_world() would give for it's mask.
+        for name,mask in masks.items():
+            expected = [(g,repr(t)) for g,t in e.iterlayout_world(mask)]
+            T([(g,repr(t)) for outputs,(g,t) in e.iterlayout_demux(masks)
+                           if name in outputs],
+              expected)
+
+    def testElementTransformCaches(self):
+        """Element._transform_inverse and _world_transform"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'expected: %s  got: %s' % (expected,got))
+
+        from Tuke.geometry import rotate
+        from numpy import allclose
+
+        inverse = Element.__dict__['_transform_inverse']
+        world = Element.__dict__['_world_transform']
+
+        e = Element(id='base')
+        e.add(Element(id='chip'))
+        e.chip.add(Element(id='pad'))
+        translate(e.chip,V(1,1))
+        rotate(e.chip.pad,1)
+        translate(e.chip.pad,V(2,3))
+
+        pad = unwrap(e.chip.pad)
+
+        def counts(ca,f):
+            h,m = ca.hits,ca.misses
+            f()
+            return (ca.hits - h,ca.misses - m)
+
+        T(counts(inverse,lambda: pad._transform_inverse),(0,1))
+        T(counts(inverse,lambda: pad._transform_inverse),(1,0))
+        T(allclose(pad._transform_inverse,pad.__shadowless__.transform.I))
+
+        # Removing our context uses the cached inverse.
+        T(counts(inverse,lambda: V(1,1)._remove_context(pad.__shadowless__)),(1,0))
+
+        # Changing the transform invalidates.
+        translate(e.chip.pad,V(1,0))
+        T(counts(inverse,lambda: pad._transform_inverse),(0,1))
+        T(allclose(pad._transform_inverse,pad.__shadowless__.transform.I))
+
+        T(counts(world,lambda: pad._world_transform),(0,3))
+        T(counts(world,lambda: pad._world_transform),(1,0))
+        T(allclose(pad._world_transform,e.chip.pad.transform))
+
+        # So does changing the transform of any parent.
+        translate(e.chip,V(0,2))
+        T(counts(world,lambda: pad._world_transform),(1,2))
+        T(allclose(pad._world_transform,e.chip.pad.transform))
+
+        # As well as reparenting.
+        e2 = Element(id='other')
+        translate(e2,V(5,5))
+        e2.add(e.remove(e.chip))
+        T(counts(world,lambda: pad._world_transform),(0,3))
+        T(allclose(pad._world_transform,e2.chip.pad.transform))
+
+    def testElementBBox(self):
+        """Element.bbox()"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'expected: %s  got: %s' % (expected,got))
+
+        from Tuke.geometry import Hole
+
+        bbox = Element.__dict__['_world_bbox']
+        def misses(f):
+            m = bbox.misses
+            f()
+            return bbox.misses - m
+
+        e = Element(id='base')
+        T(e.bbox(),None)
+        e.add(Element(id='chip'))
+        e.chip.add(Hole(dia=2,id='a'))
+        e.chip.add(Hole(dia=2,id='b'))
+        translate(e.chip.b,V(10,0))
+        translate(e.chip,V(0,5))
+
+        T(e.bbox(),(-1.0,4.0,11.0,6.0))
+        T(e.chip.bbox(),(-1.0,4.0,11.0,6.0))
+        T(e.chip.a.bbox(),(-1.0,4.0,1.0,6.0))
+        T(misses(e.bbox),0)
+
+        # Transforms invalidate everything above, and only that.
+        translate(e.chip.a,V(0,10))
+        T(misses(e.bbox),3)
+        T(e.bbox(),(-1.0,4.0,11.0,16.0))
+
+        # As do geometry arguments, and adding and removing sub-elements.
+        e.chip.a.dia = 4
+        T(e.bbox(),(-2.0,4.0,11.0,17.0))
+        e.chip.remove(e.chip.a)
+        T(e.bbox(),(9.0,4.0,11.0,6.0))
+        e.add(Hole(dia=2,id='c'))
+        T(e.bbox(),(-1.0,-1.0,11.0,6.0))
+        T(misses(e.bbox),0)
+
+    def testElementBBoxTrace(self):
+        """Element.bbox() and iterlayout(region=) of moved Trace endpoints"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'expected: %s  got: %s' % (expected,got))
+
+        from Tuke.pcb import Point
+        from Tuke.pcb.trace import Trace
+
+        e = Element(id='base')
+        e.add(Point(id='p'))
+        e.add(Element(id='chip'))
+        q = Point(id='q')
+        translate(q,V(10,0))
+        e.chip.add(q)
+        t = e.add(Trace(thickness=2,id='t'))
+        t.set_endpoints(e.p,e.chip.q)
+
+        # Rendered end caps are inside the true circles.
+        def bbox(e):
+            return tuple([round(c,3) for c in unwrap(e).bbox()])
+
+        T(bbox(t),(-1.0,-1.0,11.0,1.0))
+        T(bbox(e),(-1.0,-1.0,11.0,1.0))
+        T(len(list(e.iterlayout(region=(4,4,6,6)))),0)
+
+        # Moving an endpoint invalidates the boxes of the trace, and above.
+        translate(e.chip,V(0,10))
+        T(bbox(t),(-1.0,-1.0,11.0,11.0))
+        T(bbox(e),(-1.0,-1.0,11.0,11.0))
+        T([str(g.id) for g in e.iterlayout(region=(4,4,6,6))],
+          ['base/t/copper'])
+
+    def testElementIterlayoutRegion(self):
+        """Element.iterlayout(region=)"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'expected: %s  got: %s' % (expected,got))
+
+        from Tuke.geometry import Hole
+
+        e = Element(id='base')
+        for i in range(4):
+            row = Element(id='row%d' % i)
+            for j in range(4):
+                row.add(Hole(dia=1,id='h%d' % j))
+                translate(row['h%d' % j],V(j * 10,0))
+            translate(row,V(0,i * 10))
+            e.add(row)
+
+        def ids(layout):
+            return [name(unwrap(g)) for g in layout]
+        def name(raw):
+            return '%s/%s' % (unwrap(raw.parent).__shadowless__.id,
+                              raw.__shadowless__.id)
+
+        T(ids(e.iterlayout(region=(-1,-1,1,1))),['row0/h0'])
+        T(ids(e.iterlayout(region=(5,5,15,25))),['row1/h1','row2/h1'])
+        T(ids(e.iterlayout(region=(100,100,200,200))),[])
+        T(ids([g for g,t in e.iterlayout_world(region=(5,5,15,25))]),
+          ['row1/h1','row2/h1'])
+
+        # Same results as checking every geometry
+        region = (8,-3,22,13)
+        T(ids(e.iterlayout(region=region)),
+          ids([g for g in e.iterlayout()
+                 if unwrap(g).bbox()[0] <= region[2] and
+                    unwrap(g).bbox()[2] >= region[0] and
+                    unwrap(g).bbox()[1] <= region[3] and
+                    unwrap(g).bbox()[3] >= region[1]]))
+
+        # Rows outside of the region aren't descended into.
+        import Tuke.element
+        checked = set()
+        old = Tuke.element._bbox_in_region
+        def f(bbox,region):
+            checked.add(bbox)
+            return old(bbox,region)
+        try:
+            Tuke.element._bbox_in_region = f
+            list(e.iterlayout(region=(-1,-1,1,1)))
+        finally:
+            Tuke.element._bbox_in_region = old
+        T(sorted(checked),
+          sorted([unwrap(r).bbox() for r in e] +
+                 [unwrap(h).bbox() for h in e.row0]))
+
+    def testElementPick(self):
+        """Element.pick()"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'expected: %s  got: %s' % (expected,got))
+
+        from Tuke.geometry import Hole,Polygon
+
+        e = Element(id='base')
+        e.add(Element(id='chip'))
+        e.chip.add(Polygon(ext=((0,0),(10,0),(10,10),(0,10)),
+                           int=(((4,4),(6,4),(6,6),(4,6)),),
+                           layer='top.copper',id='p'))
+        e.chip.add(Hole(dia=2,layer='top.drill',id='h'))
+        translate(e.chip.h,V(2,2))
+        translate(e.chip,V(100,0))
+
+        def ids(l):
+            return [str(g.id) for g in l]
+
+        T(ids(e.pick(V(101,1))),['base/chip/p'])
+        T(ids(e.pick(V(102,2))),['base/chip/p','base/chip/h'])
+        T(ids(e.pick(V(102,2),'*.drill')),['base/chip/h'])
+        T(ids(e.pick(V(105,5))),[])
+        T(ids(e.pick(V(105,5),tolerance=1.5)),['base/chip/p'])
+        T(ids(e.pick(V(2,2))),[])
+
+        # The point is in the coordinates the element is seen in.
+        T(ids(e.chip.pick(V(102,2))),['base/chip/p','base/chip/h'])
+        T(ids(unwrap(e.chip).pick(V(2,2))),['p','h'])
+
+        # Traces are picked where their endpoints have moved them to.
+        from Tuke.pcb import Point
+        from Tuke.pcb.trace import Trace
+        e.add(Point(id='x'))
+        e.add(Element(id='pins'))
+        y = Point(id='y')
+        translate(y,V(-10,0))
+        e.pins.add(y)
+        t = e.add(Trace(thickness=1,id='t'))
+        t.set_endpoints(e.x,e.pins.y)
+        T(ids(e.pick(V(-5,0))),['base/t/copper'])
+        T(ids(e.pick(V(-5,-5))),[])
+
+        translate(e.pins,V(0,-10))
+        T(ids(e.pick(V(-5,-5))),['base/t/copper'])
+        T(ids(e.pick(V(-5,-5))),['base/t/copper'])
+        T(ids(e.pick(V(-5,0))),[])
+
+    def testElementWalk(self):
+        """Element.walk()"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'expected: %s  got: %s' % (expected,got))
+
+        def ids(i):
+            return [str(e.id) for e in i]
+
+        a = Element(id='a')
+        a.add(Element(id='b'))
+        a.b.add(Element(id='c'))
+        a.b.c.add(Geometry(layer='top.copper',id='g'))
+        a.b.add(Element(id='d'))
+        a.add(Geometry(layer='top.copper',id='e'))
+
+        T(ids(a.walk()),['a/b','a/b/c','a/b/c/g','a/b/d','a/e'])
+        T(ids(a.walk(order='post')),['a/b/c/g','a/b/c','a/b/d','a/b','a/e'])
+        T(ids(a.walk(order='bfs')),['a/b','a/e','a/b/c','a/b/d','a/b/c/g'])
+        T(ids(a.b.walk()),['a/b/c','a/b/c/g','a/b/d'])
+        self.assertRaises(ValueError,lambda:list(a.walk(order='in')))
+
+        # Pruning skips sub-elements, but not the element itself.
+        prune = lambda e:e.id == Id('a/b/c')
+        T(ids(a.walk(prune=prune)),['a/b','a/b/c','a/b/d','a/e'])
+        T(ids(a.walk(order='post',prune=prune)),['a/b/c','a/b/d','a/b','a/e'])
+        T(ids(a.walk(order='bfs',prune=prune)),['a/b','a/e','a/b/c','a/b/d'])
+
+        # Type filtering still descends into other types.
+        T(ids(a.walk(types=Geometry)),['a/b/c/g','a/e'])
+        T(ids(a.walk(types=(Geometry,),order='bfs')),['a/e','a/b/c/g'])
+
+        # Elements are wrapped as though looked up directly.
+        translate(a.b,V(1,1))
+        translate(a.b.c,V(2,3))
+        (g,) = a.b.walk(types=Geometry)
+        T(repr(g.transform),repr(a.b.c.g.transform))
+        T(g.parent.id,Id('a/b/c'))
+
+        # Deeper than the recursion limit.
+        import sys
+        n = sys.getrecursionlimit() + 100
+        d = Element(id='d')
+        e = d
+        for i in xrange(n):
+            e = unwrap(e).add(Element(id='e'))
+        e.add(Geometry(layer='top.copper',id='g'))
+        T(len(list(d.walk())),n + 1)
+        T(len(list(d.walk(order='post'))),n + 1)
+        T(len(list(d.walk(order='bfs'))),n + 1)
+        T(len(list(d.iterlayout())),1)
+
     def testElement_with(self):
         """with Element()"""
 
@@ -297,6 +893,46 @@ class ElementTest(TestCase):
         a.foo.bar = 'bar'
         self.assert_(a.foo.bar is foo.bar)
 
+    def testElement_compile_schema(self):
+        """Element._compile_schema()"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        calls = []
+        class a(Element):
+            __required__ = ('spam',)
+            __defaults__ = {'ham':1}
+            def _init(self):
+                calls.append('a')
+        class b(a):
+            pass
+        class c(b):
+            __defaults__ = {'eggs':2}
+            def _init(self):
+                calls.append('c')
+
+        sa = a._compile_schema()
+        sc = c._compile_schema()
+        T(sa is a._compile_schema())
+        T(sa is not sc)
+        T(sc.valid,frozenset(('id','transform','connects','spam','ham','eggs')))
+        T(set(sc.required),set(('spam',)))
+
+        # Inherited _init's are only called once.
+        c(spam=0)
+        T(calls,['a','c'])
+        del calls[:]
+        b(spam=0)
+        T(calls,['a'])
+
+        self.assertRaises(TypeError,lambda: c())
+        self.assertRaises(TypeError,lambda: c(spam=0,foo=1))
+
+        class badversion(Element):
+            __version__ = ('1',0)
+        self.assertRaises(ValueError,lambda: badversion())
+        self.assertRaises(ValueError,lambda: badversion())
+
     def testElementVersionChecking(self):
         """Element __version__ checking"""
 
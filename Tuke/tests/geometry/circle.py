@@ -18,7 +18,8 @@ from unittest import TestCase
 from Tuke import Id
 from Tuke.geometry import Circle,V
 
-from Tuke.geometry.circle import arc_points
+from Tuke.geometry.circle import arc_points,unit_arc,render_circles,arc_segments
+from Tuke.units import MM
 
 from math import pi,cos,sin,radians
 
@@ -58,6 +59,89 @@ class GeometryCircleTest(TestCase):
                  V(-cos(radians(45))/2,-sin(radians(45))/2),
                  V(0,-0.5)))
 
+    def testGeometryCircle_unit_arc(self):
+        """unit_arc() tables are cached"""
+
+        import Tuke.geometry.circle
+
+        t = unit_arc(0,pi,4)
+        self.assert_(unit_arc(0,pi,4) is t)
+        self.assert_(not t.flags.writeable)
+        self.assert_((arc_points(0,pi,2,4) == t * 2).all())
+
+        # The cache is emptied when full, but tables still come out the same.
+        m = Tuke.geometry.circle._unit_arcs_max
+        try:
+            Tuke.geometry.circle._unit_arcs_max = 2
+            unit_arc(0,1,4)
+            unit_arc(0,2,4)
+            self.assert_(len(Tuke.geometry.circle._unit_arcs) <= 2)
+            self.assert_((unit_arc(0,pi,4) == t).all())
+        finally:
+            Tuke.geometry.circle._unit_arcs_max = m
+
+    def testGeometryCircle_render_circles(self):
+        """render_circles()"""
+
+        circles = [Circle(dia=d,layer='foo') for d in (1,2,0.5)]
+        rendered = render_circles(circles)
+        self.assert_(len(rendered) == 3)
+        for c,(ext,int) in zip(circles,rendered):
+            (ext2,int2) = c.render()
+            self.assert_((ext == ext2).all())
+            self.assert_(int == int2)
+        self.assert_(render_circles([]) == [])
+
+    def testGeometryCircle_arc_segments(self):
+        """arc_segments()"""
+        import Tuke.geometry.circle
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        def chord_error(r,angle,n):
+            return r * (1 - cos(angle / n / 2))
+
+        for r in (0.15 * MM,0.5 * MM,10 * MM):
+            for tol in (0.001 * MM,0.01 * MM,0.1 * MM):
+                for angle in (pi,2 * pi):
+                    n = arc_segments(r,angle,tol)
+                    T(chord_error(r,angle,n) <= tol)
+                    T(chord_error(r,angle,n - 1) > tol or n == angle / (pi / 2))
+
+        # Never more than a quarter circle per segment.
+        T(arc_segments(1 * MM,2 * pi,1),4)
+        T(arc_segments(1 * MM,pi,1),2)
+
+        # Larger radii need more segments.
+        T(arc_segments(0.15 * MM,2 * pi) < arc_segments(10 * MM,2 * pi))
+
+        # The default is arc_tolerance
+        T(arc_segments(1 * MM,2 * pi),
+          arc_segments(1 * MM,2 * pi,Tuke.geometry.circle.arc_tolerance))
+        t = Tuke.geometry.circle.arc_tolerance
+        try:
+            Tuke.geometry.circle.arc_tolerance = 0.1 * MM
+            T(arc_segments(1 * MM,2 * pi),arc_segments(1 * MM,2 * pi,0.1 * MM))
+        finally:
+            Tuke.geometry.circle.arc_tolerance = t
+
+        self.assertRaises(ValueError,arc_segments,1,pi,0)
+
+    def testGeometryCircle_render_tolerance(self):
+        """Circle.render(tolerance)"""
+
+        c = Circle(dia=1 * MM,layer='foo')
+        coarse = c.render(tolerance=0.1 * MM)[0]
+        fine = c.render(tolerance=0.001 * MM)[0]
+        self.assert_(len(coarse) < len(fine))
+        self.assert_(len(coarse) == arc_segments(0.5 * MM,2 * pi,0.1 * MM) + 1)
+
+        # render_circles() groups circles by segment count.
+        circles = [Circle(dia=d * MM,layer='foo') for d in (0.3,20,0.3,1)]
+        for c,(ext,int) in zip(circles,render_circles(circles,0.01 * MM)):
+            self.assert_((ext == c.render(0.01 * MM)[0]).all())
+
     def testGeometryCircle(self):
         """geometry.Circle()"""
 
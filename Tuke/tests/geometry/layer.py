@@ -47,3 +47,74 @@ class geometryLayerTest(TestCase):
         self.assertRaises(ValueError,Layer,'...')
         self.assertRaises(ValueError,Layer,'.b.b.')
         self.assertRaises(ValueError,Layer,'.b*.b.')
+
+    def testLayerInterned(self):
+        """Layers are interned"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        a = Layer('pcb.top.copper')
+        T(Layer('pcb.top.copper') is a)
+        T(Layer(a) is a)
+        T(a == 'pcb.top.copper')
+        T(hash(a) == hash('pcb.top.copper'))
+        T(eval(repr(a)) is a)
+        T(Layer('pcb.top.silk')._id != a._id)
+
+    def testLayerMaskCompiled(self):
+        """Layer masks match layers created after they were compiled"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        m = Layer('pcb.*.drill')
+        T(Layer('pcb.top.drill') in m)
+        T(not Layer('pcb.top.copper') in m)
+        known = m._known
+
+        # Plain strings work too.
+        T('pcb.bottom.drill' in m)
+        T(not 'pcb.bottom.copper.a' in m)
+        T(m._known > known)
+
+        T(Layer('pcb.inner1.drill') in m)
+        T(m in Layer('pcb.inner1.drill'))
+        T(m in m)
+
+        self.assertRaises(ValueError,m.__contains__,'pcb..drill')
+
+    def testLayerDemux(self):
+        """LayerDemux"""
+        from Tuke.geometry import LayerDemux
+        import random
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        d = LayerDemux({'copper':'pcb.*.copper',
+                        'top':'pcb.top.*',
+                        'drill':'pcb.*.drill',
+                        'all':'*',
+                        'sch':'sch'})
+        T(d('pcb.top.copper'),('all','copper','top'))
+        T(d(Layer('pcb.bottom.copper')),('all','copper'))
+        T(d('pcb.top.drill.x'),('all','top'))
+        T(d('sch'),('all','sch'))
+        T(d('sch.net'),('all',))
+        T(d('*'),('all','copper','drill','sch','top'))
+        T(d('pcb.*'),('all','copper','drill','top'))
+        T(LayerDemux({})('pcb.top'),())
+
+        # Compare against the in operator for lots of random masks and layers
+        segs = ('a','b','c','*')
+        def rnd():
+            return '.'.join([r.choice(segs) for i in range(r.randint(1,4))])
+        r = random.Random(42)
+        for i in range(200):
+            masks = dict([('o%d' % j,rnd()) for j in range(r.randint(1,8))])
+            d = LayerDemux(masks)
+            for j in range(20):
+                l = Layer(rnd())
+                expected = tuple(sorted([n for n,m in masks.items() if l in Layer(m)]))
+                T(d(l),expected)
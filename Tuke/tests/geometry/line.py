@@ -66,6 +66,18 @@ class GeometryLineTest(TestCase):
         p = Line(a=V(-1,2),b=V(3,4),thickness=0.234,layer='foo')
         self.assert_(p.render())
 
+    def testLine_render_tolerance(self):
+        """geometry.Line.render(tolerance)"""
+        from Tuke.units import MM
+        from Tuke.geometry.circle import arc_segments
+        from math import pi
+
+        p = Line(a=V(0,0),b=V(1 * MM,0),thickness=2 * MM,layer='foo')
+        coarse = p.render(tolerance=0.1 * MM)[0]
+        fine = p.render(tolerance=0.001 * MM)[0]
+        self.assert_(len(coarse) < len(fine))
+        self.assert_(len(coarse) == 2 * (arc_segments(1 * MM,pi,0.1 * MM) + 1))
+
     def testThinLine(self):
         """geometry.ThinLine"""
         p = ThinLine(a=V(-10,2.5),b=V(34,4.3),thickness=2.2,layer='foo')
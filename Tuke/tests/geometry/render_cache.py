@@ -0,0 +1,117 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# (c) 2008 Peter Todd <pete@petertodd.org>
+#
+# This program is made available under the GNU GPL version 3.0 or
+# greater. See the accompanying file COPYING for details.
+#
+# This program is distributed WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+
+from unittest import TestCase
+
+from numpy import zeros
+
+import Tuke.geometry.circle
+from Tuke.geometry import Circle,Line,V
+from Tuke.geometry.circle import render_circles
+from Tuke.geometry.render_cache import RenderCache,render_cache
+from Tuke.units import MM
+
+class GeometryRenderCacheTest(TestCase):
+    """Perform tests of the geometry.render_cache module"""
+
+    def testRenderCache(self):
+        """RenderCache"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        overhead = RenderCache.entry_overhead
+        c = RenderCache(max_bytes=3 * (overhead + 80))
+
+        self.assertRaises(KeyError,c.get,'a')
+        T((c.hits,c.misses),(0,1))
+
+        a = zeros((5,2))
+        T(c.put('a',(a,())) == (a,()))
+        T(not a.flags.writeable)
+        T(c.get('a')[0] is a)
+        T((c.hits,c.misses),(1,1))
+        T(c.nbytes,overhead + 80)
+
+        c.put('b',zeros((5,2)))
+        c.put('c',zeros((5,2)))
+        T(len(c),3)
+
+        # Using a makes b the least recently used.
+        c.get('a')
+        c.put('d',zeros((5,2)))
+        T(('a' in c,'b' in c,'c' in c,'d' in c),(True,False,True,True))
+        T(c.evictions,1)
+        T(c.nbytes,3 * (overhead + 80))
+
+        # Replacing an entry
+        c.put('d',zeros((1,2)))
+        T(c.nbytes,2 * (overhead + 80) + overhead + 16)
+        T(c.get('d').shape,(1,2))
+
+        # Too large to cache at all
+        big = zeros((100,2))
+        T(c.put('big',big) is big)
+        T('big' in c,False)
+        T(len(c),3)
+
+        # Shrinking the cap evicts on the next put
+        c.max_bytes = overhead + 80
+        c.put('e',zeros((5,2)))
+        T(len(c),1)
+        T('e' in c)
+
+        c.clear()
+        T((len(c),c.nbytes),(0,0))
+
+    def testRenderCache_geometry(self):
+        """Circle and Line render() through render_cache"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        render_cache.clear()
+
+        # Identical geometry shares results, even in different places.
+        a = Circle(dia=1 * MM,layer='top.pad')
+        b = Circle(dia=1 * MM,layer='top.mask',id='b')
+        r = a.render()
+        T(b.render()[0] is r[0])
+        T(not r[0].flags.writeable)
+
+        T(Circle(dia=2 * MM).render()[0] is not r[0])
+
+        # Changed arguments, or tolerance, give new results.
+        b.dia = 2 * MM
+        T(b.render()[0] is not r[0])
+        T(len(b.render(tolerance=0.1 * MM)[0]) < len(b.render()[0]))
+        t = Tuke.geometry.circle.arc_tolerance
+        try:
+            Tuke.geometry.circle.arc_tolerance = 0.1 * MM
+            T(len(a.render()[0]) < len(r[0]))
+        finally:
+            Tuke.geometry.circle.arc_tolerance = t
+        T(a.render()[0] is r[0])
+
+        l1 = Line(a=V(0,0),b=V(1,1),thickness=0.1)
+        l2 = Line(a=V(0,0),b=V(1,1),thickness=0.1)
+        l3 = Line(a=V(0,0),b=V(1,2),thickness=0.1)
+        T(l1.render()[0] is l2.render()[0])
+        T(l1.render()[0] is not l3.render()[0])
+
+        # render_circles() shares results with render()
+        c = Circle(dia=3 * MM)
+        d = Circle(dia=4 * MM)
+        rendered = render_circles([a,c,d,Circle(dia=3 * MM)])
+        T(rendered[0][0] is r[0])
+        T(rendered[1][0] is rendered[3][0])
+        T(not rendered[1][0].flags.writeable)
+        T(c.render()[0] is rendered[1][0])
+        T(d.render()[0] is rendered[2][0])
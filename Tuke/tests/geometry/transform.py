@@ -35,9 +35,108 @@ class GeometrytransformTest(TestCase):
         """repr(Transformation)"""
 
         t = Transformation()
-        self.assert_((eval(repr(t)) == t).all())
+        self.assert_(eval(repr(t)) == t)
 
-        self.assert_(repr(Transformation(((1,2),))) == 'matrix([[1, 2]])')
+        # Transformations serialized when they were numpy matrixes still load.
+        t = Rotation(1) * Translation(V(1,2))
+        r = 'Tuke.geometry.transform.Transformation(((%r, %r, %r), (%r, %r, %r), (0.0, 0.0, 1.0)))' % \
+                (t.a,t.b,t.c,t.d,t.e,t.f)
+        self.assert_(repr(t) == 'Tuke.geometry.' + r[len('Tuke.geometry.transform.'):])
+        self.assert_(eval(r) == t)
+
+        self.assertRaises(ValueError,Transformation,((1,2),))
+        self.assertRaises(ValueError,Transformation,((1,0,0),(0,1,0),(1,0,1)))
+
+    def testGeometryTransformation_fast_paths(self):
+        """Transformation composition and inversion shortcuts"""
+        from numpy import allclose,asarray,dot,identity,matrix
+        from numpy.linalg import inv
+        from Tuke.geometry.transform import _IDENTITY,_TRANSLATION,_RIGID,_GENERAL
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        i = Transformation()
+        t = Translation(V(1,2))
+        r = Rotation(0.5) * Translation(V(-3,1))
+        s = Scale(V(2,3)) * r
+
+        T([x.kind for x in (i,t,r,s)],[_IDENTITY,_TRANSLATION,_RIGID,_GENERAL])
+        T(Translation(V(0,0)).kind,_IDENTITY)
+        T(Rotation(0).kind,_IDENTITY)
+        T((t * Translation(V(-1,-2))).kind,_IDENTITY)
+
+        T(i * t is t)
+        T(t * i is t)
+        T(i.I is i)
+
+        for a in (i,t,r,s):
+            T(allclose(asarray(a.I),inv(asarray(a))))
+            T(allclose(asarray(a * a.I),identity(3)))
+            for b in (i,t,r,s):
+                ab = a * b
+                T(allclose(asarray(ab),dot(asarray(a),asarray(b))))
+                T(ab.kind,max(a.kind,b.kind))
+
+            v = a(V(5,-2))
+            T(allclose(v,dot(asarray(a),(5,-2,1))[0:2]))
+
+        # Conversion to and from numpy
+        T(Transformation(asarray(s)),s)
+        T(Transformation(matrix(asarray(r))),r)
+        T(Transformation(asarray(r)).kind,_RIGID)
+        T(asarray(t).tolist(),[[1,0,1],[0,1,2],[0,0,1]])
+        T(t[0,2],1.0)
+
+        self.assertRaises(ValueError,lambda: Scale(V(0,1)).I)
+
+    def testGeometryTransformation_batch(self):
+        """Transformation applied to arrays and nested sequences"""
+        from numpy import array,ndarray
+        from Tuke.geometry import VArray
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        def same(a,b):
+            """Check nested structures a and b match in type and value"""
+            T(type(a),type(b))
+            if isinstance(a,V):
+                T(repr(a),repr(b))
+            elif isinstance(a,ndarray):
+                T(a.tolist(),b.tolist())
+            else:
+                T(len(a),len(b))
+                for x,y in zip(a,b):
+                    same(x,y)
+
+        def per_v(t,v):
+            """Apply t to every V in v individually"""
+            if isinstance(v,V):
+                return t(v)
+            elif isinstance(v,ndarray):
+                return array([t(V(x,y)).tolist()[0] for x,y in v.tolist()]).reshape(-1,2).view(type(v))
+            return type(v)([per_v(t,n) for n in v])
+
+        vs = (V(1,2),[V(3,4),(),(V(5,6),)],VArray(((1,1),(2,2))),
+              [array(((0.5,0.5),(-1,3)))],VArray())
+
+        for t in (Transformation(),Translation(V(1,2)),
+                  Rotation(1) * Translation(V(-3,1)),Scale(V(2,3))):
+            same(t(vs),per_v(t,vs))
+            same(t(array(((1,2),(3,4)))),per_v(t,array(((1,2),(3,4)))))
+            same(t([]),[])
+            same(t(()),())
+
+        def R(v):
+            self.assertRaises(TypeError,Translation(V(1,1)),v)
+            self.assertRaises(TypeError,Transformation(),v)
+        R('asdf')
+        R(None)
+        R((None,))
+        R((V(1,2),1))
+        R(array((1,2,3)))
+        R((V(1,2),array(((1,2,3),))))
 
     def testGeometryTransformationCallable(self):
         return
@@ -13,7 +13,7 @@ from __future__ import with_statement
 from unittest import TestCase
 import Tuke
 from Tuke import Element,Id
-from Tuke.geometry import Translation,translate,rotate,V 
+from Tuke.geometry import Translation,translate,rotate,V,VArray,Polygon
 
 from Tuke.context.wrapper import unwrap
 
@@ -97,3 +97,59 @@ class VTest(TestCase):
         vs = v[0:,0]
 
         self.assert_(repr(vs) == 'matrix([[ 5.]])') 
+
+    def testVArray(self):
+        """VArray class"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        a = VArray((V(1,2),V(3,4),V(5,6)))
+        T(a.shape,(3,2))
+        T(a.tolist(),[[1,2],[3,4],[5,6]])
+        T(VArray(((1,2),(3,4),(5,6))).tolist(),a.tolist())
+        T(VArray(a).tolist(),a.tolist())
+        T(VArray().shape,(0,2))
+
+        T(isinstance(a[1],V))
+        T(repr(a[1]),repr(V(3,4)))
+        T(repr(a[-1]),repr(V(5,6)))
+        T([repr(v) for v in a],[repr(V(1,2)),repr(V(3,4)),repr(V(5,6))])
+        T(a[:,0].tolist(),[1,3,5])
+
+        a2 = eval(repr(a))
+        T(isinstance(a2,VArray))
+        T(a2.tolist(),a.tolist())
+        T(repr(VArray()),'Tuke.geometry.VArray(())')
+
+    def testVArray_apply_remove_context(self):
+        """VArray._(apply|remove)_context"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        a = Element(id=Id('a'))
+        a.add(Element(id=Id('b')))
+        a.b.add(Element(id=Id('c')))
+        translate(a.b,V(0,1))
+        rotate(a.b.c,pi / 2)
+
+        c = unwrap(a.b.c)
+        c.vs = VArray(((1,0),(0,1)))
+        c.v1 = V(1,0)
+        c.v2 = V(0,1)
+
+        # Context is applied the same as it would be to each V.
+        vs = a.b.c.vs
+        T(isinstance(vs,VArray))
+        T([repr(v) for v in vs],[repr(a.b.c.v1),repr(a.b.c.v2)])
+
+        # Setting through the wrapper removes it again.
+        a.b.c.vs2 = vs
+        T(c.vs2.round(12).tolist(),[[1,0],[0,1]])
+
+        # Polygons store their rings as VArrays, even if created with V's, as
+        # serialized designs do.
+        p = Polygon(ext=(V(0,0),V(1,1),V(1,0)),int=(((0,0),(0.5,0.5),(0.5,0)),))
+        T(isinstance(p.ext,VArray))
+        T(isinstance(p.int[0],VArray))
+        T(p.render()[0].tolist(),[[0,0],[1,1],[1,0]])
+
@@ -0,0 +1,146 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# (c) 2008 Peter Todd <pete@petertodd.org>
+#
+# This program is made available under the GNU GPL version 3.0 or
+# greater. See the accompanying file COPYING for details.
+#
+# This program is distributed WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+
+import common
+
+from unittest import TestCase
+import Tuke
+from Tuke import Element,Id,Net,Netlist,Connects
+from Tuke.context.wrapper import unwrap
+
+class NetlistTest(TestCase):
+    """Perform tests of the netlist module"""
+
+    def testNetlist(self):
+        """Element.netlist()"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+        def R(ex,fn):
+            self.assertRaises(ex,fn)
+
+        a = Element(id=Id('a'))
+        T(len(a.netlist()),0)
+
+        for n in ('b','c','d','e','f'):
+            a.add(Element(id=Id(n)))
+        a.b.add(Element(id=Id('x')))
+
+        a.b.connects.add(a.c)
+        a.d.connects.add(a.c)
+        a.e.connects.add(a.b.x)
+        a.f.connects.add(Id('a/q'))
+
+        nl = a.netlist()
+        T(isinstance(nl,Netlist))
+        T(len(nl),2)
+        T(set(nl),set((Net((Id('b'),Id('c'),Id('d'))),
+                       Net((Id('b/x'),Id('e'))))))
+
+        # Net lookups by Element and by Id
+        T(nl.net_of(a.b) is nl.net_of(Id('d')))
+        T(nl.net_of('b/x'),Net((Id('b/x'),Id('e'))))
+        R(KeyError,lambda: nl.net_of(a.f))
+        R(KeyError,lambda: nl.net_of(Id('q')))
+
+        # Cached until something changes
+        T(a.netlist() is nl)
+        a.add(Element(id=Id('q')))
+        nl = a.netlist()
+        T(nl.net_of('f'),Net((Id('f'),Id('q'))))
+        T(a.netlist() is nl)
+        a.b.x.connects.add(a.b)
+        T(a.netlist() is not nl)
+        nl = a.netlist()
+        T(len(nl),2)
+        T(nl.net_of('e') is nl.net_of('c'))
+
+        # Sub-element netlists are relative to the sub-element, and ignore
+        # connections to outside of it.
+        nl = a.b.netlist()
+        T(list(nl),[Net((Id('.'),Id('x')))])
+        T(nl.net_of(Id('x')) is nl.net_of(a.b))
+
+        # Removing breaks nets.
+        b = a.remove(a.b)
+        nl = a.netlist()
+        T(set(nl),set((Net((Id('d'),Id('c'))),
+                       Net((Id('f'),Id('q'))))))
+        T(list(b.netlist()),[Net((Id('.'),Id('x')))])
+
+    def testNetlistConnectsChanges(self):
+        """Element.netlist() after changing Connects directly"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        def abc():
+            a = Element(id=Id('a'))
+            for n in ('b','c','d'):
+                a.add(Element(id=Id(n)))
+            a.b.connects.add(a.c)
+            a.c.connects.add(a.d)
+            T(list(a.netlist()),[Net((Id('b'),Id('c'),Id('d')))])
+            return a
+
+        # Deleting a connection
+        a = abc()
+        del unwrap(a.c).connects[Id('../d')]
+        T(not a.c.connects.to(a.d))
+        T(list(a.netlist()),[Net((Id('b'),Id('c')))])
+
+        a = abc()
+        unwrap(a.c).connects.pop(Id('../d'))
+        T(list(a.netlist()),[Net((Id('b'),Id('c')))])
+
+        a = abc()
+        unwrap(a.c).connects.clear()
+        T(list(a.netlist()),[Net((Id('b'),Id('c')))])
+
+        # Adding connections through the dict interface
+        a = abc()
+        T(list(a.netlist()),[Net((Id('b'),Id('c'),Id('d')))])
+        a.add(Element(id=Id('e')))
+        unwrap(a.e).connects[Id('../d')] = None
+        T(a.e.connects.to(a.d))
+        T(list(a.netlist()),[Net((Id('b'),Id('c'),Id('d'),Id('e')))])
+
+        a.add(Element(id=Id('f')))
+        a.add(Element(id=Id('g')))
+        unwrap(a.f).connects.update((Id('../g'),))
+        T(a.g.connects.to(a.f))
+        T(set(a.netlist()),set((Net((Id('b'),Id('c'),Id('d'),Id('e'))),
+                                Net((Id('f'),Id('g'))))))
+
+        a.add(Element(id=Id('h')))
+        unwrap(a.h).connects.setdefault(Id('../g'))
+        unwrap(a.h).connects.setdefault(Id('../g'))
+        T(len(unwrap(a.g).connects._implicitly_connected),2)
+        T(set(a.netlist()),set((Net((Id('b'),Id('c'),Id('d'),Id('e'))),
+                                Net((Id('f'),Id('g'),Id('h'))))))
+
+        # Replacing the Connects
+        a = abc()
+        unwrap(a.b).connects = Connects()
+        T(not a.c.connects.to(a.b))
+        T(list(a.netlist()),[Net((Id('c'),Id('d')))])
+        T(unwrap(a.b) not in unwrap(a.c)._tree.connectivity.adjacency)
+
+        # The replacement connects like any other.
+        unwrap(a.b).connects = Connects((Id('../d'),))
+        T(a.b.connects.to(a.d))
+        T(list(a.netlist()),[Net((Id('b'),Id('c'),Id('d')))])
+
+    def testNetRepr(self):
+        """repr(eval(repr(Net))) round trip"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        n = Net((Id('b'),Id('a/c')))
+        T(repr(n),"Tuke.Net([Tuke.Id('b'), Tuke.Id('a/c')])")
+        T(eval(repr(n)),n)
@@ -0,0 +1,83 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# (c) 2008 Peter Todd <pete@petertodd.org>
+#
+# This program is made available under the GNU GPL version 3.0 or
+# greater. See the accompanying file COPYING for details.
+#
+# This program is distributed WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+
+
+from unittest import TestCase
+
+from Tuke import Element,Id
+from Tuke.geometry import V,translate
+from Tuke.pcb.trace import Trace
+from Tuke.context.wrapper import unwrap
+
+class PcbTraceTraceTest(TestCase):
+    """Perform tests of the pcb.trace.Trace class"""
+
+    def testTrace_copper_follows_endpoints(self):
+        """Trace copper follows endpoints"""
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        top = Element(id=Id('top'))
+        top.add(Element(id=Id('a'))).add(Element(id=Id('p')))
+        top.add(Element(id=Id('b'))).add(Element(id=Id('p')))
+        top.add(Trace(thickness=1,id=Id('t')))
+        top.t.set_endpoints(top.a.p,top.b.p)
+
+        def ends():
+            (l,) = list(top.iterlayout())
+            return (tuple(l.a.tolist()[0]),tuple(l.b.tolist()[0]))
+
+        def world_ends():
+            ((l,t),) = list(top.iterlayout_world())
+            return (tuple(t(l.a).tolist()[0]),tuple(t(l.b).tolist()[0]))
+
+        T(ends(),((0,0),(0,0)))
+
+        # The endpoint, and an ancestor of it, moving
+        translate(top.b.p,V(5,5))
+        T(ends(),((0,0),(5,5)))
+        translate(top.a,V(1,0))
+        T(ends(),((1,0),(5,5)))
+
+        # Moving the trace itself doesn't move the endpoints.
+        translate(top.t,V(2,2))
+        T(ends(),((1,0),(5,5)))
+        T(world_ends(),((1,0),(5,5)))
+
+        # Nor does anything else.
+        top.add(Element(id=Id('c')))
+        copper = unwrap(top.t.copper)
+        changes = []
+        handles = [copper.subscribe(n,lambda: changes.append(1))
+                   for n in ('a','b','thickness','layer')]
+        translate(top.c,V(2,2))
+        T(ends(),((1,0),(5,5)))
+        T(changes,[])
+        for unsubscribe in handles:
+            unsubscribe()
+
+        # New endpoints
+        top.t.set_endpoints(top.a.p,top.c)
+        T(ends(),((1,0),(2,2)))
+
+        # The copper is moved as soon as the endpoints are, without laying
+        # anything out, and is the same sub-element throughout.
+        top.add(Element(id=Id('d'))).add(Element(id=Id('p')))
+        top.t.set_endpoints(top.a.p,top.d.p)
+        translate(top.d,V(4,4))
+        def copper_b(l):
+            return tuple(l.b.tolist()[0])
+        T(copper_b(top.t.copper),(4,4))
+        T([copper_b(l) for l in top.t],[(4,4)])
+        T(unwrap(top.t.copper) is copper)
+        T(ends(),((1,0),(4,4)))
+
+        # Still connected to the copper.
+        T(top.netlist().net_of(Id('t')),top.netlist().net_of(Id('t/copper')))
@@ -0,0 +1,117 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# (c) 2008 Peter Todd <pete@petertodd.org>
+#
+# This program is made available under the GNU GPL version 3.0 or
+# greater. See the accompanying file COPYING for details.
+#
+# This program is distributed WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+
+from unittest import TestCase
+import random
+
+from Tuke import Element
+from Tuke.context.wrapper import unwrap
+from Tuke.geometry import V,translate,rotate,centerof
+from Tuke.pcb import Pad,Pin,Point
+from Tuke.spatial import CenterIndex
+
+def pin(id):
+    return Pin(dia=1,thickness=1,clearance=1,mask=1,id=id)
+
+def names(results):
+    return [str(e.__shadowless__.id) for d,e,c in results]
+
+class SpatialCentersTest(TestCase):
+    """Perform tests of the spatial.centers module"""
+
+    def testCenterIndex(self):
+        """CenterIndex"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        e = Element(id='e')
+        e.add(Element(id='fp'))
+        e.fp.add(pin('a'))
+        e.fp.add(pin('b'))
+        e.fp.add(Pad(a=(0,0),b=(1,0),thickness=1,clearance=1,mask=1,id='c'))
+        e.add(Point(id='d'))
+        translate(e.fp.b,V(10,0))
+        translate(e.fp.c,V(0,10))
+        translate(e.fp,V(0,6))
+        translate(e.d,V(3,4))
+
+        idx = CenterIndex(e)
+        T(len(idx),4)
+
+        T(names(idx.nearest((0,0))),['d'])
+        T(idx.nearest((0,0))[0][0],5.0)
+        T((idx.nearest(V(0,0))[0][2] == V(3,4)).all())
+        T(names(idx.nearest((0,0),k=10)),['d','a','b','c'])
+        T(names(idx.nearest((0,0),k=10,types=Pin)),['a','b'])
+        T(names(idx.nearest((0,0),k=10,types=(Pad,Point))),['d','c'])
+        T(idx.nearest((0,0),k=0),[])
+
+        T(names(idx.within((0,6),5)),['a','d'])
+        T(names(idx.within((0,6),3.5)),['a'])
+        T(names(idx.within((0,6),100,types=Pin)),['a','b'])
+        T(idx.within((100,100),1),[])
+
+        # Moving footprints moves their pins.
+        translate(e.fp,V(100,100))
+        T(names(idx.within((0,0),10)),['d'])
+        c = centerof(e.fp.a)
+        T(c[0,0] > 50)
+        T(names(idx.within(c,0)),['a'])
+
+        e.fp.add(pin('z'))
+        T(names(idx.within(c,0)),['a','z'])
+        e.remove(e.fp)
+        T(names(idx.nearest((0,0),k=10)),['d'])
+        T(idx.builds,1)
+
+        # Only the given types are indexed
+        idx = CenterIndex(e,Pin)
+        T(len(idx),0)
+
+    def testCenterIndex_random(self):
+        """CenterIndex against centerof()"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        random.seed(24)
+        e = Element(id='e')
+        for i in range(20):
+            fp = Element()
+            for j in range(10):
+                p = pin('p%d' % j)
+                translate(p,V(random.uniform(-5,5),random.uniform(-5,5)))
+                fp.add(p)
+            translate(fp,V(random.uniform(0,100),random.uniform(0,100)))
+            rotate(fp,random.uniform(0,6))
+            e.add(fp)
+
+        idx = CenterIndex(e)
+        idx.rebuild_min = 8
+        for i in range(10):
+            for fp in random.sample(list(e),3):
+                translate(fp,V(random.uniform(0,100),random.uniform(0,100)))
+
+            centers = [(unwrap(p),centerof(p)) for p in e.walk(types=Pin)]
+            for j in range(5):
+                (x,y) = (random.uniform(0,100),random.uniform(0,100))
+                d = [((c[0,0] - x) ** 2 + (c[0,1] - y) ** 2) ** 0.5
+                     for p,c in centers]
+
+                got = idx.within((x,y),15)
+                T(sorted([id(p) for dist,p,c in got]),
+                  sorted([id(p) for (p,c),dist in zip(centers,d) if dist <= 15]))
+
+                got = idx.nearest((x,y),k=5)
+                for (a,p,c),b in zip(got,sorted(d)[:5]):
+                    self.assertAlmostEqual(a,b)
+        T(idx.builds,1)
+        T(idx.rebuilds > 0)
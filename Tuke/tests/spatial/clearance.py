@@ -0,0 +1,194 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# (c) 2008 Peter Todd <pete@petertodd.org>
+#
+# This program is made available under the GNU GPL version 3.0 or
+# greater. See the accompanying file COPYING for details.
+#
+# This program is distributed WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+
+
+from unittest import TestCase
+
+from random import Random
+
+from Tuke import Element,Id
+from Tuke.element import WorldLayout
+from Tuke.geometry import Circle,Hole,Polygon,Transformation,Translation,V, \
+                          translate
+from Tuke.pcb import Pin
+from Tuke.pcb.trace import Trace
+from Tuke.spatial import SpatialIndex,check_clearance
+from Tuke.spatial.clearance import layout_shape
+from Tuke.units import MM
+
+def pin(id,x,y=0):
+    """Pin at x,y mm, with a pad of radius 1mm, and clearance of 1.5mm"""
+    p = Pin(dia=1 * MM,thickness=0.5 * MM,clearance=0.5 * MM,mask=2 * MM,
+            id=Id(id))
+    translate(p,V(x * MM,y * MM))
+    return p
+
+def near(a,b):
+    return abs(a - b * MM) < 0.01 * MM
+
+def summary(violations):
+    return [(v.rule,str(v.a),str(v.b)) for v in violations]
+
+class SpatialClearanceTest(TestCase):
+    """Perform tests of the spatial.clearance module"""
+
+    def test_layout_shape(self):
+        """layout_shape()"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        t = Translation(V(10,0))
+
+        s = layout_shape(WorldLayout(Polygon(ext=((0,0),(4,0),(4,4),(0,4)),
+                                             int=(((1,1),(3,1),(3,3),(1,3)),)),
+                                     t))
+        T(s.bounds,(10.0,0.0,14.0,4.0))
+        T(s.area,12.0)
+
+        # Rendered circles are always usable by shapely.
+        s = layout_shape(WorldLayout(Circle(dia=2),t))
+        T(s.is_valid)
+        T(s.contains(s.centroid))
+        T(abs(s.centroid.x - 10) < 1e-6)
+
+        T(layout_shape(WorldLayout(Hole(dia=2),t)),None)
+        T(layout_shape(WorldLayout(Element(),t)),None)
+
+    def test_check_clearance(self):
+        """check_clearance()"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        e = Element(id='e')
+        e.add(pin('a',0))
+        e.add(pin('b',3))
+        e.add(pin('c',10))
+        idx = SpatialIndex(e)
+        T(check_clearance(e,index=idx),[])
+        T(check_clearance(e,min_clearance=0.99 * MM,index=idx),[])
+        v = check_clearance(e,min_clearance=1.01 * MM,index=idx)
+        T(summary(v),[('copper','a/pad','b/pad')])
+        T(near(v[0].distance,1))
+        T(near(v[0].location[0,0],1.5))
+        T(v[0].nets,(e.netlist().net_of('a'),e.netlist().net_of('b')))
+
+        # A trace from a to c runs right through b.
+        t = e.add(Trace(thickness=0.2 * MM,id=Id('t')))
+        t.set_endpoints(e.a,e.c)
+        v = check_clearance(e,index=idx)
+        T(summary(v),[('clearance','b/clearance','t/copper')])
+        T(v[0].layers,('top.clearance','pcb.top.copper'))
+        T(v[0].distance,0.0)
+        T(abs(v[0].location[0,0] - 3 * MM) < 1.5 * MM)
+        T(abs(v[0].location[0,1]) <= 0.1 * MM)
+        T(v[0].nets,(e.netlist().net_of('b'),e.netlist().net_of('t')))
+        T(v[0].nets[0] is not v[0].nets[1])
+        T(Id('a') in v[0].nets[1])
+
+        v = check_clearance(e,min_clearance=0,index=idx)
+        T(summary(v),[('clearance','b/clearance','t/copper'),
+                      ('copper','b/pad','t/copper')])
+        T(v[1].distance,0.0)
+
+        # Once b is on the net of the trace it's allowed to touch it.
+        e.b.connects.add(e.t)
+        T(check_clearance(e,min_clearance=0,index=idx),[])
+
+        # Moving b out of the way, the pad is 0.9 from the trace.
+        e.remove('b')
+        e.add(pin('b',3,2))
+        T(check_clearance(e,index=idx),[])
+        v = check_clearance(e,min_clearance=1 * MM,index=idx)
+        T(summary(v),[('copper','b/pad','t/copper')])
+        T(near(v[0].distance,0.9))
+        T(near(v[0].location[0,0],3))
+        T(near(v[0].location[0,1],0.55))
+
+        # Checking a sub-element, nets and ids are relative to it.
+        e.add(Element(id='board'))
+        e.board.add(pin('x',0,20))
+        e.board.add(pin('y',1,20))
+        v = check_clearance(e.board)
+        T(summary(v),[('clearance','x/clearance','y/pad'),
+                      ('clearance','y/clearance','x/pad')])
+        T(v[0].nets,(e.board.netlist().net_of('x'),
+                     e.board.netlist().net_of('y')))
+
+    def test_check_clearance_moved(self):
+        """check_clearance() with a reused index after an endpoint moves"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        e = Element(id='e')
+        e.add(pin('a',0))
+        e.add(pin('b',5,5))
+        e.add(Element(id='chip'))
+        e.chip.add(pin('c',10))
+        t = e.add(Trace(thickness=0.2 * MM,id=Id('t')))
+        t.set_endpoints(e.a,e.chip.c)
+
+        idx = SpatialIndex(e)
+        T(check_clearance(e,min_clearance=0,index=idx),[])
+
+        # Moving c drags the trace through b.
+        translate(e.chip,V(0,10 * MM))
+        v = check_clearance(e,min_clearance=0,index=idx)
+        T(summary(v),[('clearance','b/clearance','t/copper'),
+                      ('copper','b/pad','t/copper')])
+        T(summary(v),summary(check_clearance(e,min_clearance=0)))
+        T(idx.builds,1)
+
+    def test_check_clearance_random(self):
+        """check_clearance() matches checking every pair"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        rnd = Random(42)
+        e = Element(id='e')
+        for i in xrange(60):
+            e.add(pin('p%d' % i,rnd.uniform(0,40),rnd.uniform(0,40)))
+        for i in xrange(10):
+            t = e.add(Trace(thickness=0.3 * MM,id=Id('t%d' % i)))
+            t.set_endpoints(e['p%d' % rnd.randrange(60)],
+                            e['p%d' % rnd.randrange(60)])
+
+        nl = e.netlist()
+        def shapes(mask):
+            r = []
+            for l in e.iterlayout_world(mask):
+                id = Id('/'.join(l[0]._path))
+                try:
+                    net = nl.net_of(id[:1])
+                except KeyError:
+                    net = id[:1]
+                if layout_shape(l) is not None:
+                    r.append((str(id),net,layout_shape(l)))
+            return r
+        clearances = shapes('top.clearance')
+        copper = shapes('top.pad') + shapes('pcb.top.copper')
+
+        expected = set()
+        for a,na,sa in clearances:
+            for b,nb,sb in copper:
+                if na != nb and sa.intersects(sb):
+                    expected.add(('clearance',a,b))
+        for a,na,sa in copper:
+            for b,nb,sb in copper:
+                if a < b and na != nb and sa.distance(sb) < 0.5 * MM:
+                    expected.add(('copper',a,b))
+
+        got = summary(check_clearance(e,min_clearance=0.5 * MM))
+        T(len(got),len(set(got)))
+        T(set(got),expected)
+        T(len(expected) > 10)
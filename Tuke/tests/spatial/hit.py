@@ -0,0 +1,73 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# (c) 2008 Peter Todd <pete@petertodd.org>
+#
+# This program is made available under the GNU GPL version 3.0 or
+# greater. See the accompanying file COPYING for details.
+#
+# This program is distributed WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+
+from unittest import TestCase
+
+from numpy import array
+
+from Tuke import Element
+from Tuke.element import WorldLayout
+from Tuke.geometry import Circle,Hole,Polygon,Transformation,V,Translation, \
+                          Rotation,Scale
+from Tuke.spatial.hit import ring_contains,ring_distance,layout_contains
+
+class SpatialHitTest(TestCase):
+    """Perform tests of the spatial.hit module"""
+
+    def test_ring_contains(self):
+        """ring_contains() and ring_distance()"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        # An L shape, concave, with a horizontal edge level with a vertex.
+        ring = array(((0,0),(4,0),(4,1),(1,1),(1,4),(0,4)),float)
+        T(ring_contains(ring,(0.5,0.5)))
+        T(ring_contains(ring,(3,0.5)))
+        T(ring_contains(ring,(0.5,3)))
+        T(ring_contains(ring,(3,3)),False)
+        T(ring_contains(ring,(-1,0.5)),False)
+        T(ring_contains(ring,(5,1)),False)
+
+        T(ring_distance(ring,(3,3)),2.0)
+        T(ring_distance(ring,(0.5,0.5)),0.5)
+        T(ring_distance(ring,(-3,8)),5.0)
+
+    def test_layout_contains(self):
+        """layout_contains()"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        t = Translation(V(10,0))
+
+        h = WorldLayout(Hole(dia=2),t)
+        T(layout_contains(h,(10.5,0.5)))
+        T(layout_contains(h,(11.5,0)),False)
+        T(layout_contains(h,(11.5,0),0.5))
+        T(layout_contains(WorldLayout(Hole(dia=2),t * Scale(V(2,2))),(11.5,0)))
+
+        p = WorldLayout(Polygon(ext=((0,0),(10,0),(10,10),(0,10)),
+                                int=(((4,4),(6,4),(6,6),(4,6)),)),
+                        t * Rotation(1))
+        def P(x,y,tolerance=0):
+            v = p[1](V(x,y))
+            return layout_contains(p,(v[0,0],v[0,1]),tolerance)
+        T(P(1,1))
+        T(P(5,5),False)
+        T(P(5,5,1.5))
+        T(P(11,5),False)
+        T(P(11,5,1.5))
+
+        c = WorldLayout(Circle(dia=2),t)
+        T(layout_contains(c,(10,0.9)))
+        T(layout_contains(c,(10,1.1)),False)
+
+        T(layout_contains(WorldLayout(Element(),t),(10,0),100),False)
@@ -0,0 +1,231 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# (c) 2008 Peter Todd <pete@petertodd.org>
+#
+# This program is made available under the GNU GPL version 3.0 or
+# greater. See the accompanying file COPYING for details.
+#
+# This program is distributed WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+
+from unittest import TestCase
+import random
+
+import Tuke
+from Tuke import Element,Id
+from Tuke.geometry import Circle,Hole,Line,Polygon,V,translate,rotate
+from Tuke.pcb import Point
+from Tuke.pcb.trace import Trace
+from Tuke.spatial import SpatialIndex,layout_bbox
+
+from Tuke.tests.spatial.rtree import brute_distance
+from math import hypot
+
+def ids(layouts):
+    return [str(g.__shadowless__.id) for g,t in layouts]
+
+class SpatialIndexTest(TestCase):
+    """Perform tests of the spatial.index module"""
+
+    def testLayoutBBox(self):
+        """layout_bbox()"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        e = Element(id='e')
+        e.add(Hole(dia=2,id='h'))
+        e.add(Polygon(ext=((0,0),(2,0),(2,3)),id='p'))
+        e.add(Circle(dia=2,id='c'))
+        translate(e.h,V(1,1))
+        translate(e.p,V(1,1))
+
+        (h,p,c) = list(e.iterlayout_world())
+        T(layout_bbox(h),(0.0,0.0,2.0,2.0))
+        T(layout_bbox(p),(1.0,1.0,3.0,4.0))
+
+        # Circles are rendered as polygons inside the circle
+        (xmin,ymin,xmax,ymax) = layout_bbox(c)
+        T(-1 <= xmin < -0.99 and 0.99 < xmax <= 1)
+
+        T(layout_bbox((Element(id='x'),h[1])),None)
+
+    def testSpatialIndex(self):
+        """SpatialIndex queries"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        e = Element(id='e')
+        e.add(Element(id='chip'))
+        e.chip.add(Hole(dia=1,layer='top.drill',id='a'))
+        e.chip.add(Hole(dia=1,layer='bottom.drill',id='b'))
+        translate(e.chip.b,V(10,0))
+        translate(e.chip,V(0,10))
+        e.add(Line(a=V(-5,0),b=V(5,0),thickness=1,layer='top.copper',id='l'))
+
+        idx = SpatialIndex(e)
+        T(len(idx),3)
+        T(ids(idx.query_region((-1,9,1,11))),['a'])
+        T(ids(idx.query_region((-10,-10,20,20))),['a','b','l'])
+        T(ids(idx.query_region((-10,-10,20,20),'top.*')),['a','l'])
+        T(ids(idx.query_region((-10,-10,20,20),'*.drill')),['a','b'])
+        T(ids(idx.query_region((20,20,30,30))),[])
+
+        # Results are what iterlayout_world() gives.
+        (g,t) = idx.query_region((9,9,11,11))[0]
+        T(repr(t),repr(list(e.iterlayout_world('bottom.drill'))[0][1]))
+
+        T([(d,ids([l])) for d,l in idx.nearest(V(10,5),k=2)],
+          [(4.5,['b']),(hypot(4.5,4.5),['l'])])
+        T([(d,ids([l])) for d,l in idx.nearest((10,5),'*.drill')],
+          [(4.5,['b'])])
+        T(idx.nearest((10,5),'foo'),[])
+        T(idx.nearest((10,5),k=0),[])
+
+    def testSpatialIndex_incremental(self):
+        """SpatialIndex incremental updates"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        everywhere = (-1000,-1000,1000,1000)
+
+        e = Element(id='e')
+        e.add(Element(id='chip'))
+        e.chip.add(Hole(dia=1,layer='bottom.drill',id='a'))
+        e.add(Hole(dia=1,layer='bottom.drill',id='b'))
+
+        idx = SpatialIndex(e)
+        T(ids(idx.query_region((-1,-1,1,1))),['a','b'])
+        T(idx.builds,1)
+
+        # Transforms of the geometry, and of it's parents.
+        translate(e.b,V(10,0))
+        T(ids(idx.query_region((-1,-1,1,1))),['a'])
+        T(ids(idx.query_region((9,-1,11,1))),['b'])
+        translate(e.chip,V(0,10))
+        T(ids(idx.query_region((-1,-1,1,1))),[])
+        T(ids(idx.query_region((-1,9,1,11))),['a'])
+
+        # Arguments of the geometry
+        e.chip.a.dia = 30
+        T(ids(idx.query_region((-1,-1,1,1))),['a'])
+        e.chip.a.layer = Tuke.geometry.Layer('top.drill')
+        T(ids(idx.query_region(everywhere,'top.*')),['a'])
+
+        # Adding and removing
+        e.add(Element(id='chip2'))
+        e.chip2.add(Hole(dia=1,id='c'))
+        T(ids(idx.query_region((-1,-1,1,1))),['a','c'])
+        e.remove('chip')
+        T(ids(idx.query_region(everywhere)),['b','c'])
+        chip = Element(id='chip')
+        chip.add(Hole(dia=1,id='d'))
+        translate(chip,V(0,20))
+        e.chip2.add(chip)
+        T(ids(idx.query_region((-1,19,1,21))),['d'])
+
+        # Removed elements aren't tracked any more
+        e.chip2.remove('chip')
+        translate(chip,V(100,100))
+        T(ids(idx.query_region(everywhere)),['b','c'])
+
+        # None of that needed the whole index to be built again.
+        T(idx.builds,1)
+
+        # Batches
+        with e.batch():
+            translate(e.chip2,V(0,50))
+            T(ids(idx.query_region((-1,-1,1,1))),[])
+            T(ids(idx.query_region((-1,49,1,51))),['c'])
+        T(ids(idx.query_region((-1,49,1,51))),['c'])
+
+        # Indexing a sub-element, which is then moved
+        idx = SpatialIndex(e.chip2)
+        T(ids(idx.query_region((-1,-1,1,1))),['c'])
+        e2 = Element(id='e2')
+        e2.add(e.remove('chip2'))
+        T(ids(idx.query_region((-1,-1,1,1))),['c'])
+
+    def testSpatialIndex_trace(self):
+        """SpatialIndex tracks Trace endpoints"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        e = Element(id='e')
+        e.add(Point(id='p'))
+        e.add(Element(id='chip'))
+        q = Point(id='q')
+        translate(q,V(10,0))
+        e.chip.add(q)
+        t = e.add(Trace(thickness=1,id='t'))
+        t.set_endpoints(e.p,e.chip.q)
+
+        idx = SpatialIndex(e)
+        T(ids(idx.query_region((4,-1,6,1),'pcb.top.copper')),['copper'])
+        T(ids(idx.query_region((4,4,6,6),'pcb.top.copper')),[])
+
+        # Moving the element an endpoint is in moves the trace.
+        translate(e.chip,V(0,10))
+        T(ids(idx.query_region((4,4,6,6),'pcb.top.copper')),['copper'])
+        T(idx.builds,1)
+
+        # As does changing the endpoints.
+        t.set_endpoints(e.p,e.chip)
+        T(ids(idx.query_region((4,4,6,6),'pcb.top.copper')),[])
+        T(ids(idx.query_region((-1,4,1,6),'pcb.top.copper')),['copper'])
+        T(idx.builds,1)
+
+    def testSpatialIndex_random(self):
+        """SpatialIndex against brute force"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        random.seed(21)
+        e = Element(id='e')
+        layers = ('top.copper','bottom.copper','top.silk')
+        def add(n):
+            for i in range(n):
+                s = Element()
+                s.add(Circle(dia=random.uniform(0.1,2),
+                             layer=random.choice(layers),id='c'))
+                translate(s,V(random.uniform(0,100),random.uniform(0,100)))
+                rotate(s,random.uniform(0,6))
+                e.add(s)
+        add(100)
+
+        idx = SpatialIndex(e)
+        idx.rebuild_min = 8
+        for i in range(10):
+            add(5)
+            for s in random.sample(list(e),5):
+                if random.random() < 0.5:
+                    e.remove(s)
+                else:
+                    translate(s,V(random.uniform(-5,5),random.uniform(-5,5)))
+
+            layouts = list(e.iterlayout_world())
+            boxes = [layout_bbox(l) for l in layouts]
+            for j in range(5):
+                (x,y) = (random.uniform(0,100),random.uniform(0,100))
+                bbox = (x,y,x + random.uniform(0,20),y + random.uniform(0,20))
+                mask = random.choice(('*','top.*','*.copper'))
+                expected = [g for (g,t),b in zip(layouts,boxes)
+                              if g.layer in Tuke.geometry.Layer(mask) and
+                                 b[0] <= bbox[2] and b[2] >= bbox[0] and
+                                 b[1] <= bbox[3] and b[3] >= bbox[1]]
+                T(sorted([id(g) for g,t in idx.query_region(bbox,mask)]),
+                  sorted([id(g) for g in expected]))
+
+                got = idx.nearest((x,y),mask,k=5)
+                d = sorted([brute_distance(b,(x,y))
+                            for (g,t),b in zip(layouts,boxes)
+                            if g.layer in Tuke.geometry.Layer(mask)])[:5]
+                T(len(got),len(d))
+                for (a,l),b in zip(got,d):
+                    self.assertAlmostEqual(a,b)
+        T(idx.builds,1)
+        T(idx.rebuilds > 0)
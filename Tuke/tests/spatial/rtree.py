@@ -0,0 +1,84 @@
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# (c) 2008 Peter Todd <pete@petertodd.org>
+#
+# This program is made available under the GNU GPL version 3.0 or
+# greater. See the accompanying file COPYING for details.
+#
+# This program is distributed WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+# PURPOSE.
+
+from unittest import TestCase
+import random
+
+from numpy import array
+
+from Tuke.spatial import RTree
+
+def brute_query(boxes,bbox):
+    return [i for i,b in enumerate(boxes)
+              if b[0] <= bbox[2] and b[2] >= bbox[0] and
+                 b[1] <= bbox[3] and b[3] >= bbox[1]]
+
+def brute_distance(b,p):
+    dx = max(b[0] - p[0],p[0] - b[2],0)
+    dy = max(b[1] - p[1],p[1] - b[3],0)
+    return (dx ** 2 + dy ** 2) ** 0.5
+
+def random_boxes(n):
+    boxes = []
+    for i in range(n):
+        x = random.uniform(-100,100)
+        y = random.uniform(-100,100)
+        boxes.append((x,y,x + random.uniform(0,10),y + random.uniform(0,10)))
+    return boxes
+
+class SpatialRTreeTest(TestCase):
+    """Perform tests of the spatial.rtree module"""
+
+    def testRTree(self):
+        """RTree"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        self.assertRaises(ValueError,RTree,(),1)
+
+        t = RTree(())
+        T(len(t),0)
+        T(list(t.query((0,0,1,1))),[])
+        T(t.nearest((0,0)),[])
+
+        t = RTree(((0,0,1,1),(2,2,3,3)))
+        T(sorted(t.query((0,0,1,1))),[0])
+        T(sorted(t.query((1,1,2,2))),[0,1])
+        T(sorted(t.query((-1,-1,-0.5,-0.5))),[])
+        T(t.nearest((3,4)),[(1.0,1)])
+        T(t.nearest((0.5,0.5),k=5),[(0.0,0),((1.5 ** 2 + 1.5 ** 2) ** 0.5,1)])
+
+    def testRTree_random(self):
+        """RTree against brute force"""
+
+        def T(got,expected = True):
+            self.assert_(expected == got,'got: %s  expected: %s' % (got,expected))
+
+        random.seed(21)
+        for n,leaf_size in ((1,2),(17,4),(300,4),(1000,16)):
+            boxes = random_boxes(n)
+            t = RTree(boxes,leaf_size)
+            T(len(t),n)
+            for i in range(20):
+                bbox = random_boxes(1)[0]
+                bbox = (bbox[0],bbox[1],bbox[2] * 3,bbox[3] * 3)
+                T(sorted(t.query(bbox)),brute_query(boxes,bbox))
+
+                p = (random.uniform(-120,120),random.uniform(-120,120))
+                got = t.nearest(p,k=10)
+                expected = sorted([brute_distance(b,p) for b in boxes])[:10]
+                T(len(got),len(expected))
+                for (d,i),e in zip(got,expected):
+                    self.assertAlmostEqual(d,e)
+                    self.assertAlmostEqual(brute_distance(boxes[i],p),e)
+
+            # Every box is found by all the others
+            T(sorted([i for d,i in t.iternearest((0,0))]),range(n))
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# vim: tabstop=4 expandtab shiftwidth=4 fileencoding=utf8
+# ### BOILERPLATE ###
+# Tuke - Electrical Design Automation toolset
+# Copyright (C) 2008 Peter Todd <pete@petertodd.org>
+# 
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# ### BOILERPLATE ###
+
+"""Module to make life easier for Tuke benchmarks"""
+
+# hook in-tree tuke into python path if running benchmark
+import sys
+import os.path
+my_dir     = os.path.dirname(os.path.abspath(__file__)) # doc/benchmarks/
+tuke_top   = os.path.split(os.path.split(my_dir)[0])[0] # ../../
+tuke_dir   = os.path.join(tuke_top, 'Tuke')             # ../../Tuke/
+if os.path.isdir(tuke_dir):
+    sys.path.insert(0, tuke_top)
+
+# The LedGrid example is a handy source of realistic designs.
+examples_dir = os.path.join(tuke_top, 'examples')
+if os.path.isdir(examples_dir):
+    sys.path.insert(0, examples_dir)
+
+import timeit
+
+def time(code,setup,n=1,repeat=1):
+    """Time code, printing the result in the same style as doc/experiments
+
+    With repeat the timing is done repeat times, and the median is printed and
+    returned, which is much less sensitive to a noisy machine.
+    """
+    t = timeit.Timer(code, setup)
+
+    if repeat == 1:
+        r = t.timeit(n)
+        print "'%s' took %fs" % (code,r)
+    else:
+        rs = sorted(t.repeat(repeat,n))
+        r = rs[len(rs) // 2]
+        print "'%s' took %fs, median of %d runs (min %fs, max %fs)" % \
+                (code,r,repeat,rs[0],rs[-1])
+    return r